@@ -0,0 +1,99 @@
+"""
+Benchmark reading the rename date tag. Compares the header-only fast path in
+photo_rename.fastread with a full pyexiv2 read on a generated corpus.
+
+    python benchmarks/bench_fastread.py --count 500 --size 4000000
+    python benchmarks/bench_fastread.py --format tiff --size 80000000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir))
+
+import pyexiv2
+import photo_rename
+from photo_rename import fastread
+from tests.stubs import make_jpeg, make_png, make_tiff
+
+
+FORMATS = {
+    'jpeg': ('jpg', photo_rename.IMAGE_TYPE_JPEG),
+    'png': ('png', photo_rename.IMAGE_TYPE_PNG),
+    'tiff': ('tif', photo_rename.IMAGE_TYPE_TIFF),
+}
+
+
+def make_corpus(directory, count, size, fmt):
+    """
+    Write count JPEG, PNG or TIFF files of roughly size bytes with dates.
+    """
+    filenames = []
+    for i in range(count):
+        tiff = make_tiff(
+            {0x0132: '2014:08:16 06:{:02d}:{:02d}'.format(
+                i // 60 % 60, i % 60),
+                0x010f: 'Camera Maker'},
+            {0x9003: '2014:08:16 06:20:30', 0x9291: '{:03d}'.format(i % 1000)})
+        filename = os.path.join(
+            directory, 'img{:05d}.{}'.format(i, FORMATS[fmt][0]))
+        with open(filename, 'wb') as f:
+            if fmt == 'jpeg':
+                f.write(make_jpeg(tiff, scan_size=size))
+            elif fmt == 'png':
+                f.write(make_png('2014-08-16T06:20:30', idat_size=size))
+            else:
+                f.write(tiff)
+                f.truncate(len(tiff) + size)
+        filenames.append(filename)
+    return filenames
+
+
+def read_fast(filenames):
+    for filename in filenames:
+        image_type = photo_rename.EXTENSION_TO_IMAGE_TYPE[
+            os.path.splitext(filename)[1][1:]]
+        fastread.read_metadata(filename, image_type)
+
+
+def read_pyexiv2(filenames):
+    for filename in filenames:
+        img_md = pyexiv2.ImageMetadata(filename)
+        img_md.read()
+        dict((key, img_md[key].raw_value)
+            for key in img_md.exif_keys + img_md.xmp_keys)
+
+
+def timed(func, filenames):
+    start = time.perf_counter()
+    func(filenames)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--size", type=int, default=4000000,
+        help="Bytes of fake image data per file.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default='jpeg')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_fastread_")
+    try:
+        filenames = make_corpus(directory, args.count, args.size, args.format)
+        print("{} {} files of {} bytes".format(
+            args.count, args.format, args.size))
+        print("{:>10} {:>10.3f} s".format(
+            "fastread", timed(read_fast, filenames)))
+        print("{:>10} {:>10.3f} s".format(
+            "pyexiv2", timed(read_pyexiv2, filenames)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark FileList insertion. Compares the original linear scan insert with
+the key-indexed add() and the bulk extend().
+
+    python benchmarks/bench_filemaplist.py
+    python benchmarks/bench_filemaplist.py --sizes 1000 10000 --legacy-max 1000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir))
+
+from photo_rename.filemaplist import FileList
+
+
+def legacy_add(lst, add):
+    """
+    The original OrderedListMixin.add() linear scan, kept here for comparison.
+    """
+    index = 0
+    for cmp in lst:
+        madd = re.match(r"^\d{8}_\d{6}", add)
+        mcmp = re.match(r"^\d{8}_\d{6}", cmp)
+        if (madd and mcmp) and (madd.group(0) == mcmp.group(0)):
+            if (not re.search(r"-\d+\.", add) and
+                    re.search(r"-\d+\.", cmp)):
+                lst.insert(index, add)
+                return
+            if (re.search(r"-\d+\.", add) and re.search(r"-\d+\.", cmp)):
+                if add < cmp:
+                    lst.insert(index, add)
+                    return
+        else:
+            if add < cmp:
+                lst.insert(index, add)
+                return
+        index += 1
+    lst.append(add)
+
+
+def make_names(n, seed=0):
+    """
+    Generate n plausible filenames. Mostly dated names with bursts of
+    sequence numbers plus some camera names.
+    """
+    rnd = random.Random(seed)
+    names = []
+    for i in range(n):
+        r = rnd.random()
+        second = rnd.randrange(max(n // 4, 1))
+        base = "2014{:04d}_{:06d}".format(101 + second // 86400 % 1200,
+            second % 86400)
+        if r < 0.6:
+            names.append("{}.jpg".format(base))
+        elif r < 0.85:
+            names.append("{}-{}.jpg".format(base, rnd.randrange(1, 12)))
+        else:
+            names.append("IMG_{:05d}.JPG".format(rnd.randrange(100000)))
+    return names
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+",
+        default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--legacy-max", type=int, default=10000,
+        help="Skip the quadratic legacy insert above this size.")
+    parser.add_argument("--add-max", type=int, default=100000,
+        help="Skip one-at-a-time add() above this size.")
+    args = parser.parse_args()
+
+    print("{:>9} {:>12} {:>12} {:>12}".format(
+        "n", "legacy (s)", "add (s)", "extend (s)"))
+    for n in args.sizes:
+        names = make_names(n)
+
+        def run_add():
+            files = FileList()
+            for name in names:
+                files.add(name)
+            return list(files.get())
+
+        def run_extend():
+            files = FileList()
+            files.extend(names)
+            return list(files.get())
+
+        t_extend, expected = timed(run_extend)
+        if n <= args.add_max:
+            t_add, result = timed(run_add)
+            assert result == expected
+            add = "{:12.3f}".format(t_add)
+        else:
+            add = "{:>12}".format("skipped")
+        if n <= args.legacy_max:
+            def run_legacy():
+                lst = []
+                for name in names:
+                    legacy_add(lst, name)
+                return lst
+            t_legacy, result = timed(run_legacy)
+            assert result == expected
+            legacy = "{:12.3f}".format(t_legacy)
+        else:
+            legacy = "{:>12}".format("skipped")
+        print("{:>9} {} {} {:12.3f}".format(n, legacy, add, t_extend))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark Filemap.move(). Compares the exists() + rename() + stat() + chmod()
+sequence done by full path with renameat2(RENAME_NOREPLACE) and chmod
+relative to a pinned directory descriptor. File system calls are counted by
+wrapping the os functions that issue them.
+
+    python benchmarks/bench_move.py --count 10000
+"""
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir))
+
+import photo_rename
+from photo_rename import Filemap, FilemapList, Harvester, fsops
+
+
+# os functions that map to one system call each. os.path.exists() calls
+# os.stat() so it is counted there.
+COUNTED = ['stat', 'lstat', 'rename', 'chmod', 'open', 'close']
+
+
+class Counter(object):
+    """
+    Count calls and how many of them resolve a full path.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.full_paths = 0
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def counted(*args, **kwargs):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if (args and isinstance(args[0], str) and os.sep in args[0]
+                    and kwargs.get('dir_fd') is None):
+                self.full_paths += 1
+            return func(*args, **kwargs)
+        return counted
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+
+def make_filemaps(directory, count):
+    """
+    Write count executable files and return a FilemapList renaming each.
+    """
+    filemaps = FilemapList()
+    built = []
+    for i in range(count):
+        filename = os.path.join(directory, 'img{:06d}.jpg'.format(i))
+        with open(filename, 'wb') as f:
+            f.write(b'x')
+        os.chmod(filename, 0o755)
+        built.append(Filemap(filename, photo_rename.IMAGE_TYPE_JPEG,
+            dst_fn='new{:06d}.jpg'.format(i), read_metadata=False))
+    filemaps.extend(built)
+    return filemaps
+
+
+def run(directory, count, pinned):
+    filemaps = make_filemaps(directory, count)
+    harvester = Harvester(directory)
+    counter = Counter()
+    patches = [mock.patch.object(os, name, counter.wrap(name,
+        getattr(os, name))) for name in COUNTED]
+    if fsops._renameat2 is not None:
+        patches.append(mock.patch.object(fsops, '_renameat2',
+            counter.wrap('renameat2', fsops._renameat2)))
+    for patch in patches:
+        patch.start()
+    start = time.perf_counter()
+    try:
+        if pinned:
+            harvester.process_file_map(filemaps, simon_sez=True)
+        else:
+            for fm in filemaps.get():
+                fm.move()
+    finally:
+        elapsed = time.perf_counter() - start
+        for patch in patches:
+            patch.stop()
+    return elapsed, counter
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10000)
+    args = parser.parse_args()
+
+    if fsops._renameat2 is None:
+        print("renameat2 not available. Pinned run falls back to rename().")
+
+    print("{:>8} {:>10} {:>12} {:>12}  {}".format(
+        "mode", "seconds", "calls/file", "paths/file", "calls"))
+    for label, pinned in [("path", False), ("pinned", True)]:
+        directory = tempfile.mkdtemp(prefix='bench_move_')
+        try:
+            elapsed, counter = run(directory, args.count, pinned)
+        finally:
+            shutil.rmtree(directory)
+        print("{:>8} {:>10.3f} {:>12.2f} {:>12.2f}  {}".format(
+            label, elapsed, counter.total / args.count,
+            counter.full_paths / args.count,
+            ", ".join("{}={}".format(name, n)
+                for name, n in sorted(counter.calls.items()))))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 from .utils import logged_class
 from .filemap import Filemap
-from .filemaplist import FileList, FilemapList
+from .filemaplist import FileList, FilemapList, FilemapStream
 from .filemetadata import FileMetadata
 from .harvester import Harvester
 
@@ -28,4 +28,11 @@ EXTENSIONS = [
 EXTENSION_TO_IMAGE_TYPE = dict([
     (ext, it) for it, sublist in [(k, v) for k, v in IMAGE_TYPES.items()]
     for ext in sublist])
-MAX_RENAME_ATTEMPTS = 10
+
+# How pz_rename names files taken in the same second. sequence appends -N in
+# the order they were taken, millis appends _mmm from SubSecTimeOriginal and
+# hash appends a digest of the file content.
+NAMING_SEQUENCE = 'sequence'
+NAMING_MILLIS = 'millis'
+NAMING_HASH = 'hash'
+NAMING_SCHEMES = [NAMING_SEQUENCE, NAMING_MILLIS, NAMING_HASH]
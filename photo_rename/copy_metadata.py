@@ -5,16 +5,53 @@ import stat
 import sys
 import pyexiv2
 import photo_rename
-from photo_rename import FileMetadata, Harvester
+from photo_rename import FileMetadata, Harvester, metadatacache
+import photo_rename.sidecar
+from photo_rename.executor import (
+        TaskResult, log_summary, run_batches, run_tasks)
 from photo_rename.utils import CustomArgumentParser
 
 
 logger = logging.getLogger(__name__)
 
 
-def process_all_files(src_directory, dst_directory, simon_sez=None):
+def copy_metadata_task(task):
     """
-    Manage the entire process of gathering data and renaming files.
+    Copy metadata for one pair of files. Runs in a worker process when --jobs
+    is given. Returns a TaskResult.
+    """
+    src_fn_fq, dst_fn_fq, simon_sez, splice, sidecar = task
+    src_fn = os.path.basename(src_fn_fq)
+    dst_fn = os.path.basename(dst_fn_fq)
+    ok = True
+    try:
+        src_fmd = FileMetadata(src_fn_fq)
+        if simon_sez:
+            logger.info(
+                    "Copying metadata from {} ==> {}".format(src_fn, dst_fn))
+            if sidecar:
+                ok = src_fmd.copy_metadata_sidecar(dst_fn_fq) is not False
+            else:
+                ok = src_fmd.copy_metadata(
+                        dst_fn_fq, splice=splice) is not False
+        else:
+            logger.info(
+                    "DRY RUN: Copying metadata from {} ==> {}".format(
+                        src_fn, dst_fn))
+    except Exception as e:
+        logger.error("{}: {}".format(src_fn, e))
+        return TaskResult(dst_fn, False, str(e))
+    return TaskResult(dst_fn, ok, None if ok else "Write failed.")
+
+
+def process_all_files(src_directory, dst_directory, simon_sez=None,
+        jobs=None, splice=False, sidecar=False):
+    """
+    Manage the entire process of gathering data and renaming files. Files are
+    written by jobs processes if given. With splice JPEG files keep their
+    image data and only get new metadata segments. With sidecar XMP sidecars
+    are written in batches instead of the files. Returns a TaskResult per
+    file.
     """
     error = False
 
@@ -37,21 +74,19 @@ def process_all_files(src_directory, dst_directory, simon_sez=None):
     harvester = Harvester(src_directory, metadata_dst_directory=dst_directory)
     filemaps = harvester["filemaps"]
 
-    count = 0
-    for fm in filemaps.get():
-        count += 1
-        src_fmd = FileMetadata(os.path.join(src_directory, fm.src_fn))
-        if simon_sez:
-            logger.info(
-                    "Copying metadata from {} ==> {}".format(
-                        fm.src_fn, fm.dst_fn))
-            src_fmd.copy_metadata(os.path.join(dst_directory, fm.dst_fn))
-        else:
-            logger.info(
-                    "DRY RUN: Copying metadata from {} ==> {}".format(
-                        fm.src_fn, fm.dst_fn))
-    if count == 0:
+    tasks = [(os.path.join(src_directory, fm.src_fn),
+        os.path.join(dst_directory, fm.dst_fn), simon_sez, splice, sidecar)
+        for fm in filemaps.get()]
+    if len(tasks) == 0:
         logger.warn("No matching files found. Check src and dst.")
+        return []
+    if sidecar:
+        tasks = photo_rename.sidecar.one_per_sidecar(
+                tasks, lambda task: task[1])
+        return log_summary(run_batches(copy_metadata_task, tasks,
+            photo_rename.sidecar.batch, jobs=jobs))
+    return log_summary(run_tasks(copy_metadata_task, tasks, jobs=jobs))
+
 
 def main():
     """
@@ -64,6 +99,18 @@ def main():
             help="Copy metadata from files in this directory.")
     parser.add_argument("-d", "--dst-directory",
             help="Copy metadata to matching files in this directory.")
+    parser.add_argument("-j", "--jobs", type=int,
+            help="Write files using this many processes.")
+    parser.add_argument("--splice", action="store_true",
+            help="Write new metadata in front of the untouched image data"
+            " of JPEG files.")
+    parser.add_argument("--sidecar", action="store_true",
+            help="Write XMP sidecar files instead of changing the images.")
+    parser.add_argument("--no-cache", action="store_true",
+            help="Do not use the persistent metadata cache.")
+    parser.add_argument("--cache-path",
+            help="Metadata cache file. Default {}.".format(
+                metadatacache.default_cache_path()))
     parser.add_argument("-v", "--verbose", help="Log level to DEBUG.",
             action="store_true")
     args = parser.parse_args()
@@ -104,12 +151,27 @@ def main():
                 args.dst_directory))
         error = True
 
+    if args.jobs is not None and args.jobs < 1:
+        logger.error("--jobs must be at least 1.")
+        error = True
+
+    if args.sidecar and args.splice:
+        logger.error("--sidecar cannot be used with --splice.")
+        error = True
+
     if error:
         logger.error("Exiting due to errors.")
         parser.usage_message()
         sys.exit(1)
     else:
-        process_all_files(src_directory, dst_directory, simon_sez=args.simon_sez)
+        if not args.no_cache:
+            metadatacache.open_cache(args.cache_path)
+        try:
+            process_all_files(src_directory, dst_directory,
+                    simon_sez=args.simon_sez, jobs=args.jobs,
+                    splice=args.splice, sidecar=args.sidecar)
+        finally:
+            metadatacache.close_cache()
 
 
 if __name__ == '__main__':  # pragma: no cover
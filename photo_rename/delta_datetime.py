@@ -8,15 +8,68 @@ import sys
 import pyexiv2
 import photo_rename
 from photo_rename import Filemap, FilemapList, FileMetadata, Harvester
+from photo_rename import metadatacache
+import photo_rename.sidecar
+from photo_rename.executor import (
+        TaskResult, log_summary, run_batches, run_tasks)
 from photo_rename.utils import CustomArgumentParser
 
 
 logger = logging.getLogger(__name__)
 
+# Tags original_datetime() reads. Includes those set_datetime() checks.
+ORIGINAL_DATETIME_TAGS = (
+    'Xmp.xmp.CreateDate',
+    'Exif.Image.DateTime',
+    'Exif.Photo.DateTimeOriginal',
+)
 
-def process_all_files(workdir, delta, simon_sez=None):
+
+def delta_datetime_task(task):
+    """
+    Shift the datetime of one file. Runs in a worker process when --jobs is
+    given. Returns a TaskResult.
+    """
+    fn_fq, delta, simon_sez, in_place, sidecar = task
+    fn = os.path.basename(fn_fq)
+    ok = True
+    try:
+        fmd = FileMetadata(fn_fq, tags=ORIGINAL_DATETIME_TAGS)
+        if sidecar:
+            # Dates already shifted into the sidecar win over the image.
+            fmd.metadata = dict(fmd['metadata'],
+                    **photo_rename.sidecar.read_datetimes(fn_fq))
+
+        original_dt = original_datetime(fmd)
+
+        # Compute delta. Add to start_datetime.
+        new_dt = original_dt + timedelta(0, delta)
+
+        # Set the date and time
+        msg = "Set datetime: {} : {}".format(
+                fn, new_dt.strftime('%Y:%m:%d %H:%M:%S'))
+        if simon_sez and sidecar:
+            ok = fmd.set_datetime_sidecar(new_dt) is not False
+        elif simon_sez:
+            ok = fmd.set_datetime(
+                    new_dt, in_place=in_place) is not False
+        else:
+            msg = "DRY RUN: {}".format(msg)
+        logger.info(msg)
+    except Exception as e:
+        logger.error("{}: {}".format(fn, e))
+        return TaskResult(fn, False, str(e))
+    return TaskResult(fn, ok, None if ok else "Write failed.")
+
+
+def process_all_files(workdir, delta, simon_sez=None, jobs=None,
+        recursive=False, in_place=False, sidecar=False):
     """
-    Manage the entire process of gathering data and renaming files.
+    Manage the entire process of gathering data and renaming files. Files are
+    written by jobs processes if given. With recursive every directory below
+    workdir is included. With in_place EXIF tags are patched in the files
+    where possible. With sidecar XMP sidecars are written in batches instead
+    of the files. Returns a TaskResult per file.
     """
     error = False
 
@@ -35,27 +88,18 @@ def process_all_files(workdir, delta, simon_sez=None):
         logger.warn("Exiting due to errors.")
         sys.exit(1)
     else:
-        harvester = Harvester(workdir)
-        files = harvester["files"]
-
-        fmds = []
-        for fn in files:
-            fmd = FileMetadata(os.path.join(workdir, fn))
-            fmds.append(fmd)
-
-            original_dt = original_datetime(fmd)
+        harvester = Harvester(workdir, workers=jobs, recursive=recursive)
 
-            # Compute delta. Add to start_datetime.
-            new_dt = original_dt + timedelta(0, delta)
-
-            # Set the date and time
-            msg = "Set datetime: {} : {}".format(
-                    fn, new_dt.strftime('%Y:%m:%d %H:%M:%S'))
-            if simon_sez:
-                fmd.set_datetime(new_dt)
-            else:
-                msg = "DRY RUN: {}".format(msg)
-            logger.info(msg)
+        tasks = [(os.path.join(directory, fn), delta, simon_sez, in_place,
+            sidecar)
+            for directory, files in harvester["directory_files"]
+            for fn in files]
+        if sidecar:
+            tasks = photo_rename.sidecar.one_per_sidecar(
+                    tasks, lambda task: task[0])
+            return log_summary(run_batches(delta_datetime_task, tasks,
+                photo_rename.sidecar.batch, jobs=jobs))
+        return log_summary(run_tasks(delta_datetime_task, tasks, jobs=jobs))
 
 
 def original_datetime(fmd):
@@ -95,8 +139,22 @@ def main():
             help="Really, Simon sez copy the data!", action="store_true")
     parser.add_argument("-d", "--directory",
             help="Set EXIF/XMP DateTime delta on files in this directory.")
+    parser.add_argument("-r", "--recursive", action="store_true",
+            help="Also include every directory below.")
     parser.add_argument("-i", "--delta",
             help="Delta in seconds (+/-) to increment datetime.")
+    parser.add_argument("-j", "--jobs", type=int,
+            help="Write files using this many processes.")
+    parser.add_argument("--in-place", action="store_true",
+            help="Patch EXIF datetimes in the file instead of rewriting it"
+            " where possible.")
+    parser.add_argument("--sidecar", action="store_true",
+            help="Write XMP sidecar files instead of changing the images.")
+    parser.add_argument("--no-cache", action="store_true",
+            help="Do not use the persistent metadata cache.")
+    parser.add_argument("--cache-path",
+            help="Metadata cache file. Default {}.".format(
+                metadatacache.default_cache_path()))
     parser.add_argument("-v", "--verbose", help="Log level to DEBUG.",
             action="store_true")
     args = parser.parse_args()
@@ -121,13 +179,27 @@ def main():
     else:
         delta = int(args.delta)
 
+    if args.jobs is not None and args.jobs < 1:
+        logger.error("--jobs must be at least 1.")
+        error = True
+
+    if args.sidecar and args.in_place:
+        logger.error("--sidecar cannot be used with --in-place.")
+        error = True
+
     if error:
         logger.error("Exiting due to errors.")
         parser.usage_message()
         sys.exit(1)
     else:
-        process_all_files(
-                workdir, delta, simon_sez=args.simon_sez)
+        if not args.no_cache:
+            metadatacache.open_cache(args.cache_path)
+        try:
+            process_all_files(workdir, delta, simon_sez=args.simon_sez,
+                    jobs=args.jobs, recursive=args.recursive,
+                    in_place=args.in_place, sidecar=args.sidecar)
+        finally:
+            metadatacache.close_cache()
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -0,0 +1,121 @@
+"""
+Process pool shared by the commands that rewrite image files.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import logging
+from photo_rename import metadatacache
+
+
+logger = logging.getLogger(__name__)
+
+# Tasks handed to one worker call by run_batches().
+BATCH_SIZE = 256
+
+# Outcome of processing one file.
+TaskResult = namedtuple("TaskResult", ["filename", "ok", "error"])
+
+
+class RecordListHandler(logging.Handler):
+    """
+    Collect log records in a list so a worker process can hand them back to
+    the parent. Records are flattened so they pickle.
+    """
+
+    def __init__(self):
+        super(RecordListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        self.records.append(record)
+
+
+def _run_captured(func, level, task):
+    """
+    Run func(task) in a worker process with all logging captured. Returns the
+    result, the captured records and the metadata cache counters.
+    """
+    root = logging.getLogger()
+    handlers = root.handlers
+    root_level = root.level
+    handler = RecordListHandler()
+    root.handlers = [handler]
+    root.setLevel(level)
+    try:
+        result = func(task)
+    finally:
+        root.handlers = handlers
+        root.setLevel(root_level)
+    cache = metadatacache.get_cache()
+    counters = cache.take_counters() if cache is not None else None
+    return result, handler.records, counters
+
+
+def run_tasks(func, tasks, jobs=None, chunksize=None):
+    """
+    Apply func to every task and return the results in task order. When jobs
+    is greater than one the tasks are sent to a pool of that many processes
+    in chunks. Log records emitted by the workers are replayed in the parent
+    in task order so the output reads the same as a serial run.
+
+    func must be a module level function and tasks must pickle.
+    """
+    tasks = list(tasks)
+    if not jobs or jobs < 2 or len(tasks) < 2:
+        return [func(task) for task in tasks]
+
+    if chunksize is None:
+        # A few chunks per worker evens out files of different sizes.
+        chunksize = max(1, len(tasks) // (jobs * 4))
+
+    call = functools.partial(
+            _run_captured, func, logging.getLogger().getEffectiveLevel())
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for result, records, counters in executor.map(
+                call, tasks, chunksize=chunksize):
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            if counters is not None:
+                metadatacache.get_cache().add_counters(counters)
+            results.append(result)
+    return results
+
+
+def _run_batch(func, context, batch):
+    """
+    Apply func to every task of batch inside context().
+    """
+    with context():
+        return [func(task) for task in batch]
+
+
+def run_batches(func, tasks, context, jobs=None, batch_size=BATCH_SIZE):
+    """
+    Like run_tasks() but tasks are handed out batch_size at a time and each
+    batch runs inside context(), so whatever context() sets up is shared by
+    the whole batch. context must be a module level function.
+    """
+    tasks = list(tasks)
+    batches = [tasks[i:i + batch_size]
+        for i in range(0, len(tasks), batch_size)]
+    call = functools.partial(_run_batch, func, context)
+    return [result for results in run_tasks(call, batches, jobs=jobs,
+        chunksize=1) for result in results]
+
+
+def log_summary(results):
+    """
+    Log how many files succeeded and which failed. Return the results.
+    """
+    failed = [result for result in results if not result.ok]
+    logger.info("{} files processed, {} succeeded, {} failed.".format(
+        len(results), len(results) - len(failed), len(failed)))
+    for result in failed:
+        logger.error("Failed: {}: {}".format(result.filename, result.error))
+    return results
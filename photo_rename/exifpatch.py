@@ -0,0 +1,104 @@
+"""
+Patch EXIF date tags in place. EXIF datetimes are fixed width ASCII so a new
+value overwrites the old one byte for byte and the rest of the file is left
+alone. Anything unexpected raises PatchError so the caller can fall back to
+pyexiv2, which rewrites the whole file.
+"""
+import logging
+import mmap
+import os
+import photo_rename
+from photo_rename import fastread
+from photo_rename.fastread import FastReadError
+
+
+logger = logging.getLogger(__name__)
+
+# 'YYYY:MM:DD HH:MM:SS' and the terminating NUL.
+DATETIME_LENGTH = 20
+
+
+class PatchError(Exception):
+    """
+    The file cannot be patched in place.
+    """
+
+
+def encode_datetime(new_datetime):
+    """
+    Return the EXIF bytes for new_datetime.
+
+    >>> from datetime import datetime
+    >>> encode_datetime(datetime(2014, 8, 16, 6, 20, 30))
+    b'2014:08:16 06:20:30\\x00'
+    """
+    return new_datetime.strftime('%Y:%m:%d %H:%M:%S').encode('ascii') + b'\x00'
+
+
+def locate_datetimes(buf, keys, offset=0):
+    """
+    Return key to file offset of the value of each of keys in the TIFF
+    structure buf, which starts at file offset offset. Every key must be
+    present once as an ASCII value of DATETIME_LENGTH bytes.
+    """
+    try:
+        entries = fastread.tiff_entries(buf)
+    except FastReadError as e:
+        raise PatchError(e)
+    offsets = {}
+    for key, count, start in entries:
+        if key not in keys:
+            continue
+        if key in offsets:
+            raise PatchError("{} found more than once.".format(key))
+        if count != DATETIME_LENGTH:
+            raise PatchError("{} is {} bytes, not {}.".format(
+                key, count, DATETIME_LENGTH))
+        if start + count > len(buf):
+            raise PatchError("{} runs past end of data.".format(key))
+        offsets[key] = offset + start
+    missing = [key for key in keys if key not in offsets]
+    if missing:
+        raise PatchError("Not found: {}.".format(", ".join(missing)))
+    return offsets
+
+
+def find_datetimes(f, image_type, keys):
+    """
+    Return key to file offset of the value of each of keys in open file f.
+    JPEG files are searched in the EXIF APP1 segment. TIFF-based files are
+    memory mapped.
+    """
+    if image_type == photo_rename.IMAGE_TYPE_JPEG:
+        try:
+            offset, length = fastread.find_jpeg_exif(f)
+        except FastReadError as e:
+            raise PatchError(e)
+        return locate_datetimes(f.read(length), keys, offset)
+    if image_type in (photo_rename.IMAGE_TYPE_TIFF,
+            photo_rename.IMAGE_TYPE_ARW):
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return locate_datetimes(mm, keys)
+    raise PatchError("No in-place patching for this file type.")
+
+
+def patch_datetime(filename, image_type, new_datetime, keys):
+    """
+    Overwrite the values of the EXIF date tags keys of filename with
+    new_datetime. Nothing is written unless every key can be patched. The
+    patched offsets are read back afterwards. Raises PatchError if the file
+    cannot be patched or the read back differs.
+    """
+    value = encode_datetime(new_datetime)
+    with open(filename, 'r+b') as f:
+        offsets = find_datetimes(f, image_type, keys)
+        fd = f.fileno()
+        for key, offset in offsets.items():
+            logger.debug("Patching {} of {} at offset {}.".format(
+                key, filename, offset))
+            if os.pwrite(fd, value, offset) != len(value):
+                raise PatchError("Short write of {}.".format(key))
+        for key, offset in offsets.items():
+            if os.pread(fd, len(value), offset) != value:
+                raise PatchError("Verification of {} failed.".format(key))
+    return offsets
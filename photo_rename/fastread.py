@@ -0,0 +1,300 @@
+"""
+Read the few metadata tags needed for renaming straight from the file
+headers. Only a small part of each file is read. Anything unexpected raises
+FastReadError so the caller can fall back to pyexiv2.
+"""
+import logging
+import mmap
+import re
+import struct
+import zlib
+import photo_rename
+
+
+logger = logging.getLogger(__name__)
+
+# TIFF field types we care about.
+TIFF_TYPE_ASCII = 2
+TIFF_TYPE_LONG = 4
+
+# Pointer from IFD0 to the Exif sub-IFD.
+TAG_EXIF_IFD_POINTER = 0x8769
+
+# Tag number to pyexiv2 key. IFD0 tags are "Image", Exif sub-IFD "Photo".
+IFD0_TAGS = {
+    0x0132: 'Exif.Image.DateTime',
+}
+EXIF_IFD_TAGS = {
+    0x9003: 'Exif.Photo.DateTimeOriginal',
+    0x9004: 'Exif.Photo.DateTimeDigitized',
+    0x9290: 'Exif.Photo.SubSecTime',
+    0x9291: 'Exif.Photo.SubSecTimeOriginal',
+    0x9292: 'Exif.Photo.SubSecTimeDigitized',
+}
+
+# JPEG markers.
+JPEG_SOI = b'\xff\xd8'
+JPEG_APP1 = 0xE1
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+EXIF_HEADER = b'Exif\x00\x00'
+
+# Stop looking for APP1 after this many bytes of other segments.
+JPEG_MAX_SCAN = 256 * 1024
+
+# PNG chunks.
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_ITXT = b'iTXt'
+PNG_IEND = b'IEND'
+XMP_KEYWORD = b'XML:com.adobe.xmp\x00'
+
+# xmp:CreateDate as an attribute or as an element.
+XMP_CREATE_DATE_REGEX = re.compile(
+    br'xmp:CreateDate(?:="([^"]*)"|>([^<]*)<)')
+
+
+class FastReadError(Exception):
+    """
+    The file could not be handled by the fast readers.
+    """
+
+
+def parse_tiff(buf, base=0):
+    """
+    Walk IFD0 and the Exif sub-IFD of the TIFF structure starting at offset
+    base of buf. buf may be bytes, a memoryview or an mmap. Returns a dict of
+    the tags in IFD0_TAGS and EXIF_IFD_TAGS that are present.
+    """
+    metadata = {}
+    try:
+        for key, count, start in tiff_entries(buf, base):
+            if start + count > len(buf):
+                raise FastReadError("Tag value runs past end of data.")
+            value = bytes(buf[start:start + count])
+            metadata[key] = value.rstrip(b'\x00').decode('ascii')
+    except ValueError as e:
+        raise FastReadError("Malformed TIFF structure: {}".format(e))
+    return metadata
+
+
+def tiff_entries(buf, base=0):
+    """
+    Return (key, count, start) of every ASCII tag in IFD0_TAGS and
+    EXIF_IFD_TAGS found in the TIFF structure starting at offset base of
+    buf. start is the offset of the value in buf.
+    """
+    try:
+        order = bytes(buf[base:base + 2])
+        if order == b'II':
+            endian = '<'
+        elif order == b'MM':
+            endian = '>'
+        else:
+            raise FastReadError("Not a TIFF header.")
+        magic, ifd0 = struct.unpack_from(endian + 'HI', buf, base + 2)
+        if magic != 42:
+            raise FastReadError("Bad TIFF magic {}.".format(magic))
+
+        entries = []
+        exif_ifd = _read_ifd(buf, base, endian, ifd0, IFD0_TAGS, entries)
+        if exif_ifd:
+            _read_ifd(buf, base, endian, exif_ifd, EXIF_IFD_TAGS, entries)
+        return entries
+    except (struct.error, IndexError, ValueError) as e:
+        raise FastReadError("Malformed TIFF structure: {}".format(e))
+
+
+def _read_ifd(buf, base, endian, offset, tags, entries):
+    """
+    Append (key, count, start) of the wanted ASCII tags of one IFD to
+    entries. Returns the Exif sub-IFD offset if the IFD has one.
+    """
+    exif_ifd = None
+    count, = struct.unpack_from(endian + 'H', buf, base + offset)
+    entry = base + offset + 2
+    if entry + count * 12 > len(buf):
+        raise FastReadError("IFD runs past end of data.")
+    for _ in range(count):
+        tag, field_type, value_count = struct.unpack_from(
+                endian + 'HHI', buf, entry)
+        if tag == TAG_EXIF_IFD_POINTER and field_type == TIFF_TYPE_LONG:
+            exif_ifd, = struct.unpack_from(endian + 'I', buf, entry + 8)
+        elif tag in tags and field_type == TIFF_TYPE_ASCII:
+            if value_count <= 4:
+                start = entry + 8
+            else:
+                start = base + struct.unpack_from(
+                        endian + 'I', buf, entry + 8)[0]
+            entries.append((tags[tag], value_count, start))
+        entry += 12
+    return exif_ifd
+
+
+def find_jpeg_exif(f):
+    """
+    Scan the segment headers of JPEG file object f from its start for the
+    EXIF APP1 segment. Returns the file offset and length of the TIFF
+    structure in it and leaves f positioned at that offset.
+    """
+    try:
+        if f.read(2) != JPEG_SOI:
+            raise FastReadError("Not a JPEG file.")
+        scanned = 2
+        while scanned < JPEG_MAX_SCAN:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise FastReadError("Bad JPEG marker.")
+            code = marker[1]
+            # Fill bytes and markers without a length.
+            if code == 0xFF:
+                f.seek(-1, 1)
+                continue
+            if code == 0x01 or 0xD0 <= code <= 0xD7:
+                continue
+            if code in (JPEG_SOS, JPEG_EOI):
+                break
+            length, = struct.unpack('>H', f.read(2))
+            if length < 2:
+                raise FastReadError("Bad JPEG segment length.")
+            if code == JPEG_APP1:
+                header = f.read(min(len(EXIF_HEADER), length - 2))
+                if header == EXIF_HEADER:
+                    return f.tell(), length - 2 - len(EXIF_HEADER)
+                f.seek(length - 2 - len(header), 1)
+            else:
+                f.seek(length - 2, 1)
+            scanned += length + 2
+    except (IOError, OSError, struct.error) as e:
+        raise FastReadError(e)
+    raise FastReadError("No EXIF APP1 segment found.")
+
+
+def read_jpeg_metadata(filename):
+    """
+    Read date tags from the EXIF APP1 segment of a JPEG file. Only the
+    segment headers before the image data and the APP1 segment itself are
+    read.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            _, length = find_jpeg_exif(f)
+            data = f.read(length)
+    except (IOError, OSError) as e:
+        raise FastReadError(e)
+    return parse_tiff(memoryview(data))
+
+
+def read_tiff_metadata(filename):
+    """
+    Read date tags from a TIFF-based file such as TIFF or ARW. The file is
+    memory mapped and only the pages holding the IFDs and tag values are
+    touched. Both byte orders are handled.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return parse_tiff(mm)
+    except (IOError, OSError, ValueError) as e:
+        raise FastReadError(e)
+
+
+def read_png_metadata(filename):
+    """
+    Read Xmp.xmp.CreateDate from the XMP iTXt chunk of a PNG file. Chunks
+    other than iTXt, including all IDAT chunks, are skipped by seeking past
+    them. Reading stops at the XMP chunk.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            if f.read(8) != PNG_SIGNATURE:
+                raise FastReadError("Not a PNG file.")
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    break
+                length, chunk_type = struct.unpack('>I4s', header)
+                if chunk_type == PNG_IEND:
+                    break
+                if chunk_type != PNG_ITXT or length < len(XMP_KEYWORD):
+                    f.seek(length + 4, 1)
+                    continue
+                keyword = f.read(len(XMP_KEYWORD))
+                if keyword != XMP_KEYWORD:
+                    f.seek(length - len(keyword) + 4, 1)
+                    continue
+                data = f.read(length - len(keyword))
+                return _parse_xmp_itxt(data)
+    except (IOError, OSError, struct.error) as e:
+        raise FastReadError(e)
+    raise FastReadError("No XMP iTXt chunk found.")
+
+
+def _parse_xmp_itxt(data):
+    """
+    Extract CreateDate from the rest of an XMP iTXt chunk after its keyword.
+    """
+    try:
+        compressed = data[0] == 1
+        # Skip compression flag and method, language tag and translated
+        # keyword.
+        text_start = data.index(b'\x00', data.index(b'\x00', 2) + 1) + 1
+        packet = data[text_start:]
+        if compressed:
+            packet = zlib.decompress(packet)
+    except (IndexError, ValueError, zlib.error) as e:
+        raise FastReadError("Malformed iTXt chunk: {}".format(e))
+    match = XMP_CREATE_DATE_REGEX.search(packet)
+    if not match:
+        return {}
+    value = match.group(1) if match.group(1) is not None else match.group(2)
+    return {'Xmp.xmp.CreateDate': value.decode('utf-8', 'replace').strip()}
+
+
+def readers():
+    """
+    Return image type to (reader, tag that must be present). Built on call
+    since the image types are defined after this module is imported.
+    """
+    return {
+        photo_rename.IMAGE_TYPE_ARW: (
+            read_tiff_metadata, 'Exif.Image.DateTime'),
+        photo_rename.IMAGE_TYPE_JPEG: (
+            read_jpeg_metadata, 'Exif.Image.DateTime'),
+        photo_rename.IMAGE_TYPE_PNG: (
+            read_png_metadata, 'Xmp.xmp.CreateDate'),
+        photo_rename.IMAGE_TYPE_TIFF: (
+            read_tiff_metadata, 'Exif.Image.DateTime'),
+    }
+
+
+def readable_tags(image_type):
+    """
+    Return the set of tags the fast reader for image_type can return.
+
+    >>> sorted(readable_tags(photo_rename.IMAGE_TYPE_PNG))
+    ['Xmp.xmp.CreateDate']
+    """
+    if image_type not in readers():
+        return set()
+    if image_type == photo_rename.IMAGE_TYPE_PNG:
+        return {'Xmp.xmp.CreateDate'}
+    return set(IFD0_TAGS.values()) | set(EXIF_IFD_TAGS.values())
+
+
+def read_metadata(filename, image_type):
+    """
+    Fast path for Filemap.read_metadata(). Returns a dict with the tag used
+    to build the new filename, or None if the file should be read with
+    pyexiv2 instead.
+    """
+    if image_type not in readers():
+        return None
+    reader, key = readers()[image_type]
+    try:
+        metadata = reader(filename)
+    except FastReadError as e:
+        logger.debug("Fast read failed for {}: {}".format(filename, e))
+        return None
+    if key not in metadata:
+        return None
+    return metadata
@@ -1,4 +1,5 @@
 import argparse
+import hashlib
 import logging
 import os
 import re
@@ -6,10 +7,17 @@ import stat
 import sys
 import pyexiv2
 import photo_rename
+from photo_rename import fastread, fsops, metadatacache
 
 
 logger = logging.getLogger(__name__)
 
+# Bytes at the start of a file the NAMING_HASH digest covers.
+CONTENT_DIGEST_PREFIX = 64 * 1024
+
+# Bytes of digest in a NAMING_HASH name. Six hex digits.
+CONTENT_DIGEST_SIZE = 3
+
 
 @photo_rename.logged_class
 class Filemap(object):
@@ -19,9 +27,15 @@ class Filemap(object):
     """
 
     def __init__(self, src_fn, image_type, metadata=None, dst_fn=None,
-            read_metadata=True):
+            read_metadata=True, tags=None, stat_result=None, naming=None):
         """
-        Initialize Filemap instance.
+        Initialize Filemap instance. tags are the metadata keys to read and
+        keep. Defaults to the tags build_dst_fn() needs. stat_result is the
+        os.stat_result or os.DirEntry of src_fn captured when the file was
+        found. A DirEntry is stat'ed here, before the metadata is read. The
+        result keys the metadata cache and is checked against the file right
+        before the move. naming is one of photo_rename.NAMING_SCHEMES
+        and defaults to NAMING_SEQUENCE.
 
         >>> filemap = Filemap('abc123.jpeg', photo_rename.IMAGE_TYPE_JPEG, None, {})
         >>> filemap.src_fn
@@ -31,12 +45,26 @@ class Filemap(object):
         >>>
         """
         self.logger.debug("Old filename: {}".format(src_fn))
-        self.MAX_RENAME_ATTEMPTS = photo_rename.MAX_RENAME_ATTEMPTS
+        if naming is None:
+            naming = photo_rename.NAMING_SEQUENCE
+        self.naming = naming
+        self.digests = {}
         self.src_fn_fq = src_fn
         self.workdir = os.path.dirname(src_fn)
         self.src_fn = os.path.basename(src_fn)
         self.image_type = image_type
         self.metadata = metadata
+        if hasattr(stat_result, 'stat'):
+            try:
+                stat_result = stat_result.stat()
+            except OSError as e:
+                self.logger.debug("Unable to stat {}: {}".format(
+                    self.src_fn, e))
+                stat_result = None
+        self.stat_result = stat_result
+        if tags is None:
+            tags = self.dst_fn_tags()
+        self.tags = tags
 
         self.src_fn_base = os.path.splitext(self.src_fn)[0]
         self.src_fn_base_lower = os.path.splitext(self.src_fn)[0].lower()
@@ -51,7 +79,7 @@ class Filemap(object):
 
         # Read EXIF or XMP metadata from old filename
         if metadata is None and read_metadata:
-            self.metadata = self.read_metadata()
+            self.metadata = self.read_metadata(self.tags)
         else:
             self.metadata = metadata
 
@@ -73,10 +101,39 @@ class Filemap(object):
         self.dst_fn_fq = dst_fn_fq
         self.dst_fn = os.path.basename(dst_fn_fq)
 
-    def read_metadata(self):
+    @property
+    def src_stat(self):
+        """
+        os.stat_result of src_fn captured when the Filemap was built or None.
+        """
+        return self.stat_result
+
+    def read_metadata(self, tags=None):
         """
-        Read EXIF or XMP data from file. Convert to Python dict.
+        Read EXIF or XMP data from file through the metadata cache if one is
+        open. Only the keys in tags are decoded. Every key is read if tags
+        is None.
         """
+        if tags is None:
+            kind = "filemap:{}".format(self.image_type)
+        else:
+            tags = sorted(set(tags))
+            kind = "filemap:{}:{}".format(self.image_type, ",".join(tags))
+        return metadatacache.cached(self.src_fn_fq, kind,
+                lambda: self._read_metadata(tags), self.stat_result)
+
+    def _read_metadata(self, tags=None):
+        """
+        Read EXIF or XMP data from file. Convert to Python dict. Try reading
+        just the date tags from the file header first.
+        """
+        if (tags is not None and
+                set(tags) <= fastread.readable_tags(self.image_type)):
+            metadata = fastread.read_metadata(self.src_fn_fq, self.image_type)
+            if metadata:
+                return dict(
+                    (key, metadata[key]) for key in tags if key in metadata)
+
         # Xmp.xmp.CreateDate
         # XXX: We already know file exists 'cuz we found it.
         img_md = pyexiv2.ImageMetadata("{}".format(self.src_fn_fq))
@@ -89,43 +146,125 @@ class Filemap(object):
         else:
             metadata_keys = [md_key for md_key in img_md.exif_keys]
 
+        if (len(metadata_keys) == 0):
+            raise Exception("{0} has no EXIF data.".format(self.src_fn))
+
+        # Listing keys is cheap. Decoding values is not, so only decode the
+        # ones asked for.
+        if tags is not None:
+            available = set(metadata_keys)
+            metadata_keys = [key for key in tags if key in available]
+
         for exifkey in metadata_keys:
             tag = img_md[exifkey].raw_value
             #self.logger.debug(exifkey)
             #self.logger.debug("{}: {}".format(exifkey, tag))
             metadata[exifkey] = tag
 
-        if (len(metadata) == 0):
-            raise Exception("{0} has no EXIF data.".format(self.src_fn))
-
         return metadata
 
-    def build_dst_fn(self):
+    def dst_fn_tags(self):
         """
-        Generate dst filename from src_fn EXIF or XMP data if possible. Even if
-        not possible, lowercase src_fn and normalize file extension.
+        Return the tags build_dst_fn() uses.
 
-        >>> filemap = Filemap('abc123.jpeg', photo_rename.IMAGE_TYPE_JPEG, metadata={'Exif.Image.DateTime': '2014:08:16 06:20:30'})
-        >>> filemap.dst_fn
-        '20140816_062030.jpg'
+        >>> Filemap('abc.png', photo_rename.IMAGE_TYPE_PNG, metadata={}).dst_fn_tags()
+        ('Xmp.xmp.CreateDate',)
+        """
+        if (self.image_type == photo_rename.IMAGE_TYPE_PNG):
+            return ('Xmp.xmp.CreateDate',)
+        return ('Exif.Image.DateTime', 'Exif.Photo.SubSecTimeOriginal')
 
+    def dst_fn_datetime(self):
         """
+        Return the EXIF DateTime or XMP CreateDate build_dst_fn() names the
+        file after, or None if it is missing or not a datetime.
 
-        # Start with EXIF DateTime
+        >>> Filemap('abc.jpg', photo_rename.IMAGE_TYPE_JPEG, metadata={'Exif.Image.DateTime': '2014:08:16'}).dst_fn_datetime()
+        >>>
+        """
         try:
             if (self.image_type == photo_rename.IMAGE_TYPE_PNG):
-                dst_fn = self.metadata['Xmp.xmp.CreateDate']
+                value = self.metadata['Xmp.xmp.CreateDate']
             else:
-                dst_fn = self.metadata['Exif.Image.DateTime']
+                value = self.metadata['Exif.Image.DateTime']
         except KeyError:
-            dst_fn = None
+            return None
 
         # If this pattern does not strictly match then keep original name.
         # YYYY:MM:DD HH:MM:SS (EXIF) or YYYY-MM-DDTHH:MM:SS (XMP)
-        if (dst_fn and not
-                re.match(r'^\d{4}\W\d\d\W\d\d.\d\d\W\d\d\W\d\d$', dst_fn)):
-            # Setup for next step.
-            dst_fn = None
+        if (value and not
+                re.match(r'^\d{4}\W\d\d\W\d\d.\d\d\W\d\d\W\d\d$', value)):
+            return None
+        return value
+
+    def sub_second(self):
+        """
+        Return Exif.Photo.SubSecTimeOriginal as nine digits that sort like
+        the fraction of a second they stand for, or None if it is missing or
+        not a number.
+
+        >>> Filemap('abc.jpg', photo_rename.IMAGE_TYPE_JPEG, metadata={'Exif.Photo.SubSecTimeOriginal': '5 '}).sub_second()
+        '500000000'
+        """
+        value = (self.metadata or {}).get('Exif.Photo.SubSecTimeOriginal')
+        if not value:
+            return None
+        value = value.strip()
+        if not re.match(r'^[0-9]+$', value):
+            return None
+        return value[:9].ljust(9, '0')
+
+    def content_digest(self, full=False):
+        """
+        Return the hex digest NAMING_HASH names src_fn by. It covers the
+        file size and the first CONTENT_DIGEST_PREFIX bytes, or the whole
+        file if full. Only the file itself is read, so every file gets its
+        name without looking at any other.
+        """
+        if full not in self.digests:
+            digest = hashlib.blake2b(digest_size=CONTENT_DIGEST_SIZE)
+            with open(self.src_fn_fq, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                digest.update("{}\0".format(size).encode('ascii'))
+                if full:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+                else:
+                    digest.update(f.read(CONTENT_DIGEST_PREFIX))
+            self.digests[full] = digest.hexdigest()
+        return self.digests[full]
+
+    def dst_fn_suffix(self, full_digest=False):
+        """
+        Return what naming appends to a name built from a datetime: _mmm
+        for NAMING_MILLIS if SubSecTimeOriginal is known, -digest for
+        NAMING_HASH and nothing for NAMING_SEQUENCE.
+        """
+        if self.naming == photo_rename.NAMING_MILLIS:
+            sub_second = self.sub_second()
+            if sub_second:
+                return "_{}".format(sub_second[:3])
+        elif self.naming == photo_rename.NAMING_HASH:
+            return "-{}".format(self.content_digest(full_digest))
+        return ''
+
+    def build_dst_fn(self, full_digest=False):
+        """
+        Generate dst filename from src_fn EXIF or XMP data if possible. Even if
+        not possible, lowercase src_fn and normalize file extension. With
+        full_digest a NAMING_HASH name covers the whole file.
+
+        >>> filemap = Filemap('abc123.jpeg', photo_rename.IMAGE_TYPE_JPEG, metadata={'Exif.Image.DateTime': '2014:08:16 06:20:30'})
+        >>> filemap.dst_fn
+        '20140816_062030.jpg'
+        >>> Filemap('abc123.jpeg', photo_rename.IMAGE_TYPE_JPEG, metadata={'Exif.Image.DateTime': '2014:08:16 06:20:30', 'Exif.Photo.SubSecTimeOriginal': '25'}, naming=photo_rename.NAMING_MILLIS).dst_fn
+        '20140816_062030_250.jpg'
+
+        """
+
+        # Start with EXIF DateTime
+        dst_fn = self.dst_fn_datetime()
+        suffix = ''
 
         # Don't assume exif tag exists. If it does not, keep original filename.
         # Lowercase extension.
@@ -133,6 +272,10 @@ class Filemap(object):
             dst_fn = "{base}.{ext}".format(
                     base=self.src_fn_base, ext=self.src_fn_ext_lower)
         else:
+            # Milliseconds or a content digest tell apart files of one
+            # second without a sequence number.
+            if dst_fn:
+                suffix = self.dst_fn_suffix(full_digest)
             dst_fn = "{0}.{1}".format(
                 dst_fn, photo_rename.EXTENSIONS_PREFERRED[self.image_type])
 
@@ -147,41 +290,75 @@ class Filemap(object):
         dst_fn = re.sub(r' ', r'_', dst_fn)
         dst_fn = re.sub(r'T', r'_', dst_fn)
 
+        # Added last so the clean up above leaves the suffix alone.
+        if suffix:
+            dst_fn_base, dst_fn_ext = os.path.splitext(dst_fn)
+            dst_fn = "{0}{1}{2}".format(dst_fn_base, suffix, dst_fn_ext)
+
         return dst_fn
 
-    def _chmod(self):
+    def _chmod(self, dir_fd=None, st=None):
         """
-        Removes execute bit from file permission for USR, GRP, and OTH.
+        Removes execute bit from file permission for USR, GRP, and OTH. With
+        dir_fd the file is looked up relative to that directory. st is a
+        current stat of the file, which rename does not change. The file is
+        only stat'ed if st is None and chmod is only called if the mode
+        changes.
         """
-        st = os.stat(self.dst_fn_fq)
+        if st is None and dir_fd is None:
+            st = os.stat(self.dst_fn_fq)
+        elif st is None:
+            st = os.stat(self.dst_fn, dir_fd=dir_fd)
+        mode = st.st_mode & ~(stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        if mode == st.st_mode:
+            return
         self.logger.info(
                 "Removing execute permissions on {0}.".format(self.dst_fn))
-        mode = st.st_mode
-        if bool(st.st_mode & stat.S_IXUSR):
-            mode = mode ^ stat.S_IXUSR
-            os.chmod(self.dst_fn_fq, mode)
-        if bool(st.st_mode & stat.S_IXGRP):
-            mode = mode ^ stat.S_IXGRP
-            os.chmod(self.dst_fn_fq, mode)
-        if bool(st.st_mode & stat.S_IXOTH):
-            mode = mode ^ stat.S_IXOTH
+        if dir_fd is None:
             os.chmod(self.dst_fn_fq, mode)
+        else:
+            os.chmod(self.dst_fn, mode, dir_fd=dir_fd)
 
     def move(self):
         """
         Move src_fn to dst_fn.
+
+        While Harvester.process_file_map() runs, the move is one atomic
+        renameat2(RENAME_NOREPLACE) relative to the pinned work directory
+        where the platform has it. Otherwise the destination is checked for
+        and then renamed. Returns True if the file was moved.
         """
         if self.src_fn == self.dst_fn:
             self.logger.debug("Not moving {} ==> {}. No change.".format(
                 self.src_fn, self.dst_fn))
-            return
+            return False
+
+        dir_fd = None
+        if os.path.dirname(self.dst_fn_fq) == self.workdir:
+            dir_fd = fsops.pinned_dir_fd(self.workdir)
+
+        try:
+            st = self.revalidate(dir_fd)
+        except OSError as e:
+            self.logger.warn("Unable to rename file: {0}".format(e.strerror))
+            return False
+        if st is False:
+            self.logger.warn(
+                "{0} changed since it was read. Doing nothing.".format(
+                self.src_fn))
+            return False
+
+        if dir_fd is not None:
+            moved = self._move_at(dir_fd, st)
+            if moved is not None:
+                return moved
 
         if os.path.exists(self.dst_fn_fq):
             self.collision_detected = True
             self.logger.warn(
                 "{0} => {1} Destination collision. Doing nothing.".format(
                 self.src_fn, self.dst_fn))
-            return
+            return False
 
         try:
             # XXX: Unit tests did not catch this bug.
@@ -190,7 +367,57 @@ class Filemap(object):
                 self.logger.info("Moving file: {0} ==> {1}".format(
                     self.src_fn, self.dst_fn))
                 os.rename(self.src_fn_fq, self.dst_fn_fq)
-            self._chmod()
         except OSError as e:
             self.logger.warn("Unable to rename file: {0}".format(e.strerror))
+            return False
+        try:
+            self._chmod(st=st)
+        except OSError as e:
+            self.logger.warn("Unable to chmod file: {0}".format(e.strerror))
+        return True
+
+    def revalidate(self, dir_fd=None):
+        """
+        Stat src_fn once more right before the move and compare it with the
+        stat captured at discovery. Returns the new stat, False if the file
+        was replaced or modified since, or None if nothing was captured.
+        """
+        if self.stat_result is None:
+            return None
+        old = self.src_stat
+        if dir_fd is None:
+            st = os.stat(self.src_fn_fq)
+        else:
+            st = os.stat(self.src_fn, dir_fd=dir_fd)
+        if old is not None and (
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns) !=
+                (old.st_dev, old.st_ino, old.st_size, old.st_mtime_ns)):
+            return False
+        return st
+
+    def _move_at(self, dir_fd, st=None):
+        """
+        Move with renameat2 relative to dir_fd. Returns True if the file was
+        moved, False if not, or None if that is not supported so move() falls
+        back. st is passed on to _chmod().
+        """
+        try:
+            if not fsops.rename_noreplace(self.src_fn, self.dst_fn, dir_fd):
+                return None
+        except FileExistsError:
+            self.collision_detected = True
+            self.logger.warn(
+                "{0} => {1} Destination collision. Doing nothing.".format(
+                self.src_fn, self.dst_fn))
+            return False
+        except OSError as e:
+            self.logger.warn("Unable to rename file: {0}".format(e.strerror))
+            return False
 
+        self.logger.info("Moving file: {0} ==> {1}".format(
+            self.src_fn, self.dst_fn))
+        try:
+            self._chmod(dir_fd, st)
+        except OSError as e:
+            self.logger.warn("Unable to chmod file: {0}".format(e.strerror))
+        return True
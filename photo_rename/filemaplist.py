@@ -1,60 +1,95 @@
+import bisect
 import re
 import photo_rename
 
 
+DATED_FN_REGEX = re.compile(r"^\d{8}_\d{6}")
+SEQ_FN_REGEX = re.compile(r"-\d+\.")
+
+
 class OrderedListMixin(object):
     """
     Mixin implementing the logic for FileList and FilemapList.
+
+    Entries are kept in a Python list with a parallel list of sort keys. The
+    key for each entry is computed once when it is added so neither add() nor
+    extend() need to run any regex against entries already in the list.
     """
 
     def __init__(self):
         self.list = []
+        self.keys = []
 
-    def add(self, obj):
-        index = 0
-        inserted = False
+    @staticmethod
+    def sort_key(obj):
+        """
+        Return sort key for a filename or an object with a dst_fn attribute.
+
+        Filenames of the form YYYYmmDD_HHMMSS* sort by that prefix first. For
+        the same prefix a name without a sequence number comes before any
+        with one, so we get the ordering:
+
+            file.jpg, file-1.jpg, file-2.jpg
 
+        Everything else compares normally. A dated name can never share its
+        first 15 characters with an undated name so mixing both shapes of key
+        in one list is safe.
+
+        >>> OrderedListMixin.sort_key('20140816_062030-1.jpg')
+        ('20140816_062030', 1, '20140816_062030-1.jpg')
+        >>> OrderedListMixin.sort_key('abc.jpg')
+        ('abc.jpg',)
+        """
         if type(obj) is str:
-            add = obj
+            fn = obj
         else:
-            add = obj.dst_fn
-
-        for elem in self.get():
-            if type(elem) is str:
-                cmp = elem
-            else:
-                cmp = elem.dst_fn
-
-            # Since file.jpg > file-1.jpg True and file-1.jpg < file-2.jpg
-            # we must compare because we want ordering :
-            #   file.jpg, file-1.jpg, file-2.jpg
-
-            # Compare add of the form YYYYmmDD_HHMMSS*
-            madd = re.match(r"^\d{8}_\d{6}", add)
-            mcmp = re.match(r"^\d{8}_\d{6}", cmp)
-            if (madd and mcmp) and (madd.group(0) == mcmp.group(0)):
-                if (not re.search(r"-\d+\.", add) and
-                        re.search(r"-\d+\.", cmp)):
-                    #if add > cmp:
-                    self.list.insert(index, obj)
-                    inserted = True
-                    break
-                if (re.search(r"-\d+\.", add) and re.search(r"-\d+\.", cmp)):
-                    if add < cmp:
-                        self.list.insert(index, obj)
-                        inserted = True
-                        break
-            else:
-                # Everything else compares normally.
-                if add < cmp:
-                    self.list.insert(index, obj)
-                    inserted = True
-                    break
-            index += 1
-
-        # Reached end of list with no insert. Append to list instead.
-        if not inserted:
+            fn = obj.dst_fn
+
+        m = DATED_FN_REGEX.match(fn)
+        if not m:
+            return (fn,)
+        if SEQ_FN_REGEX.search(fn):
+            return (m.group(0), 1, fn)
+        # Names without a sequence number keep insertion order among
+        # themselves so they all get the same key.
+        return (m.group(0), 0, "")
+
+    def add(self, obj):
+        """
+        Insert obj in order. Equal keys keep insertion order.
+        """
+        # Nothing to compare against yet. The key is computed later if a
+        # second entry arrives.
+        if not self.list:
             self.list.append(obj)
+            self.keys.append(None)
+            return
+        if self.keys[0] is None:
+            self.keys[0] = self.sort_key(self.list[0])
+        key = self.sort_key(obj)
+        index = bisect.bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.list.insert(index, obj)
+
+    def extend(self, objs):
+        """
+        Bulk insert. Append everything and sort once at the end. Since the
+        sort is stable this gives exactly the same ordering as calling add()
+        for each object in turn.
+        """
+        objs = list(objs)
+        if not objs:
+            return
+        if not self.list and len(objs) == 1:
+            self.add(objs[0])
+            return
+        if self.keys and self.keys[0] is None:
+            self.keys[0] = self.sort_key(self.list[0])
+        entries = list(zip(self.keys, self.list))
+        entries.extend((self.sort_key(obj), obj) for obj in objs)
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [entry[0] for entry in entries]
+        self.list = [entry[1] for entry in entries]
 
     def get(self):
         """
@@ -76,3 +111,21 @@ class FilemapList(OrderedListMixin):
     """
     Ordered list of filemap instances.
     """
+
+
+@photo_rename.logged_class
+class FilemapStream(object):
+    """
+    Filemaps produced one at a time, e.g. by Harvester.stream_filemaps().
+    Has the same get() as FilemapList so process_file_map() takes either.
+    Can only be iterated once.
+    """
+
+    def __init__(self, filemaps):
+        self.filemaps = filemaps
+
+    def get(self):
+        """
+        Return an iterator over the filemaps.
+        """
+        return iter(self.filemaps)
@@ -7,10 +7,17 @@ import stat
 import sys
 import pyexiv2
 import photo_rename
+from photo_rename import exifpatch, jpegsplice, metadatacache, sidecar
+from photo_rename.exifpatch import PatchError
+from photo_rename.jpegsplice import SpliceError
+from photo_rename.sidecar import SidecarError
 
 
 logger = logging.getLogger(__name__)
 
+# Tags set_datetime() checks before writing.
+SET_DATETIME_TAGS = ('Xmp.xmp.CreateDate', 'Exif.Photo.DateTimeOriginal')
+
 
 @photo_rename.logged_class
 class FileMetadata(object):
@@ -18,11 +25,26 @@ class FileMetadata(object):
     Contains logic to perform metadata operations on file.
     """
 
-    def __init__(self, file):
+    def __init__(self, file, tags=None):
+        """
+        tags are the metadata keys to read and keep. Every key is read if
+        tags is None.
+        """
         self.file = file
+        self.tags = tags
         self.metadata = None
-        self.img_md = pyexiv2.ImageMetadata("{}".format(file))
-        self.img_md.read()
+        self._img_md = None
+
+    @property
+    def img_md(self):
+        """
+        pyexiv2 ImageMetadata for the file. Read on first use so a cached
+        read_metadata() does not have to parse the file.
+        """
+        if self._img_md is None:
+            self._img_md = pyexiv2.ImageMetadata("{}".format(self.file))
+            self._img_md.read()
+        return self._img_md
 
     def __getitem__(self, key):
         """
@@ -37,23 +59,45 @@ class FileMetadata(object):
 
     def read_metadata(self):
         """
-        Read EXIF or XMP data from file. Convert to Python dict.
+        Read EXIF or XMP data from file through the metadata cache if one is
+        open.
+        """
+        if self.tags is None:
+            kind = "filemetadata"
+        else:
+            kind = "filemetadata:{}".format(",".join(sorted(set(self.tags))))
+        return metadatacache.cached(self.file, kind, self._read_metadata)
+
+    def _read_metadata(self):
+        """
+        Read EXIF or XMP data from file. Convert to Python dict. Only the
+        values of keys in self.tags are decoded.
         """
         metadata = {}
 
         xmp_keys = [md_key for md_key in self.img_md.xmp_keys]
         exif_keys = [md_key for md_key in self.img_md.exif_keys]
 
-        for key in xmp_keys + exif_keys:
+        keys = xmp_keys + exif_keys
+        if self.tags is not None:
+            available = set(keys)
+            keys = [key for key in self.tags if key in available]
+
+        for key in keys:
             tag = self.img_md[key].raw_value
             metadata[key] = tag
 
         return metadata
 
-    def set_datetime(self, new_datetime):
+    def set_datetime(self, new_datetime, in_place=False):
         """
-        Update EXIF/XMP tags as needed and write metadata.
+        Update EXIF/XMP tags as needed and write metadata. With in_place the
+        EXIF tags are patched in the file where possible instead of having
+        pyexiv2 rewrite it. Returns False if the write failed.
         """
+        if in_place and self.patch_datetime(new_datetime):
+            return True
+
         # TODO: Timezone?
         xmp_datetime = new_datetime.strftime('%Y-%m-%dT%H:%M:%S')
         exif_datetime = new_datetime.strftime('%Y:%m:%d %H:%M:%S')
@@ -73,11 +117,59 @@ class FileMetadata(object):
             self.img_md.write()
         except Exception as e:
             logger.error(e)
+            return False
+        return True
+
+    def patch_datetime(self, new_datetime):
+        """
+        Patch the EXIF tags set_datetime() writes in place. Returns False
+        without changing the file if XMP has to change too or the tags are
+        not laid out as expected, so the caller falls back to pyexiv2.
+        """
+        metadata = self['metadata']
+        if 'Xmp.xmp.CreateDate' in metadata.keys():
+            logger.debug("{}: XMP must change. Not patching in place.".format(
+                self.file))
+            return False
+        keys = ['Exif.Image.DateTime']
+        if 'Exif.Photo.DateTimeOriginal' in metadata.keys():
+            keys.append('Exif.Photo.DateTimeOriginal')
+
+        ext = os.path.splitext(self.file)[1][1:].lower()
+        image_type = photo_rename.EXTENSION_TO_IMAGE_TYPE.get(ext)
+        # The size stays the same, so with a coarse mtime the cache key may
+        # too. Drop what is cached under the key before and after.
+        metadatacache.invalidate(self.file)
+        try:
+            exifpatch.patch_datetime(self.file, image_type, new_datetime, keys)
+        except (PatchError, OSError) as e:
+            logger.debug("{}: Not patching in place: {}".format(self.file, e))
+            return False
+        # Anything read before is stale now.
+        self._img_md = None
+        self.metadata = None
+        metadatacache.invalidate(self.file)
+        logger.debug("{}: Patched in place.".format(self.file))
+        return True
+
+    def set_datetime_sidecar(self, new_datetime):
+        """
+        Write the datetimes set_datetime() would set to the XMP sidecar of
+        the file instead. The file itself is not read or written. Returns
+        False if the write failed.
+        """
+        return self._write_sidecar(
+                self.file, sidecar.datetime_properties(new_datetime))
 
-    def copy_metadata(self, tgt_fn):
+    def copy_metadata(self, tgt_fn, splice=False):
         """
-        Copy metadata from self.file to tgt_fn.
+        Copy metadata from self.file to tgt_fn. With splice a JPEG tgt_fn
+        gets new metadata segments in front of its untouched image data
+        where possible. Returns False if the write failed.
         """
+        if splice and self.splice_metadata(tgt_fn):
+            return True
+
         tgt_md = pyexiv2.ImageMetadata("{}".format(tgt_fn))
         tgt_md.read()
         # At this point, I know comments are not supported by pyexiv2 in TIFF
@@ -94,6 +186,42 @@ class FileMetadata(object):
             tgt_md.write()
         except Exception as e:
             logger.error(e)
+            return False
+        return True
 
+    def copy_metadata_sidecar(self, tgt_fn):
+        """
+        Copy metadata from self.file to the XMP sidecar of tgt_fn instead of
+        tgt_fn itself. Returns False if the write failed.
+        """
+        return self._write_sidecar(
+                tgt_fn, sidecar.metadata_properties(self['metadata']))
 
+    def _write_sidecar(self, filename, properties):
+        """
+        Write properties to the sidecar of filename. Returns False if the
+        write failed.
+        """
+        try:
+            sidecar.write(filename, properties)
+        except (SidecarError, OSError) as e:
+            logger.error(e)
+            return False
+        return True
 
+    def splice_metadata(self, tgt_fn):
+        """
+        Copy metadata to JPEG tgt_fn with jpegsplice. Returns False without
+        changing tgt_fn if it is not a JPEG file or cannot be spliced, so
+        the caller falls back to pyexiv2.
+        """
+        ext = os.path.splitext(tgt_fn)[1][1:].lower()
+        if (photo_rename.EXTENSION_TO_IMAGE_TYPE.get(ext) !=
+                photo_rename.IMAGE_TYPE_JPEG):
+            return False
+        try:
+            jpegsplice.copy_metadata(self.img_md, tgt_fn)
+        except (SpliceError, OSError) as e:
+            logger.debug("{}: Not splicing: {}".format(tgt_fn, e))
+            return False
+        return True
@@ -0,0 +1,138 @@
+"""
+File system operations relative to a pinned directory file descriptor. On
+Linux a move is a single renameat2(RENAME_NOREPLACE) so it can never replace
+a file another process created in the meantime. Elsewhere callers fall back
+to checking for the destination and then renaming.
+"""
+import contextlib
+import ctypes
+import errno
+import logging
+import os
+import sys
+
+
+logger = logging.getLogger(__name__)
+
+# From <linux/fs.h>.
+RENAME_NOREPLACE = 1
+
+# Directories pinned while Harvester.process_file_map() runs. None otherwise.
+_pinned = None
+
+
+def _load_renameat2():
+    """
+    Return the libc renameat2 function or None if there is none.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        func = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+            ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func
+
+
+_renameat2 = _load_renameat2()
+
+
+def rename_noreplace(src_fn, dst_fn, dir_fd):
+    """
+    Rename src_fn to dst_fn, both relative to dir_fd, failing with
+    FileExistsError if dst_fn exists. Returns False without doing anything
+    if renameat2 is not available here, so the caller can fall back.
+    """
+    global _renameat2
+    if _renameat2 is None:
+        return False
+    if _renameat2(dir_fd, os.fsencode(src_fn), dir_fd, os.fsencode(dst_fn),
+            RENAME_NOREPLACE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err == errno.ENOSYS:
+        # Kernel too old. Do not try again.
+        _renameat2 = None
+        return False
+    if err == errno.EINVAL:
+        # File system does not support RENAME_NOREPLACE.
+        return False
+    raise OSError(err, os.strerror(err), src_fn, None, dst_fn)
+
+
+class DirFds(object):
+    """
+    File descriptor of the directory files are being moved in. Only the most
+    recent directory is kept open since filemaps arrive directory by
+    directory.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.fd = None
+
+    def get(self, path):
+        """
+        Return a descriptor for directory path, opening it if needed.
+        """
+        if self.fd is None or path != self.path:
+            self.close()
+            self.fd = os.open(path or os.curdir,
+                    os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+            self.path = path
+        return self.fd
+
+    def close(self):
+        """
+        Close the open descriptor if any.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+        self.path = None
+
+
+@contextlib.contextmanager
+def pinned_directories():
+    """
+    Pin directory descriptors for pinned_dir_fd() until the block ends.
+    """
+    global _pinned
+    previous = _pinned
+    _pinned = DirFds()
+    try:
+        yield _pinned
+    finally:
+        _pinned.close()
+        _pinned = previous
+
+
+def pinned_dir_fd(path):
+    """
+    Return a pinned descriptor for directory path, or None if directories
+    are not pinned, renameat2 is unavailable or the directory cannot be
+    opened.
+    """
+    if _pinned is None or _renameat2 is None:
+        return None
+    try:
+        return _pinned.get(path)
+    except OSError as e:
+        logger.debug("Unable to open directory {}: {}".format(path, e))
+        return None
+
+
+def fsync_directory(path):
+    """
+    Flush the entries of directory path to disk so the renames made in it
+    survive a crash.
+    """
+    fd = os.open(path or os.curdir,
+            os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
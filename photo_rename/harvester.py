@@ -1,35 +1,185 @@
 import argparse
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
+import mmap
 import os
 import re
 import stat
 import sys
 import pyexiv2
 import photo_rename
-from photo_rename import Filemap, FileList, FilemapList
+from photo_rename import (
+        Filemap, FileList, FilemapList, FilemapStream, fsops)
 import photo_rename
 
 
 logger = logging.getLogger(__name__)
 
+# Destination base name with optional milliseconds and sequence number.
+# YYYYmmdd_HHMMSS[_mmm][-N]
+DST_FN_SEQ_REGEX = re.compile(r"^(\d+_\d+(?:_\d+)?)(?:-\d+)?$")
+
+# Destination base name with a content digest. YYYYmmdd_HHMMSS-hhhhhh
+DST_FN_DIGEST_REGEX = re.compile(r"^\d+_\d+-[0-9a-f]+$")
+
+# Hidden name a file on a mapfile rename cycle is parked under.
+TEMP_FN_FORMAT = ".pz_rename-{seq}-{src_fn}"
+TEMP_FN_REGEX = re.compile(r"^\.pz_rename-\d+-")
+
+# Filemaps read ahead of the one being moved in streaming mode.
+STREAM_BUFFER_SIZE = 256
+
+# Delimiters tried in order when a mapfile delimiter is not given.
+MAPFILE_DELIMITERS = ['\t', ',', ';', '|']
+
+
+def stem_prefixes(filename):
+    """
+    Yield every prefix of filename that is followed by a dot and at least
+    one more character. These are the stems matching filename the way
+    the pattern ^{stem}[.].+$ would, without treating the stem as a regex.
+
+    >>> list(stem_prefixes('a.b.jpg'))
+    ['a', 'a.b']
+    >>> list(stem_prefixes('a.'))
+    []
+    """
+    dot = filename.find('.')
+    while 0 <= dot < len(filename) - 1:
+        yield filename[:dot]
+        dot = filename.find('.', dot + 1)
+
+
+class DuplicateFinder(object):
+    """
+    Hash-based duplicate detection for destination filenames. Entries are
+    fed to add() as they are read. Every destination seen more than once is
+    kept in duplicates together with all the sources and line numbers
+    claiming it, in the order they were seen.
+    """
+
+    def __init__(self):
+        self.seen = {}
+        self.duplicates = {}
+
+    def add(self, dst_fn, src_fn=None, lineno=None):
+        """
+        Record one entry. Returns True if dst_fn was seen before.
+        """
+        entry = (src_fn, lineno)
+        first = self.seen.setdefault(dst_fn, entry)
+        if first is entry:
+            return False
+        if dst_fn not in self.duplicates:
+            self.duplicates[dst_fn] = [first]
+        self.duplicates[dst_fn].append(entry)
+        return True
+
+    def report(self):
+        """
+        Return one line per duplicated destination naming every source.
+
+        >>> finder = DuplicateFinder()
+        >>> finder.add('new', 'abc', 1)
+        False
+        >>> finder.add('new', 'xyz', 3)
+        True
+        >>> finder.report()
+        ['new: abc (line 1), xyz (line 3)']
+        """
+        lines = []
+        for dst_fn, entries in self.duplicates.items():
+            sources = []
+            for src_fn, lineno in entries:
+                if lineno is None:
+                    sources.append("{}".format(src_fn))
+                elif src_fn is None:
+                    sources.append("line {}".format(lineno))
+                else:
+                    sources.append("{} (line {})".format(src_fn, lineno))
+            lines.append("{}: {}".format(dst_fn, ", ".join(sources)))
+        return lines
+
+
+class CollisionCounter(object):
+    """
+    Incremental collision resolution, one filemap at a time. Keeps a set of
+    names already handed out and a dict of base name to next free sequence
+    number so each filemap costs O(1). A name that already carries a
+    sequence number, such as a file keeping its YYYYmmdd_HHMMSS-1 name, is
+    taken like any other and skipped when numbering.
+
+    Names are handed out in the order filemaps are resolved. With --stream
+    that is filename order, whereas init_file_map() first sorts the frames
+    of one second by sub-second capture time. A burst whose filenames do not
+    follow capture order is therefore numbered differently with --stream.
+    --naming millis keeps such frames apart either way.
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.taken = set()
+        self.next_seq = {}
+
+    def resolve(self, filemap):
+        """
+        Give filemap the next free name for its base name if its dst_fn is
+        taken. Names not of the YYYYmmdd_HHMMSS form are left alone.
+        """
+        dst_fn = filemap.dst_fn
+        if dst_fn in self.taken:
+            dst_fn_base, dst_fn_ext = os.path.splitext(dst_fn)
+            match = DST_FN_SEQ_REGEX.match(dst_fn_base)
+            if match:
+                key = (match.group(1), dst_fn_ext)
+                seq = self.next_seq.get(key, 1)
+                while True:
+                    dst_fn = "{base}-{seq}{ext}".format(
+                        base=key[0], seq=seq, ext=dst_fn_ext)
+                    seq += 1
+                    if dst_fn not in self.taken:
+                        break
+                self.next_seq[key] = seq
+                if dst_fn != filemap.src_fn:
+                    logger.info("Avoid collision: {} ==> {}".format(
+                        filemap.src_fn, dst_fn))
+                filemap.set_dst_fn(os.path.join(self.workdir, dst_fn))
+        self.taken.add(dst_fn)
+
 
 class Harvester(object):
     """
     Initialize Filemap list.
     """
 
-    def __init__(self, workdir, mapfile=None, delimiter='\t', lineterm=None,
-            metadata_dst_directory=None):
+    def __init__(self, workdir, mapfile=None, delimiter=None, lineterm=None,
+            metadata_dst_directory=None, workers=None, mapfile_mmap=False,
+            recursive=False, naming=None):
         """
-        Set state and initialize list.
+        Set state and initialize list. When workers is greater than one,
+        metadata is read by a pool of that many threads. A delimiter or
+        lineterm of None is detected from the mapfile. With mapfile_mmap the
+        mapfile is memory mapped rather than read through a file object.
+        With recursive every directory below workdir is harvested too, each
+        one on its own. naming is passed on to every Filemap built from
+        metadata.
         """
         self.workdir = workdir
         self.mapfile = mapfile
         self.delimiter = delimiter
         self.lineterm = lineterm
+        self.mapfile_mmap = mapfile_mmap
         self.metadata_dst_directory = metadata_dst_directory
+        self.workers = workers
+        self.recursive = recursive
+        self.naming = naming
         self.filemaps = None
         self.files = None
+        # DirEntry per filename from the last directory scan.
+        self.entries = {}
+        self.directories = None
 
     def __getitem__(self, key):
         """
@@ -42,6 +192,22 @@ class Harvester(object):
                 self.filemaps = self.filemaps_for_metadata_copy()
             return self.filemaps
 
+        # One (directory, FilemapList) per directory. Just workdir unless
+        # recursive.
+        if key == "directory_filemaps":
+            if not self.recursive:
+                return [(self.workdir, self["filemaps"])]
+            return [(harvester.workdir, harvester["filemaps"])
+                for harvester in self.directory_harvesters()]
+
+        # One (directory, files) per directory. Just workdir unless
+        # recursive.
+        if key == "directory_files":
+            if not self.recursive:
+                return [(self.workdir, self["files"])]
+            return [(harvester.workdir, harvester.files)
+                for harvester in self.directory_harvesters()]
+
         # Reading from mapfile
         if key == "files" and self.mapfile:
             if not self.files:
@@ -67,55 +233,158 @@ class Harvester(object):
         # list_workdir = ['abc.jpg', 'ghi.jpg', 'pqr.jpg']
         # results in...
         # allfiles = ['abc.jpg', 'ghi.jpg']
+        #
+        # The directory is listed once and indexed by stem so each mapfile
+        # key is a dict lookup. Keys are matched literally.
         files = FileList()
         alt_file_map = self.read_alt_file_map()
+        by_stem = {}
+        for filename in os.listdir(self.workdir):
+            for stem in stem_prefixes(filename):
+                by_stem.setdefault(stem, []).append(filename)
+        matched = []
         for file_prefix in alt_file_map.keys():
-            for filename in os.listdir(self.workdir):
-                if re.search(r"^{}\..+$".format(file_prefix), filename):
-                    files.add(filename)
+            matched.extend(by_stem.get(file_prefix, []))
+        files.extend(matched)
         return [file for file in files.get()]
 
     def files_from_directory(self, directory):
         """
         Build list of files matching recognized file extensions.
         """
+        file_entries, _ = self.scan_directory(directory)
+        return self.use_entries(file_entries)
+
+    def use_entries(self, file_entries):
+        """
+        Remember scanned DirEntry objects by filename so later steps need not
+        stat the files again. Return the filenames in FileList order.
+        """
+        self.entries = dict((entry.name, entry) for entry in file_entries)
         files = FileList()
-        for filename in os.listdir(directory):
-            src_fn_ext = os.path.splitext(filename)[1][1:].lower()
-            if (src_fn_ext in photo_rename.EXTENSION_TO_IMAGE_TYPE and
-                    not os.path.isdir(os.path.join(directory, filename))):
-                files.add(filename)
-            else:
-                # XXX: This here only so coverage report works.
-                logger.debug(
-                        "Skipping file with unknown extension {}.".format(
-                            src_fn_ext))
-                continue
+        files.extend(entry.name for entry in file_entries)
         return [file for file in files.get()]
 
+    def scan_directory(self, directory):
+        """
+        List directory once with os.scandir. Returns the DirEntry of every
+        file with a recognized extension and of every subdirectory. The
+        file type comes from the directory listing so no extra stat is
+        needed except for symlinks.
+        """
+        file_entries = []
+        dir_entries = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dir_entries.append(entry)
+                    continue
+                src_fn_ext = os.path.splitext(entry.name)[1][1:].lower()
+                if src_fn_ext in photo_rename.EXTENSION_TO_IMAGE_TYPE:
+                    file_entries.append(entry)
+                else:
+                    # XXX: This here only so coverage report works.
+                    logger.debug(
+                            "Skipping file with unknown extension {}.".format(
+                                src_fn_ext))
+        return file_entries, dir_entries
+
+    def walk_directories(self):
+        """
+        Find workdir and every directory below it. Each level of the tree is
+        scanned by the thread pool in map_tasks(). Symlinked directories are
+        followed but a directory already seen, by (st_dev, st_ino), is
+        skipped so symlink loops end. Returns (directory, file DirEntry list)
+        sorted by directory.
+        """
+        def scan(directory):
+            try:
+                return self.scan_directory(directory)
+            except OSError as e:
+                logger.warn("Skipping directory {}: {}".format(directory, e))
+                return [], []
+
+        st = os.stat(self.workdir)
+        seen = set([(st.st_dev, st.st_ino)])
+        found = []
+        level = [self.workdir]
+        while level:
+            next_level = []
+            for directory, (file_entries, dir_entries) in zip(
+                    level, self.map_tasks(scan, level)):
+                found.append((directory, file_entries))
+                for entry in dir_entries:
+                    try:
+                        st = entry.stat()
+                    except OSError as e:
+                        logger.warn("Skipping directory {}: {}".format(
+                            entry.path, e))
+                        continue
+                    if (st.st_dev, st.st_ino) in seen:
+                        logger.warn(
+                            "Skipping directory {}. Already visited.".format(
+                                entry.path))
+                        continue
+                    seen.add((st.st_dev, st.st_ino))
+                    next_level.append(entry.path)
+            level = next_level
+        return sorted(found, key=lambda item: item[0])
+
+    def directory_harvesters(self):
+        """
+        Return a Harvester for each directory from walk_directories() that
+        holds supported files. Each is primed with the scanned entries so no
+        directory is listed twice, and resolves collisions on its own.
+        """
+        if self.directories is None:
+            self.directories = []
+            for directory, file_entries in self.walk_directories():
+                if not file_entries:
+                    continue
+                harvester = Harvester(directory, workers=self.workers,
+                        naming=self.naming)
+                harvester.files = harvester.use_entries(file_entries)
+                self.directories.append(harvester)
+        return self.directories
+
     def filemaps_for_metadata_copy(self):
         """
         Find two sets of matching files for copying metadata. Generate a list
         of source files from the source directory. Find a list of matching
         files with the same filename sans extension in the destination
         directory. Create and return filemaps.
+
+        Source files are indexed by stem once. Each destination filename is
+        then looked up by every prefix ending before a dot, so the pairs come
+        from a hash join rather than comparing every pair of files.
         """
+        src_by_stem = {}
+        for index, src_fn in enumerate(self["files"]):
+            src_fn_prefix = os.path.splitext(src_fn)[0]
+            src_by_stem.setdefault(src_fn_prefix, []).append((index, src_fn))
+
         filemaps = FilemapList()
         for filename in os.listdir(self.metadata_dst_directory):
-            for src_fn in self["files"]:
-                src_fn_prefix = os.path.splitext(src_fn)[0]
-                if re.search(r"^{}\..+$".format(src_fn_prefix), filename):
-                    src_fn_fq = os.path.join(self.workdir, src_fn)
-                    dst_fn_fq = os.path.join(
-                            self.metadata_dst_directory, filename)
-                    src_fn_ext = os.path.splitext(src_fn)[1][1:]
-                    dst_fn_ext = os.path.splitext(filename)[1][1:]
-                    # TODO: Image type is meaningless here yet necessary.
-                    image_type = photo_rename.EXTENSION_TO_IMAGE_TYPE[
-                            src_fn_ext]
-                    filemap = Filemap(src_fn_fq, image_type,
-                            metadata=None, dst_fn=dst_fn_fq)
-                    filemaps.add(filemap)
+            # 'a.b.jpg' matches sources with stem 'a' or 'a.b'.
+            matches = []
+            for stem in stem_prefixes(filename):
+                matches.extend(src_by_stem.get(stem, []))
+            for _, src_fn in sorted(matches):
+                src_fn_fq = os.path.join(self.workdir, src_fn)
+                dst_fn_fq = os.path.join(
+                        self.metadata_dst_directory, filename)
+                src_fn_ext = os.path.splitext(src_fn)[1][1:]
+                # TODO: Image type is meaningless here yet necessary.
+                image_type = photo_rename.EXTENSION_TO_IMAGE_TYPE[
+                        src_fn_ext]
+                # Metadata is copied by FileMetadata. Do not read it here.
+                filemap = Filemap(src_fn_fq, image_type,
+                        metadata=None, dst_fn=dst_fn_fq, read_metadata=False)
+                filemaps.add(filemap)
         return filemaps
 
     def init_file_map(self):
@@ -125,14 +394,94 @@ class Harvester(object):
         magic number mechanism that would be cool.
         """
         # XXX: If processing a mapfile, need alt_file_map.
+        alt_file_map = None
         if self.mapfile:
             alt_file_map = self.read_alt_file_map()
 
-        # Initialize file_map list.
+        # Initialize file_map list. Collect everything first and sort once.
         filemaps = FilemapList()
+        tasks = list(self.file_tasks())
+        build_filemap = functools.partial(
+                self.build_filemap, alt_file_map=alt_file_map)
+        built = [fm for fm in self.map_tasks(build_filemap, tasks)
+            if fm is not None]
+        # Frames taken in the same second keep their capture order through
+        # the sort below, so they are numbered in that order.
+        if not self.mapfile:
+            built.sort(key=lambda fm: fm.sub_second() or '')
+        filemaps.extend(built)
+
+        # XXX: Here after all Filemap have been initialized we need to check
+        # for collisions. Not when mapfile used.
+        if self.mapfile:
+            pass
+        elif self.naming == photo_rename.NAMING_HASH:
+            self.resolve_digest_collisions(filemaps)
+        else:
+            self.resolve_dst_filename_collisions(filemaps)
+
+        # Anything left will be refused by Filemap.move(). Say so up front.
+        for line in self.find_duplicate_destinations(filemaps).report():
+            logger.warn("Duplicate destination: {}".format(line))
+
+        # Mapfile names may swap or rotate. Move in an order that works.
+        if self.mapfile:
+            return FilemapStream(self.order_mapfile_moves(filemaps))
+        return filemaps
+
+    def stream_filemaps(self, buffer_size=STREAM_BUFFER_SIZE):
+        """
+        Generator version of init_file_map() for the recursive or flat case.
+        Files are named in filename order, then yielded one at a time as
+        soon as their metadata has been read. Unlike init_file_map() the
+        frames of one second are not sorted by sub-second time first. At
+        most buffer_size reads are in flight and collisions are resolved
+        with a CollisionCounter, so only the names handed out are kept.
+
+        Only the filenames are listed up front. Listing while files are
+        being renamed could return a renamed file twice.
+        """
+        if self.recursive:
+            harvesters = self.directory_harvesters()
+        else:
+            harvesters = [self]
+        for harvester in harvesters:
+            alt_file_map = None
+            if harvester.mapfile:
+                alt_file_map = harvester.read_alt_file_map()
+            counter = CollisionCounter(harvester.workdir)
+            taken = set()
+            build_filemap = functools.partial(
+                    harvester.build_filemap, alt_file_map=alt_file_map)
+            filemaps = (filemap for filemap in harvester.imap_tasks(
+                build_filemap, harvester.file_tasks(), buffer_size)
+                if filemap is not None)
+            if harvester.mapfile:
+                # No metadata is read, so ordering the whole map costs
+                # little.
+                file_map = FilemapList()
+                file_map.extend(filemaps)
+                for filemap in harvester.order_mapfile_moves(file_map):
+                    yield filemap
+                continue
+            for filemap in filemaps:
+                # Digest names need no numbering.
+                if harvester.naming == photo_rename.NAMING_HASH:
+                    harvester.resolve_digest_clash(filemap, taken)
+                else:
+                    counter.resolve(filemap)
+                yield filemap
+
+    def file_tasks(self):
+        """
+        Yield (filename, filename_fq, image_type, src_fn_ext) for every file
+        in self["files"] with a supported extension.
+        """
         for filename in self["files"]:
             filename_fq = os.path.join(self.workdir, filename)
-            if os.path.isdir(filename_fq):
+            # Scanned entries are known not to be directories.
+            if (filename not in self.entries and
+                    os.path.isdir(filename_fq)):
                 logger.warn("Skipping directory {0}".format(filename_fq))
                 continue
 
@@ -146,140 +495,361 @@ class Harvester(object):
                         "Skipping file with unknown extension {}.".format(
                             src_fn_ext))
                 continue
+            yield (filename, filename_fq, image_type, src_fn_ext)
 
-            try:
-                if self.mapfile:
-                    filename_prefix = os.path.splitext(filename)[0]
-                    dst_fn = "{}.{}".format(
-                            alt_file_map[filename_prefix], src_fn_ext)
-                    filemaps.add(
-                        Filemap(filename_fq, image_type, dst_fn=dst_fn,
-                            read_metadata=False))
-                else:
-                    filemap = Filemap(filename_fq, image_type)
-                    filemaps.add(filemap)
-            except Exception as e:
-                logger.warn("Filemap Error: {0}".format(e))
+    def build_filemap(self, task, alt_file_map=None):
+        """
+        Create one Filemap. Runs in a worker thread when self.workers is set
+        so it must not touch shared state other than logging. Returns None
+        if the Filemap could not be created.
+        """
+        filename, filename_fq, image_type, src_fn_ext = task
+        try:
+            if alt_file_map is not None:
+                filename_prefix = os.path.splitext(filename)[0]
+                dst_fn = "{}.{}".format(
+                        alt_file_map[filename_prefix], src_fn_ext)
+                return Filemap(filename_fq, image_type, dst_fn=dst_fn,
+                        read_metadata=False)
+            else:
+                # The DirEntry from the scan saves stat'ing the file again.
+                return Filemap(filename_fq, image_type,
+                        stat_result=self.entries.get(filename),
+                        naming=self.naming)
+        except Exception as e:
+            logger.warn("Filemap Error: {0}".format(e))
+            return None
+
+    def map_tasks(self, func, tasks):
+        """
+        Apply func to every task and return the results in task order. Uses
+        a bounded thread pool when self.workers is greater than one. Reading
+        metadata is mostly waiting on I/O so threads are enough to keep the
+        disks busy.
+        """
+        if not self.workers or self.workers < 2 or len(tasks) < 2:
+            return [func(task) for task in tasks]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(func, tasks))
 
-        # XXX: Here after all Filemap have been initialized we need to check
-        # for collisions. Not when mapfile used.
-        if not self.mapfile:
-            for filemap in [fm for fm in filemaps.get()]:
-                dst_fn_fq = os.path.join(self.workdir,
-                    self.find_dst_filename_collision(filemaps, filemap))
-                filemap.set_dst_fn(dst_fn_fq)
+    def imap_tasks(self, func, tasks, buffer_size=STREAM_BUFFER_SIZE):
+        """
+        Lazy map_tasks(). Yields results in task order while keeping at most
+        buffer_size tasks submitted to the thread pool. tasks may be a
+        generator.
+        """
+        if not self.workers or self.workers < 2:
+            for task in tasks:
+                yield func(task)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = collections.deque()
+            for task in tasks:
+                pending.append(executor.submit(func, task))
+                if len(pending) >= buffer_size:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def resolve_dst_filename_collisions(self, filemaps):
+        """
+        Single pass over the file map list giving every filemap a unique
+        dst_fn with a CollisionCounter. Names follow the same
+        YYYYmmdd_HHMMSS-N scheme as find_dst_filename_collision() and there
+        is no limit on the number of files sharing one base name.
 
-        return filemaps
+        Names that are not of the YYYYmmdd_HHMMSS form are left alone. A
+        collision there is detected and skipped when the file is moved.
+        """
+        counter = CollisionCounter(self.workdir)
+        for filemap in filemaps.get():
+            counter.resolve(filemap)
+
+    def resolve_digest_collisions(self, filemaps):
+        """
+        Rename NAMING_HASH filemaps whose names clash after a digest of
+        their whole content. Only files of the same second, size and first
+        bytes clash, so this reads few files. Files with the same content
+        keep the same name and all but the first are refused when moved.
+        """
+        by_dst_fn = collections.defaultdict(list)
+        for filemap in filemaps.get():
+            by_dst_fn[filemap.dst_fn].append(filemap)
+        for dst_fn, clashing in by_dst_fn.items():
+            if (len(clashing) < 2 or not DST_FN_DIGEST_REGEX.match(
+                    os.path.splitext(dst_fn)[0])):
+                continue
+            for filemap in clashing:
+                try:
+                    full_dst_fn = filemap.build_dst_fn(full_digest=True)
+                except OSError as e:
+                    logger.warn("Unable to read {}: {}".format(
+                        filemap.src_fn, e.strerror))
+                    continue
+                logger.info("Avoid collision: {} ==> {}".format(
+                    filemap.src_fn, full_dst_fn))
+                filemap.set_dst_fn(os.path.join(self.workdir, full_dst_fn))
+
+    def resolve_digest_clash(self, filemap, taken):
+        """
+        Streaming version of resolve_digest_collisions(). taken holds the
+        names handed out so far in this directory. A NAMING_HASH filemap
+        whose name is taken is renamed after a digest of its whole content.
+        The file that got the name first may be moved already, so it keeps
+        it. A file whose name still clashes keeps its src_fn.
+        """
+        dst_fn = filemap.dst_fn
+        if dst_fn in taken and DST_FN_DIGEST_REGEX.match(
+                os.path.splitext(dst_fn)[0]):
+            try:
+                full_dst_fn = filemap.build_dst_fn(full_digest=True)
+            except OSError as e:
+                logger.warn("Unable to read {}: {}".format(
+                    filemap.src_fn, e.strerror))
+            else:
+                dst_fn = full_dst_fn
+                if dst_fn not in taken:
+                    logger.info("Avoid collision: {} ==> {}".format(
+                        filemap.src_fn, dst_fn))
+                    filemap.set_dst_fn(os.path.join(self.workdir, dst_fn))
+        if dst_fn in taken:
+            logger.warn(
+                "{0} => {1} Destination collision. Doing nothing.".format(
+                filemap.src_fn, dst_fn))
+            filemap.set_dst_fn(filemap.src_fn_fq)
+            dst_fn = filemap.dst_fn
+        taken.add(dst_fn)
 
     def find_dst_filename_collision(self, filemaps, chk_filemap):
         """
-        Scan file map list for new destination filename and adjust if
-        conflict.
+        Return the dst_fn chk_filemap gets when the filemaps before it in
+        the file map list keep theirs. Names follow the same
+        YYYYmmdd_HHMMSS-N scheme as resolve_dst_filename_collisions() and
+        there is no limit on the number of files sharing one base name.
         """
-        seq = 1
-        dst_fn = chk_filemap.dst_fn
-        old_dst_fn = dst_fn
-        dst_fn_base = os.path.splitext(dst_fn)[0]
-        dst_fn_ext = os.path.splitext(dst_fn)[1][1:]
-        dst_fn_regex_s1 = r"^(\d+_\d+)-\d+$"
-        dst_fn_regex_s2 = r"^(\d+_\d+)$"
+        taken = set()
         for filemap in filemaps.get():
-            dst_fn_regex_r = r"\1-{0}".format(seq)
             # Stop if we've reached our position.
             if filemap == chk_filemap:
                 break
-            if dst_fn == filemap.dst_fn:
-                dst_fn_base = re.sub(
-                        dst_fn_regex_s1, dst_fn_regex_r, dst_fn_base)
-                dst_fn_base = re.sub(
-                        dst_fn_regex_s2, dst_fn_regex_r, dst_fn_base)
-                dst_fn = "{base}.{ext}".format(
-                        base=dst_fn_base, ext=dst_fn_ext)
-                seq += 1
-            if seq > photo_rename.MAX_RENAME_ATTEMPTS:
-                raise Exception("Too many rename attempts: {} {}".format(
-                    dst_fn, seq))
-        if old_dst_fn != dst_fn and chk_filemap.src_fn != dst_fn:
+            taken.add(filemap.dst_fn)
+        dst_fn = chk_filemap.dst_fn
+        if dst_fn not in taken:
+            return dst_fn
+        dst_fn_base, dst_fn_ext = os.path.splitext(dst_fn)
+        match = DST_FN_SEQ_REGEX.match(dst_fn_base)
+        if not match:
+            return dst_fn
+        seq = 1
+        while True:
+            dst_fn = "{base}-{seq}{ext}".format(
+                base=match.group(1), seq=seq, ext=dst_fn_ext)
+            if dst_fn not in taken:
+                break
+            seq += 1
+        if chk_filemap.src_fn != dst_fn:
             logger.info("Avoid collision: {} ==> {}".format(
                 chk_filemap.src_fn, dst_fn))
         return dst_fn
 
+    def order_mapfile_moves(self, filemaps):
+        """
+        Return the filemaps of a mapfile as a list ordered so that every
+        move finds its destination free. The moves form chains and cycles.
+        A chain is moved from its free end backwards. A cycle is broken by
+        moving one file to a temporary name first and on to its destination
+        last. A chain of n moves takes n renames and a cycle of n moves
+        n + 1, the fewest possible without swapping.
+        """
+        by_src = collections.OrderedDict()
+        by_dst = {}
+        ordered = []
+        for fm in filemaps.get():
+            if fm.src_fn == fm.dst_fn:
+                ordered.append(fm)
+                continue
+            by_src[fm.src_fn] = fm
+            by_dst[fm.dst_fn] = fm
+        placed = set()
+
+        def unwind(fm, stop=None):
+            # Move fm, then the move waiting for its source, and so on.
+            while (fm is not None and fm is not stop and
+                    fm.src_fn not in placed):
+                placed.add(fm.src_fn)
+                ordered.append(fm)
+                fm = by_dst.get(fm.src_fn)
+
+        # A chain ends in a destination no other move frees.
+        for fm in by_src.values():
+            if fm.dst_fn not in by_src:
+                unwind(fm)
+
+        # Everything left is on a cycle.
+        for fm in by_src.values():
+            if fm.src_fn in placed:
+                continue
+            placed.add(fm.src_fn)
+            tmp_fn = self.temp_filename(fm.src_fn, by_src, by_dst)
+            logger.info("Breaking rename cycle: {} ==> {}".format(
+                fm.src_fn, tmp_fn))
+            ordered.append(Filemap(fm.src_fn_fq, fm.image_type,
+                dst_fn=tmp_fn, read_metadata=False))
+            unwind(by_dst.get(fm.src_fn), stop=fm)
+            ordered.append(Filemap(os.path.join(self.workdir, tmp_fn),
+                fm.image_type, dst_fn=fm.dst_fn, read_metadata=False))
+        return ordered
+
+    def temp_filename(self, src_fn, *taken):
+        """
+        Return a hidden name for src_fn in the work directory that is not in
+        any of taken and does not exist.
+        """
+        seq = 0
+        while True:
+            tmp_fn = TEMP_FN_FORMAT.format(seq=seq, src_fn=src_fn)
+            if (not any(tmp_fn in names for names in taken) and
+                    not os.path.lexists(os.path.join(self.workdir, tmp_fn))):
+                return tmp_fn
+            seq += 1
+
     def read_alt_file_map(self):
         """
         Read a filename map for the purpose of transforming the filenames as
         an alternative to using EXIF/XMP metadata DateTime information. Only
         require map file as an absolute path.
+
+        The map is parsed in one pass. Line termination and, if not given,
+        the delimiter are taken from the first row. Duplicate destinations
+        are caught as rows are read and all of them are reported with their
+        sources and line numbers. Rows without exactly one delimiter are
+        reported by line number.
         """
         # Initialize locally so we do not change instance state.
         lineterm = self.lineterm
         delimiter = self.delimiter
 
-        with open(self.mapfile, 'r') as f:
-            lines = [
-                line for line in f.readlines() if not line.startswith('#')]
-
-        if lineterm is None:
-            lineterm = self.get_line_term(lines)
+        alt_file_map = {}
+        # Get destination filenames from map so we can check for dupes. This
+        # may seem pedantic but it will avoid a lot of trouble if there is a
+        # duplicate new filename because of human error.
+        dupes = DuplicateFinder()
+        bad_lines = []
+        for lineno, line in enumerate(self.mapfile_lines(), 1):
+            if line.startswith('#'):
+                continue
+            term = self.line_term(line)
+            if lineterm is None:
+                lineterm = term
+            elif term is not None and term != lineterm:
+                raise Exception(
+                    "Inconsistent line termination on line {}.".format(
+                        lineno))
+            row = line.rstrip('\r\n')
+            if not row.strip():
+                continue
+            if delimiter is None:
+                delimiter = self.find_delimiter(row)
+            fields = row.split(delimiter) if delimiter else [row]
+            if len(fields) != 2 or not fields[0] or not fields[1]:
+                logger.error("{}:{}: Expected two fields: {}".format(
+                    self.mapfile, lineno, row))
+                bad_lines.append(lineno)
+                continue
+            src_fn, dst_fn = fields
+            dupes.add(dst_fn, src_fn, lineno)
+            alt_file_map[src_fn] = dst_fn
 
-        # Get a list of destination filenames from map so we can check for
-        # dupes. This may seem pedantic but it will avoid a lot of trouble if
-        # there is a duplicate new filename because of human error.
-        files = [
-            str.split(line.rstrip(lineterm), delimiter)[1] for line in lines]
-        if self.scan_for_dupe_files(files):
+        if dupes.duplicates:
+            for line in dupes.report():
+                logger.error("Duplicate destination: {}".format(line))
             raise Exception(
-                "Duplicate destination filename detected: {}".format(ofn))
-
-        # XXX: This is soooo cool! List of lists flattened all on one nested
-        # comprehension.
-        # [[k1, v1], [k2, v2], ..., [kn, vn]]
-        #                               --> {k1: v1, k2: v2, ..., kn: vn}
-        return dict(zip(*[iter([x for sublist in [
-            str.split(line.rstrip(lineterm), delimiter) for line in lines]
-            for x in sublist])] * 2))
-
-    def get_line_term(self, lines):
-        """
-        Find line termination style. Require every line to have the same
-        termination.
-        """
-        lineterm = None
-        for line in lines:
-            if line.endswith('\r\n'):
-                term = '\r\n'
-            elif line.endswith('\n'):
-                term = '\n'
-            if lineterm is not None and lineterm != term:
-                raise Exception("Inconsistent line termination.")
-            else:
-                lineterm = term
-        return lineterm
+                "Duplicate destination filename detected: {}".format(
+                    "; ".join(dupes.report())))
+        if bad_lines:
+            raise Exception("Malformed map file rows on lines: {}".format(
+                ", ".join(str(lineno) for lineno in bad_lines)))
+        return alt_file_map
+
+    def mapfile_lines(self):
+        """
+        Yield the lines of the mapfile with their line terminators. With
+        mapfile_mmap the file is memory mapped and decoded a line at a time.
+        """
+        if self.mapfile_mmap:
+            with open(self.mapfile, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for line in iter(mm.readline, b''):
+                        yield line.decode('utf-8')
+        else:
+            # newline='' keeps '\r\n' so termination can be checked.
+            with open(self.mapfile, 'r', newline='') as f:
+                for line in f:
+                    yield line
+
+    @staticmethod
+    def line_term(line):
+        """
+        Return the termination of one line or None for a last line without
+        one.
+
+        >>> Harvester.line_term('abc\\tdef\\r\\n') == '\\r\\n'
+        True
+        """
+        if line.endswith('\r\n'):
+            return '\r\n'
+        if line.endswith('\n'):
+            return '\n'
+        return None
+
+    @staticmethod
+    def find_delimiter(row):
+        """
+        Return the first delimiter in MAPFILE_DELIMITERS found in row.
+
+        >>> Harvester.find_delimiter('abc,def')
+        ','
+        """
+        for delimiter in MAPFILE_DELIMITERS:
+            if delimiter in row:
+                return delimiter
+        return None
 
     def scan_for_dupe_files(self, files):
         """
-        O(n^2) scan of desination list for duplicates. Used when processing a
-        map file. Returns True if duplicate files.
+        Hash-based scan of destination list for duplicates. Used when
+        processing a map file. Returns True if duplicate files.
         """
-        for ofile in files:
-            count = 0
-            for ifile in files:
-                if ofile == ifile:
-                    count += 1
-                if count > 1:
-                    return True
+        dupes = DuplicateFinder()
+        for dst_fn in files:
+            if dupes.add(dst_fn):
+                return True
         return False
 
+    def find_duplicate_destinations(self, filemaps):
+        """
+        Scan the dst_fn of every filemap once. Returns a DuplicateFinder
+        holding each destination claimed by more than one source file.
+        """
+        dupes = DuplicateFinder()
+        for filemap in filemaps.get():
+            dupes.add(filemap.dst_fn, filemap.src_fn)
+        return dupes
 
-    def process_file_map(self, file_map, simon_sez=None, move_func=None):
+    def process_file_map(self, file_map, simon_sez=None, move_func=None,
+            journal=None):
         """
         Iterate through the Python list of Filemap objects. Move the file if
-        Simon sez.
+        Simon sez. Moves are recorded in journal if one is given.
 
         Arguments:
             str: workdir - Working directory.
             dict: file_map - src_fn to dst_fn mapping.
             boolean: simon_sez - Dry run or real thing.
             func: move_func - Move function to use for testing or default.
+            Journal: journal - Rename journal to record moves in.
         Returns:
             None
 
@@ -295,6 +865,31 @@ class Harvester(object):
         if simon_sez is None:
             simon_sez = False
 
+        with fsops.pinned_directories():
+            if simon_sez and journal is not None:
+                self._process_journaled(file_map, move_func, journal)
+            else:
+                self._process_file_map(file_map, simon_sez, move_func)
+
+    def _process_journaled(self, file_map, move_func, journal):
+        """
+        Move every filemap, recording the moves in journal.
+        """
+        def move(fm):
+            if move_func is None:
+                return fm.move()
+            move_func(fm.src_fn, fm.dst_fn)
+            return True
+
+        try:
+            journal.process(file_map.get(), move)
+        except Exception as e:
+            logging.info("{0}".format(e))
+
+    def _process_file_map(self, file_map, simon_sez, move_func):
+        """
+        Loop of process_file_map() run with the work directories pinned.
+        """
         for fm in file_map.get():
             try:
                 if simon_sez:
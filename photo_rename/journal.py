@@ -0,0 +1,270 @@
+"""
+Rename journal. pz_rename --journal appends a record of every move to a tab
+separated file: an intent row before the move and a done row after it.
+Records are made durable in groups. Each commit first fsyncs the directories
+files were moved in and then the journal once for all records of the batch,
+so a done row on disk always means the rename is on disk too, and an intent
+row is on disk before its rename can be. A run that was killed is finished
+with --resume. --undo reverses the completed moves without reading any
+images.
+"""
+from collections import OrderedDict, namedtuple
+import csv
+import logging
+import os
+import photo_rename
+from photo_rename import Filemap, FilemapStream, fsops
+
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_HEADER = ['record', 'src', 'dst']
+
+RECORD_INTENT = 'intent'
+RECORD_DONE = 'done'
+RECORD_UNDONE = 'undone'
+RECORDS = [RECORD_INTENT, RECORD_DONE, RECORD_UNDONE]
+
+# Moves made between two commits.
+JOURNAL_BATCH_SIZE = 256
+
+# Last record of one src and dst pair.
+Entry = namedtuple('Entry', ['src', 'dst', 'record'])
+
+
+class JournalError(Exception):
+    """
+    The journal file is malformed.
+    """
+
+
+def open_journal(path, mode):
+    """
+    Open a journal file. Filenames that are not valid UTF-8 survive the round
+    trip.
+    """
+    return open(path, mode, newline='', encoding='utf-8',
+            errors='surrogateescape')
+
+
+def trim_torn_tail(path):
+    """
+    Cut off a last row that was only partly written when a run was killed.
+    Returns the number of bytes removed.
+    """
+    with open(path, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+            logger.warn("Removed partly written last row of {}.".format(
+                path))
+        return size - end
+
+
+class Journal(object):
+    """
+    Append records to a journal file and commit them in groups. Each move is
+    recorded done_record once made, RECORD_UNDONE when moves are undone.
+    """
+
+    def __init__(self, path, done_record=RECORD_DONE,
+            batch_size=JOURNAL_BATCH_SIZE):
+        self.path = path
+        self.done_record = done_record
+        self.batch_size = batch_size
+        if os.path.exists(path):
+            trim_torn_tail(path)
+        self.f = open_journal(path, 'a')
+        self.writer = csv.writer(self.f, delimiter='\t', lineterminator='\n')
+        if self.f.tell() == 0:
+            self.writer.writerow(JOURNAL_HEADER)
+        self.pending = []
+        self.directories = set()
+
+    def record(self, record, filemap):
+        """
+        Queue a record for filemap. Moves recorded done or undone mark the
+        directory of filemap for the next commit. filemap of an undone
+        record moves back, so the pair is recorded the way it was done.
+        """
+        src_fn = os.path.abspath(filemap.src_fn_fq)
+        dst_fn = os.path.abspath(filemap.dst_fn_fq)
+        if record == RECORD_UNDONE:
+            src_fn, dst_fn = dst_fn, src_fn
+        self.pending.append([record, src_fn, dst_fn])
+        if record != RECORD_INTENT:
+            self.directories.add(filemap.workdir)
+
+    def commit(self):
+        """
+        Make every queued record durable. The directories moved in are
+        flushed before the records saying the moves were made.
+        """
+        for directory in sorted(self.directories):
+            fsops.fsync_directory(directory)
+        self.directories.clear()
+        self.writer.writerows(self.pending)
+        self.pending = []
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def process(self, filemaps, move):
+        """
+        Call move(filemap) for each of filemaps that changes a name, batch
+        by batch. The intents of a batch are committed before its first move
+        and together with the done rows of the batch before. Undoing needs
+        no intents.
+        """
+        batch = []
+        for fm in filemaps:
+            if fm.src_fn_fq == fm.dst_fn_fq:
+                continue
+            batch.append(fm)
+            if len(batch) == self.batch_size:
+                self._process_batch(batch, move)
+                batch = []
+        if batch:
+            self._process_batch(batch, move)
+        self.commit()
+
+    def _process_batch(self, batch, move):
+        """
+        Commit the intents of batch, then move each filemap in it.
+        """
+        if self.done_record == RECORD_DONE:
+            for fm in batch:
+                self.record(RECORD_INTENT, fm)
+        if self.pending or self.directories:
+            self.commit()
+        for fm in batch:
+            if move(fm):
+                self.record(self.done_record, fm)
+
+    def close(self):
+        """
+        Commit what is queued and close the journal file.
+        """
+        if self.f is None:
+            return
+        try:
+            if self.pending or self.directories:
+                self.commit()
+        finally:
+            self.f.close()
+            self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def journal_rows(f):
+    """
+    Yield the complete lines of journal file object f. A last line without
+    a newline was torn by a crash and is left out.
+    """
+    for line in f:
+        if not line.endswith('\n'):
+            logger.warn("Ignoring partly written last row.")
+            return
+        yield line
+
+
+def read_journal(path):
+    """
+    Return the last record of every src and dst pair in journal file path as
+    Entry tuples, oldest first.
+    """
+    entries = OrderedDict()
+    errors = []
+    with open_journal(path, 'r') as f:
+        reader = csv.reader(journal_rows(f), delimiter='\t')
+        if next(reader, None) != JOURNAL_HEADER:
+            raise JournalError("{} is not a rename journal.".format(path))
+        for row in reader:
+            if len(row) != len(JOURNAL_HEADER) or row[0] not in RECORDS:
+                errors.append(reader.line_num)
+                continue
+            record, src, dst = row
+            entries.pop((src, dst), None)
+            entries[(src, dst)] = Entry(src, dst, record)
+    if errors:
+        raise JournalError("Malformed journal rows on lines: {}".format(
+            ", ".join(str(lineno) for lineno in errors)))
+    return list(entries.values())
+
+
+def journal_filemap(src_fn, dst_fn):
+    """
+    Return a Filemap moving src_fn to dst_fn without reading metadata.
+    """
+    ext = os.path.splitext(src_fn)[1][1:].lower()
+    image_type = photo_rename.EXTENSION_TO_IMAGE_TYPE.get(
+            ext, photo_rename.IMAGE_TYPE_JPEG)
+    return Filemap(src_fn, image_type, dst_fn=os.path.basename(dst_fn),
+            read_metadata=False)
+
+
+def pending_moves(entries):
+    """
+    Split the moves of entries that were intended but not recorded done.
+    Returns a FilemapStream of those still to make and a list of those made
+    before the run was killed.
+
+    The intents are replayed in journal order against the names on disk,
+    updated after each move still to make, so a chain or a cycle moving a
+    name on that a later move takes is told apart right. Moves are made in
+    journal order, so one where both names exist was made if a later one
+    was. Other moves where neither or both names exist are left alone.
+    """
+    names = {}
+
+    def exists(path):
+        if path not in names:
+            names[path] = os.path.lexists(path)
+        return names[path]
+
+    to_move = []
+    moved = []
+    # (filemap, both names exist) of moves not told apart yet.
+    unsure = []
+    for entry in entries:
+        if entry.record != RECORD_INTENT:
+            continue
+        src_exists = exists(entry.src)
+        dst_exists = exists(entry.dst)
+        fm = journal_filemap(entry.src, entry.dst)
+        if src_exists and not dst_exists:
+            to_move.append(fm)
+            names[entry.src] = False
+            names[entry.dst] = True
+        elif dst_exists and not src_exists:
+            moved.extend(fm for fm, both in unsure if both)
+            unsure = [(fm, both) for fm, both in unsure if not both]
+            moved.append(fm)
+        else:
+            unsure.append((fm, src_exists))
+    for fm, _ in unsure:
+        logger.warn("Unable to tell if {} was moved to {}.".format(
+            fm.src_fn_fq, fm.dst_fn_fq))
+    return FilemapStream(to_move), moved
+
+
+def undo_moves(entries):
+    """
+    Return a FilemapStream moving back every move of entries recorded done,
+    latest first.
+    """
+    return FilemapStream([journal_filemap(entry.dst, entry.src)
+        for entry in reversed(entries) if entry.record == RECORD_DONE])
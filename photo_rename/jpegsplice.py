@@ -0,0 +1,164 @@
+"""
+Replace the metadata of a JPEG file without rewriting its image data. Only
+the segments before the start of scan are handed to pyexiv2. The entropy
+coded data that follows is copied into the new file by the kernel with
+copy_file_range() or sendfile() where available, and the new file replaces
+the old one with an atomic rename.
+"""
+import logging
+import os
+import shutil
+import stat
+import struct
+import tempfile
+import pyexiv2
+from photo_rename.fastread import JPEG_EOI, JPEG_SOI, JPEG_SOS
+
+
+logger = logging.getLogger(__name__)
+
+# Bytes handed to one copy_file_range() or sendfile() call.
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class SpliceError(Exception):
+    """
+    The file could not be spliced. Nothing was changed.
+    """
+
+
+def find_scan(f):
+    """
+    Return the offset of the start of scan marker of JPEG file object f.
+    Every segment before it is metadata or table data small enough to read.
+    """
+    try:
+        if f.read(2) != JPEG_SOI:
+            raise SpliceError("Not a JPEG file.")
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise SpliceError("Bad JPEG marker.")
+            code = marker[1]
+            # Fill bytes and markers without a length.
+            if code == 0xFF:
+                f.seek(-1, 1)
+                continue
+            if code == 0x01 or 0xD0 <= code <= 0xD7:
+                continue
+            if code == JPEG_SOS:
+                return f.tell() - 2
+            if code == JPEG_EOI:
+                raise SpliceError("No image data found.")
+            length, = struct.unpack('>H', f.read(2))
+            if length < 2:
+                raise SpliceError("Bad JPEG segment length.")
+            f.seek(length - 2, 1)
+    except struct.error as e:
+        raise SpliceError(e)
+
+
+def copy_range(src_fd, dst_fd, offset, count):
+    """
+    Copy count bytes from offset of src_fd to the current position of
+    dst_fd. Uses copy_file_range(), then sendfile(), then plain reads and
+    writes, whichever works first.
+    """
+    start = offset
+    end = offset + count
+    copiers = [copier for copier in [
+        getattr(os, 'copy_file_range', None),
+        _sendfile if hasattr(os, 'sendfile') else None] if copier]
+    while offset < end and copiers:
+        size = min(COPY_CHUNK_SIZE, end - offset)
+        try:
+            copied = copiers[0](src_fd, dst_fd, size, offset)
+        except OSError as e:
+            if offset != start:
+                raise
+            # Not supported for these files. Try the next way.
+            logger.debug("Kernel copy failed: {}".format(e))
+            copiers.pop(0)
+            continue
+        if copied == 0:
+            raise SpliceError("File shrank while copying.")
+        offset += copied
+
+    if offset < end:
+        with os.fdopen(os.dup(src_fd), 'rb') as src:
+            with os.fdopen(os.dup(dst_fd), 'wb') as dst:
+                src.seek(offset)
+                remaining = end - offset
+                while remaining:
+                    data = src.read(min(shutil.COPY_BUFSIZE, remaining))
+                    if not data:
+                        raise SpliceError("File shrank while copying.")
+                    dst.write(data)
+                    remaining -= len(data)
+
+
+def _sendfile(src_fd, dst_fd, count, offset):
+    """
+    sendfile() with the arguments in copy_file_range() order.
+    """
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def build_header(header, img_md, comment=True):
+    """
+    Return the segments before the start of scan with the metadata of
+    pyexiv2 ImageMetadata img_md copied in. header is the same part of the
+    target file. pyexiv2 is given header followed by EOI so it never sees
+    the image data.
+    """
+    tgt_md = pyexiv2.ImageMetadata.from_buffer(header + b'\xff\xd9')
+    tgt_md.read()
+    img_md.copy(tgt_md, exif=True, iptc=True, xmp=True, comment=comment)
+    tgt_md.write()
+    new_header = bytes(tgt_md.buffer)
+    if not (new_header.startswith(JPEG_SOI) and
+            new_header.endswith(b'\xff\xd9')):
+        raise SpliceError("Unexpected JPEG written by pyexiv2.")
+    return new_header[:-2]
+
+
+def splice(filename, build):
+    """
+    Replace the segments before the start of scan of JPEG filename with
+    build(header) and keep the rest. The result is written to a temporary
+    file next to filename that is fsynced and renamed over it.
+    """
+    directory = os.path.dirname(filename)
+    with open(filename, 'rb') as src:
+        st = os.fstat(src.fileno())
+        scan = find_scan(src)
+        src.seek(0)
+        header = src.read(scan)
+        new_header = build(header)
+
+        fd, tmp_fn = tempfile.mkstemp(
+                prefix='.{}.'.format(os.path.basename(filename)),
+                suffix='.tmp', dir=directory or os.curdir)
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                dst.write(new_header)
+                dst.flush()
+                copy_range(src.fileno(), dst.fileno(), scan,
+                        st.st_size - scan)
+                os.fchmod(dst.fileno(), stat.S_IMODE(st.st_mode))
+                # The new file must be on disk before it replaces the old.
+                os.fsync(dst.fileno())
+            os.replace(tmp_fn, filename)
+        except BaseException:
+            os.unlink(tmp_fn)
+            raise
+    logger.debug("Spliced {} bytes of metadata into {}.".format(
+        len(new_header), filename))
+
+
+def copy_metadata(img_md, tgt_fn):
+    """
+    Copy exif, iptc, xmp and comment from pyexiv2 ImageMetadata img_md to
+    JPEG file tgt_fn without pyexiv2 rewriting its image data.
+    """
+    splice(tgt_fn, lambda header: build_header(header, img_md))
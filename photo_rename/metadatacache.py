@@ -0,0 +1,291 @@
+"""
+Persistent metadata cache. Extracted tag dicts are stored in SQLite keyed by
+(st_dev, st_ino, st_size, st_mtime_ns) so a file is only parsed again when it
+changes. Read failures that come from the file content such as "has no EXIF
+data" or a file libexiv2 cannot parse are cached too. Errors such as a full
+disk or a vanished file are not.
+"""
+import errno
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 500000
+
+# errno of read failures that say nothing about the file content. Never
+# cached. libexiv2 reports files it cannot parse as IOError without one.
+TRANSIENT_ERRNOS = frozenset([errno.ENOENT, errno.EACCES, errno.EPERM,
+    errno.EIO, errno.ENOSPC, errno.EINTR])
+
+# Module level cache used by Filemap and FileMetadata. None when disabled.
+_cache = None
+
+
+def default_cache_path():
+    """
+    Return cache path under XDG_CACHE_HOME or ~/.cache.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME',
+            os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'photo_rename', 'metadata.sqlite')
+
+
+class CachedReadError(Exception):
+    """
+    A read failure remembered from an earlier run.
+    """
+
+
+def is_transient(error):
+    """
+    Return True if read failure error may not happen on the next read.
+
+    >>> is_transient(IOError(errno.EIO, "Input/output error"))
+    True
+    >>> is_transient(IOError("Failed to read input data"))
+    False
+    """
+    if isinstance(error, MemoryError):
+        return True
+    return isinstance(error, OSError) and error.errno in TRANSIENT_ERRNOS
+
+
+class MetadataCache(object):
+    """
+    SQLite-backed cache of metadata dicts with LRU eviction down to
+    max_entries when closed. Hits are remembered in memory and their
+    last_used time written in one go before evicting. Safe to share between
+    threads. A forked worker process opens its own connection on first use.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.touched = {}
+        self.lock = threading.Lock()
+        self.pid = None
+        self.db = None
+        # Connections inherited through fork(). Never closed in the child.
+        self.inherited = []
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connect()
+
+    def connect(self):
+        """
+        Open the database for this process and create the table.
+        """
+        # Autocommit so no process holds the write lock between statements.
+        self.db = sqlite3.connect(self.path, timeout=30,
+                isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,"
+            " kind TEXT, metadata TEXT, error TEXT, last_used REAL,"
+            " PRIMARY KEY (dev, ino, size, mtime_ns, kind))")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS metadata_last_used"
+            " ON metadata (last_used)")
+        self.pid = os.getpid()
+
+    def connection(self):
+        """
+        Return the connection for the current process. A forked child keeps
+        a reference to the parent's connection, so it is never finalized
+        there, and opens its own.
+        """
+        if self.pid != os.getpid():
+            self.inherited.append(self.db)
+            self.connect()
+        return self.db
+
+    @staticmethod
+    def stat_key(filename, st=None):
+        """
+        Return the (dev, ino, size, mtime_ns) key for filename. st may be an
+        os.stat_result or os.DirEntry already at hand, saving the stat.
+        """
+        if st is None:
+            st = os.stat(filename)
+        elif not isinstance(st, os.stat_result):
+            st = st.stat()
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def fetch(self, filename, kind, read, st=None):
+        """
+        Return metadata for filename from the cache, or call read() and store
+        the result. kind separates different reads of the same file. st is
+        passed on to stat_key(). A cached failure raises CachedReadError.
+        """
+        try:
+            key = self.stat_key(filename, st)
+        except OSError:
+            return read()
+
+        with self.lock:
+            row = self.connection().execute(
+                "SELECT metadata, error FROM metadata WHERE dev=? AND ino=?"
+                " AND size=? AND mtime_ns=? AND kind=?",
+                key + (kind,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.touched[key + (kind,)] = time.time()
+            else:
+                self.misses += 1
+
+        if row is not None:
+            metadata, error = row
+            if error is not None:
+                raise CachedReadError(error)
+            return json.loads(metadata)
+
+        try:
+            metadata = read()
+        except Exception as e:
+            # Only remember what is a property of the file content.
+            if not is_transient(e):
+                self.store(key, kind, None, str(e))
+            raise
+        self.store(key, kind, metadata, None)
+        return metadata
+
+    def store(self, key, kind, metadata, error):
+        """
+        Insert or replace one entry.
+        """
+        if metadata is not None:
+            metadata = json.dumps(metadata)
+        with self.lock:
+            self.connection().execute(
+                "INSERT OR REPLACE INTO metadata"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (kind, metadata, error, time.time()))
+
+    def flush_touched(self):
+        """
+        Write the last_used time of every hit since the last flush.
+        """
+        with self.lock:
+            if not self.touched:
+                return
+            self.connection().executemany(
+                "UPDATE metadata SET last_used=? WHERE dev=? AND ino=?"
+                " AND size=? AND mtime_ns=? AND kind=?",
+                [(used,) + entry for entry, used in self.touched.items()])
+            self.touched = {}
+
+    def invalidate(self, filename, st=None):
+        """
+        Drop every entry for the current stat of filename. A file patched
+        in place keeps its size, and on a filesystem with coarse mtime its
+        key too. st is passed on to stat_key().
+        """
+        try:
+            key = self.stat_key(filename, st)
+        except OSError:
+            return
+        with self.lock:
+            self.connection().execute(
+                "DELETE FROM metadata WHERE dev=? AND ino=? AND size=?"
+                " AND mtime_ns=?", key)
+
+    def evict(self):
+        """
+        Drop least recently used entries beyond max_entries.
+        """
+        self.flush_touched()
+        with self.lock:
+            db = self.connection()
+            count, = db.execute("SELECT COUNT(*) FROM metadata").fetchone()
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM metadata WHERE rowid IN (SELECT rowid FROM"
+                    " metadata ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,))
+
+    def take_counters(self):
+        """
+        Return (hits, misses, touched) and reset them. Used to collect
+        counters and the entries hit from worker processes.
+        """
+        with self.lock:
+            counters = (self.hits, self.misses, self.touched)
+            self.hits = 0
+            self.misses = 0
+            self.touched = {}
+        return counters
+
+    def add_counters(self, counters):
+        """
+        Add (hits, misses, touched) from a worker process.
+        """
+        with self.lock:
+            self.hits += counters[0]
+            self.misses += counters[1]
+            for entry, used in counters[2].items():
+                self.touched[entry] = max(used, self.touched.get(entry, 0))
+
+    def close(self):
+        """
+        Evict, log hit and miss counters and close the database.
+        """
+        self.evict()
+        logger.info("Metadata cache: {} hits, {} misses.".format(
+            self.hits, self.misses))
+        self.db.close()
+
+
+def open_cache(path=None, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Enable the module level cache.
+    """
+    global _cache
+    if path is None:
+        path = default_cache_path()
+    _cache = MetadataCache(path, max_entries)
+    return _cache
+
+
+def get_cache():
+    """
+    Return the module level cache or None if disabled.
+    """
+    return _cache
+
+
+def close_cache():
+    """
+    Close and disable the module level cache if open.
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+def invalidate(filename, st=None):
+    """
+    Drop the entries for filename from the module level cache if enabled.
+    """
+    if _cache is not None:
+        _cache.invalidate(filename, st)
+
+
+def cached(filename, kind, read, st=None):
+    """
+    Return read() through the module level cache if enabled.
+    """
+    if _cache is None:
+        return read()
+    return _cache.fetch(filename, kind, read, st)
@@ -0,0 +1,155 @@
+"""
+Rename plans. pz_rename --plan-out writes the moves a run would make to a tab
+separated file and pz_rename --apply carries them out later without reading
+any metadata. Each row holds the source and destination, the stat
+fingerprint of the source when the plan was made and why the destination was
+chosen. A source that changed since is skipped when the plan is applied. The
+last move of a mapfile rename cycle starts from a temporary name that does
+not exist yet when the plan is made, so its row has no fingerprint.
+"""
+from collections import namedtuple
+import csv
+import logging
+import os
+import photo_rename
+from photo_rename import Filemap, FilemapStream
+from photo_rename.harvester import TEMP_FN_REGEX
+
+
+logger = logging.getLogger(__name__)
+
+PLAN_HEADER = ['src', 'dst', 'dev', 'ino', 'size', 'mtime_ns', 'reason']
+
+# Why a file gets its new name.
+REASON_DATETIME = 'datetime'
+REASON_EXTENSION = 'extension'
+REASON_COLLISION = 'collision'
+REASON_MAPFILE = 'mapfile'
+
+# The part of os.stat_result Filemap.revalidate() compares.
+Fingerprint = namedtuple(
+        'Fingerprint', ['st_dev', 'st_ino', 'st_size', 'st_mtime_ns'])
+
+
+class PlanError(Exception):
+    """
+    The plan file is malformed.
+    """
+
+
+def reason(filemap, mapfile=False):
+    """
+    Return why filemap is renamed to its dst_fn.
+
+    >>> reason(Filemap('IMG0332.JPG', photo_rename.IMAGE_TYPE_JPEG, metadata={}))
+    'extension'
+    """
+    if mapfile:
+        return REASON_MAPFILE
+    if filemap.dst_fn != filemap.build_dst_fn():
+        return REASON_COLLISION
+    if filemap.dst_fn_datetime() is not None:
+        return REASON_DATETIME
+    return REASON_EXTENSION
+
+
+def open_plan(path, mode):
+    """
+    Open a plan file. Filenames that are not valid UTF-8 survive the round
+    trip.
+    """
+    return open(path, mode, newline='', encoding='utf-8',
+            errors='surrogateescape')
+
+
+class PlanWriter(object):
+    """
+    Write plan rows for filemaps that change a name.
+    """
+
+    def __init__(self, f, mapfile=False):
+        self.writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        self.writer.writerow(PLAN_HEADER)
+        self.mapfile = mapfile
+        self.count = 0
+
+    def add(self, filemap):
+        """
+        Add a row for filemap with absolute paths, so the plan can be
+        applied from any directory. Returns False if there is nothing to
+        move or the source cannot be stat'ed. A source under a temporary
+        name gets no fingerprint.
+        """
+        if filemap.src_fn == filemap.dst_fn:
+            return False
+        if TEMP_FN_REGEX.match(filemap.src_fn):
+            fingerprint = ['', '', '', '']
+        else:
+            st = filemap.src_stat
+            if st is None:
+                try:
+                    st = os.stat(filemap.src_fn_fq)
+                except OSError as e:
+                    logger.warn("Unable to stat {}: {}".format(
+                        filemap.src_fn, e.strerror))
+                    return False
+            fingerprint = [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+        self.writer.writerow([
+            os.path.abspath(filemap.src_fn_fq),
+            os.path.abspath(filemap.dst_fn_fq)] + fingerprint +
+            [reason(filemap, self.mapfile)])
+        self.count += 1
+        logger.info("PLAN: Moving {0} ==> {1}".format(
+            filemap.src_fn, filemap.dst_fn))
+        return True
+
+    def extend(self, file_map):
+        """
+        Add a row for every filemap of a FilemapList or FilemapStream.
+        """
+        for filemap in file_map.get():
+            self.add(filemap)
+
+
+def read_plan(path):
+    """
+    Return a FilemapStream with a Filemap for every row of plan file path in
+    plan order. Each carries the fingerprint as its stat_result. The whole
+    plan is checked before anything is returned.
+    """
+    filemaps = []
+    errors = []
+    with open_plan(path, 'r') as f:
+        reader = csv.reader(f, delimiter='\t')
+        if next(reader, None) != PLAN_HEADER:
+            raise PlanError("{} is not a rename plan.".format(path))
+        for row in reader:
+            try:
+                filemaps.append(plan_filemap(row))
+            except (ValueError, KeyError):
+                errors.append(reader.line_num)
+    if errors:
+        raise PlanError("Malformed plan rows on lines: {}".format(
+            ", ".join(str(lineno) for lineno in errors)))
+    return FilemapStream(filemaps)
+
+
+def plan_filemap(row):
+    """
+    Return the Filemap for one plan row. Raises ValueError or KeyError if
+    the row is malformed. A row from a temporary name without a fingerprint
+    is not checked before the move.
+    """
+    src_fn, dst_fn, dev, ino, size, mtime_ns, _ = row
+    if os.path.dirname(src_fn) != os.path.dirname(dst_fn):
+        raise ValueError("Source and destination directories differ.")
+    ext = os.path.splitext(src_fn)[1][1:].lower()
+    image_type = photo_rename.EXTENSION_TO_IMAGE_TYPE[ext]
+    if (TEMP_FN_REGEX.match(os.path.basename(src_fn)) and
+            (dev, ino, size, mtime_ns) == ('', '', '', '')):
+        fingerprint = None
+    else:
+        fingerprint = Fingerprint(
+                int(dev), int(ino), int(size), int(mtime_ns))
+    return Filemap(src_fn, image_type, dst_fn=os.path.basename(dst_fn),
+            read_metadata=False, stat_result=fingerprint)
@@ -6,16 +6,29 @@ import stat
 import sys
 import pyexiv2
 import photo_rename
-from photo_rename import Harvester
+from photo_rename import FilemapStream, Harvester, metadatacache
+from photo_rename.journal import (
+        RECORD_DONE, RECORD_UNDONE, Journal, JournalError, pending_moves,
+        read_journal, undo_moves)
+from photo_rename.plan import PlanError, PlanWriter, open_plan, read_plan
 
 
 logger = logging.getLogger(__name__)
 
 
 def process_all_files(
-        workdir=None, simon_sez=None, mapfile=None):
+        workdir=None, simon_sez=None, mapfile=None, jobs=None,
+        recursive=False, stream=False, plan_out=None, journal=None,
+        naming=None, mapfile_mmap=False):
     """
-    Manage the entire process of gathering data and renaming files.
+    Manage the entire process of gathering data and renaming files. Metadata
+    is read with jobs threads if given. With recursive every directory below
+    workdir is renamed too, each one on its own. With stream each file is
+    moved as soon as its new name is known. With plan_out nothing is moved
+    and the moves are written to that plan file instead. With journal the
+    moves are recorded in that journal file. naming is one of
+    photo_rename.NAMING_SCHEMES. With mapfile_mmap the mapfile is memory
+    mapped.
     """
     if not os.path.exists(workdir):
         logging.error(
@@ -27,9 +40,121 @@ def process_all_files(
                 "Directory {0} is not writable. Exiting.".format(workdir))
         sys.exit(1)
 
-    harvester = Harvester(workdir, mapfile)
-    file_map = harvester["filemaps"]
-    harvester.process_file_map(file_map, simon_sez)
+    harvester = Harvester(workdir, mapfile, workers=jobs, recursive=recursive,
+            naming=naming, mapfile_mmap=mapfile_mmap)
+    if plan_out:
+        write_plan(harvester, plan_out, stream)
+        return
+    rename_journal = None
+    if simon_sez and journal:
+        rename_journal = open_rename_journal(journal)
+    try:
+        if stream:
+            harvester.process_file_map(
+                    FilemapStream(harvester.stream_filemaps()), simon_sez,
+                    journal=rename_journal)
+            return
+        for directory, file_map in harvester["directory_filemaps"]:
+            harvester.process_file_map(file_map, simon_sez,
+                    journal=rename_journal)
+    finally:
+        if rename_journal is not None:
+            rename_journal.close()
+
+
+def write_plan(harvester, plan_out, stream=False):
+    """
+    Write the moves harvester would make to plan file plan_out.
+    """
+    with open_plan(plan_out, 'w') as f:
+        writer = PlanWriter(f, mapfile=bool(harvester.mapfile))
+        if stream:
+            writer.extend(FilemapStream(harvester.stream_filemaps()))
+        else:
+            for directory, file_map in harvester["directory_filemaps"]:
+                writer.extend(file_map)
+    logging.info("Wrote {} moves to plan {}.".format(writer.count, plan_out))
+
+
+def apply_plan(plan, simon_sez=None, journal=None):
+    """
+    Carry out the moves in plan file plan. No metadata is read. Each source
+    is stat'ed once and skipped if it changed since the plan was written.
+    With journal the moves are recorded in that journal file.
+    """
+    try:
+        file_map = read_plan(plan)
+    except (PlanError, OSError) as e:
+        logging.error("{} Exiting.".format(e))
+        sys.exit(1)
+    harvester = Harvester(os.path.dirname(os.path.abspath(plan)))
+    if not (simon_sez and journal):
+        harvester.process_file_map(file_map, simon_sez)
+        return
+    with open_rename_journal(journal) as rename_journal:
+        harvester.process_file_map(file_map, simon_sez,
+                journal=rename_journal)
+
+
+def open_rename_journal(journal, done_record=RECORD_DONE):
+    """
+    Open journal file journal for appending. Exits if it cannot be opened.
+    """
+    try:
+        return Journal(journal, done_record)
+    except OSError as e:
+        logging.error("Unable to open journal {}: {} Exiting.".format(
+            journal, e.strerror))
+        sys.exit(1)
+
+
+def read_rename_journal(journal):
+    """
+    Return the entries of journal file journal. Exits if it is malformed.
+    """
+    try:
+        return read_journal(journal)
+    except (JournalError, OSError) as e:
+        logging.error("{} Exiting.".format(e))
+        sys.exit(1)
+
+
+def resume_journal(journal, simon_sez=None):
+    """
+    Finish the moves journal file journal recorded as intended but not done
+    when a run was killed. Moves that were made but not yet recorded are
+    recorded done.
+    """
+    file_map, moved = pending_moves(read_rename_journal(journal))
+    harvester = Harvester(os.path.dirname(os.path.abspath(journal)))
+    if not simon_sez:
+        for fm in moved:
+            logging.info("DRY RUN: Recording {0} ==> {1} as done.".format(
+                fm.src_fn, fm.dst_fn))
+        harvester.process_file_map(file_map, simon_sez)
+        return
+    with open_rename_journal(journal) as rename_journal:
+        for fm in moved:
+            logging.info("Recording {0} ==> {1} as done.".format(
+                fm.src_fn, fm.dst_fn))
+            rename_journal.record(RECORD_DONE, fm)
+        harvester.process_file_map(file_map, simon_sez,
+                journal=rename_journal)
+
+
+def undo_journal(journal, simon_sez=None):
+    """
+    Move back every move journal file journal recorded done, latest first.
+    No metadata is read.
+    """
+    file_map = undo_moves(read_rename_journal(journal))
+    harvester = Harvester(os.path.dirname(os.path.abspath(journal)))
+    if not simon_sez:
+        harvester.process_file_map(file_map, simon_sez)
+        return
+    with open_rename_journal(journal, RECORD_UNDONE) as rename_journal:
+        harvester.process_file_map(file_map, simon_sez,
+                journal=rename_journal)
 
 
 def main():
@@ -41,8 +166,36 @@ def main():
             help="Really, Simon sez rename the files!", action="store_true")
     parser.add_argument("-d", "--directory",
             help="Read files from this directory.")
+    parser.add_argument("-r", "--recursive", action="store_true",
+            help="Also rename files in every directory below.")
     parser.add_argument("-m", "--mapfile",
             help="Use this map to rename files. Do not use metadata.")
+    parser.add_argument("--mmap", action="store_true",
+            help="Memory map --mapfile instead of reading it.")
+    parser.add_argument("-j", "--jobs", type=int,
+            help="Read metadata using this many threads.")
+    parser.add_argument("--stream", action="store_true",
+            help="Move each file as soon as it is named.")
+    parser.add_argument("--naming", choices=photo_rename.NAMING_SCHEMES,
+            default=photo_rename.NAMING_SEQUENCE,
+            help="Tell apart files of the same second by sequence number, "
+                "milliseconds or content digest. Default {}.".format(
+                    photo_rename.NAMING_SEQUENCE))
+    parser.add_argument("--plan-out",
+            help="Write the moves to this plan file instead of moving.")
+    parser.add_argument("--apply",
+            help="Carry out the moves in this plan file.")
+    parser.add_argument("--journal",
+            help="Record the moves in this journal file.")
+    parser.add_argument("--resume", action="store_true",
+            help="Finish the moves left pending in --journal first.")
+    parser.add_argument("--undo",
+            help="Move back the moves recorded in this journal file.")
+    parser.add_argument("--no-cache", action="store_true",
+            help="Do not use the persistent metadata cache.")
+    parser.add_argument("--cache-path",
+            help="Metadata cache file. Default {}.".format(
+                metadatacache.default_cache_path()))
     parser.add_argument("-v", "--verbose", help="Log level to DEBUG.",
             action="store_true")
     myargs = parser.parse_args()
@@ -61,6 +214,12 @@ def main():
 
     # Validate --map
     mapfile = myargs.mapfile
+    if mapfile and myargs.recursive:
+        logging.error("May not specify --recursive with --mapfile.")
+        sys.exit(1)
+    if myargs.mmap and not mapfile:
+        logging.error("May not specify --mmap without --mapfile.")
+        sys.exit(1)
     if mapfile:
         # --map is not compatible with --avoid-collisions.
         error = False
@@ -79,8 +238,50 @@ def main():
             logging.error("Exiting due to errors.")
             sys.exit(1)
 
-    process_all_files(workdir=workdir, simon_sez=myargs.simon_sez,
-            mapfile=mapfile)
+    if myargs.jobs is not None and myargs.jobs < 1:
+        logging.error("--jobs must be at least 1.")
+        sys.exit(1)
+
+    if myargs.plan_out and myargs.simon_sez:
+        logging.error("May not specify --simon-sez with --plan-out.")
+        sys.exit(1)
+
+    if myargs.resume and not myargs.journal:
+        logging.error("May not specify --resume without --journal.")
+        sys.exit(1)
+
+    if myargs.undo:
+        if (myargs.directory or mapfile or myargs.recursive or
+                myargs.stream or myargs.plan_out or myargs.apply or
+                myargs.journal):
+            logging.error("May only specify --simon-sez with --undo.")
+            sys.exit(1)
+        undo_journal(myargs.undo, myargs.simon_sez)
+        return
+
+    if myargs.apply:
+        if (myargs.directory or mapfile or myargs.recursive or
+                myargs.stream or myargs.plan_out or myargs.resume):
+            logging.error(
+                    "May only specify --simon-sez and --journal with "
+                    "--apply.")
+            sys.exit(1)
+        apply_plan(myargs.apply, myargs.simon_sez, journal=myargs.journal)
+        return
+
+    if myargs.resume:
+        resume_journal(myargs.journal, myargs.simon_sez)
+
+    if not myargs.no_cache:
+        metadatacache.open_cache(myargs.cache_path)
+    try:
+        process_all_files(workdir=workdir, simon_sez=myargs.simon_sez,
+                mapfile=mapfile, jobs=myargs.jobs, recursive=myargs.recursive,
+                stream=myargs.stream, plan_out=myargs.plan_out,
+                journal=myargs.journal, naming=myargs.naming,
+                mapfile_mmap=myargs.mmap)
+    finally:
+        metadatacache.close_cache()
 
 
 if __name__ == '__main__':  # pragma: no cover
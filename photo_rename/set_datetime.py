@@ -8,15 +8,51 @@ import sys
 import pyexiv2
 import photo_rename
 from photo_rename import Filemap, FilemapList, FileMetadata, Harvester
+from photo_rename.filemetadata import SET_DATETIME_TAGS
+import photo_rename.sidecar
+from photo_rename.executor import (
+        TaskResult, log_summary, run_batches, run_tasks)
 from photo_rename.utils import CustomArgumentParser
 
 
 logger = logging.getLogger(__name__)
 
 
-def process_all_files(workdir, initial_dt, interval, simon_sez=None):
+def set_datetime_task(task):
     """
-    Manage the entire process of gathering data and renaming files.
+    Set the datetime on one file. Runs in a worker process when --jobs is
+    given. Returns a TaskResult.
+    """
+    fn_fq, this_dt, simon_sez, in_place, sidecar = task
+    fn = os.path.basename(fn_fq)
+    ok = True
+    try:
+        fmd = FileMetadata(fn_fq, tags=SET_DATETIME_TAGS)
+
+        # Set the date and time
+        msg = "Set datetime: {} : {}".format(
+                fn, this_dt.strftime('%Y:%m:%d %H:%M:%S'))
+        if simon_sez and sidecar:
+            ok = fmd.set_datetime_sidecar(this_dt) is not False
+        elif simon_sez:
+            ok = fmd.set_datetime(
+                    this_dt, in_place=in_place) is not False
+        else:
+            msg = "DRY RUN: {}".format(msg)
+        logger.info(msg)
+    except Exception as e:
+        logger.error("{}: {}".format(fn, e))
+        return TaskResult(fn, False, str(e))
+    return TaskResult(fn, ok, None if ok else "Write failed.")
+
+
+def process_all_files(workdir, initial_dt, interval, simon_sez=None,
+        jobs=None, in_place=False, sidecar=False):
+    """
+    Manage the entire process of gathering data and renaming files. Files are
+    written by jobs processes if given. With in_place EXIF tags are patched
+    in the files where possible. With sidecar XMP sidecars are written in
+    batches instead of the files. Returns a TaskResult per file.
     """
     error = False
 
@@ -36,30 +72,26 @@ def process_all_files(workdir, initial_dt, interval, simon_sez=None):
         sys.exit(1)
     else:
         start_datetime = datetime.strptime(initial_dt, '%Y-%m-%d %H:%M:%S')
-        counter = 0
 
         harvester = Harvester(workdir)
         files = harvester["files"]
-
-        fmds = []
-        for fn in files:
-            # Compute delta. Add to start_datetime.
+        if sidecar:
+            # Both images of a RAW+JPEG pair get the datetime of the first.
+            files = photo_rename.sidecar.one_per_sidecar(files)
+
+        # Compute delta from each file's position in the sorted list. Add to
+        # start_datetime.
+        tasks = []
+        for counter, fn in enumerate(files):
             dt_delta = counter * interval
             this_dt = start_datetime + timedelta(0, dt_delta)
+            tasks.append((os.path.join(workdir, fn), this_dt, simon_sez,
+                in_place, sidecar))
 
-            fmd = FileMetadata(os.path.join(workdir, fn))
-            fmds.append(fmd)
-
-            # Set the date and time
-            msg = "Set datetime: {} : {}".format(
-                    fn, this_dt.strftime('%Y:%m:%d %H:%M:%S'))
-            if simon_sez:
-                fmd.set_datetime(this_dt)
-            else:
-                msg = "DRY RUN: {}".format(msg)
-            logger.info(msg)
-
-            counter += 1
+        if sidecar:
+            return log_summary(run_batches(set_datetime_task, tasks,
+                photo_rename.sidecar.batch, jobs=jobs))
+        return log_summary(run_tasks(set_datetime_task, tasks, jobs=jobs))
 
 
 def main():
@@ -75,6 +107,13 @@ def main():
             help="Initial datetime YYYY-mm-DD HH:MM:SS.")
     parser.add_argument("-i", "--interval",
             help="Interval in seconds to use for successive files.")
+    parser.add_argument("-j", "--jobs", type=int,
+            help="Write files using this many processes.")
+    parser.add_argument("--in-place", action="store_true",
+            help="Patch EXIF datetimes in the file instead of rewriting it"
+            " where possible.")
+    parser.add_argument("--sidecar", action="store_true",
+            help="Write XMP sidecar files instead of changing the images.")
     parser.add_argument("-v", "--verbose", help="Log level to DEBUG.",
             action="store_true")
     args = parser.parse_args()
@@ -110,13 +149,23 @@ def main():
     else:
         interval = int(args.interval)
 
+    if args.jobs is not None and args.jobs < 1:
+        logger.error("--jobs must be at least 1.")
+        error = True
+
+    if args.sidecar and args.in_place:
+        logger.error("--sidecar cannot be used with --in-place.")
+        error = True
+
     if error:
         logger.error("Exiting due to errors.")
         parser.usage_message()
         sys.exit(1)
     else:
         process_all_files(
-                workdir, args.datetime, interval, simon_sez=args.simon_sez)
+                workdir, args.datetime, interval, simon_sez=args.simon_sez,
+                jobs=args.jobs, in_place=args.in_place,
+                sidecar=args.sidecar)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -0,0 +1,394 @@
+"""
+XMP sidecar files. Metadata is written to <stem>.xmp next to the image so
+large originals are never rewritten. Packets are built with ElementTree, not
+libexiv2. An existing sidecar is updated and keeps the properties it already
+has. Inside batch() every sidecar of a directory is written relative to one
+open directory descriptor.
+"""
+import contextlib
+import io
+import logging
+import os
+import xml.etree.ElementTree as ET
+from photo_rename import fsops
+
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_EXTENSION = 'xmp'
+
+# Prefixes as used in pyexiv2 keys, e.g. Xmp.iptc.Location.
+XMP_NAMESPACES = {
+    'x': 'adobe:ns:meta/',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'aux': 'http://ns.adobe.com/exif/1.0/aux/',
+    'crs': 'http://ns.adobe.com/camera-raw-settings/1.0/',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'exif': 'http://ns.adobe.com/exif/1.0/',
+    'exifEX': 'http://cipa.jp/exif/1.0/',
+    'iptc': 'http://iptc.org/std/Iptc4xmpCore/1.0/xmlns/',
+    'lr': 'http://ns.adobe.com/lightroom/1.0/',
+    'photoshop': 'http://ns.adobe.com/photoshop/1.0/',
+    'tiff': 'http://ns.adobe.com/tiff/1.0/',
+    'xmp': 'http://ns.adobe.com/xap/1.0/',
+    'xmpMM': 'http://ns.adobe.com/xap/1.0/mm/',
+    'xmpRights': 'http://ns.adobe.com/xap/1.0/rights/',
+}
+
+for _prefix, _uri in XMP_NAMESPACES.items():
+    ET.register_namespace(_prefix, _uri)
+
+# Ordered arrays. Other lists are written as rdf:Bag.
+SEQ_PROPERTIES = {'dc:creator', 'dc:date', 'exif:ISOSpeedRatings'}
+
+# EXIF tags with a simple XMP equivalent, following the Metadata Working
+# Group mapping for the dates.
+EXIF_TO_XMP = {
+    'Exif.Image.DateTime': 'xmp:ModifyDate',
+    'Exif.Image.Make': 'tiff:Make',
+    'Exif.Image.Model': 'tiff:Model',
+    'Exif.Image.Orientation': 'tiff:Orientation',
+    'Exif.Image.Software': 'xmp:CreatorTool',
+    'Exif.Photo.DateTimeDigitized': 'xmp:CreateDate',
+    'Exif.Photo.DateTimeOriginal': 'exif:DateTimeOriginal',
+    'Exif.Photo.ExposureTime': 'exif:ExposureTime',
+    'Exif.Photo.FNumber': 'exif:FNumber',
+    'Exif.Photo.FocalLength': 'exif:FocalLength',
+    'Exif.Photo.ISOSpeedRatings': 'exif:ISOSpeedRatings',
+    'Exif.Photo.LensModel': 'exifEX:LensModel',
+}
+
+# Date properties set_datetime() writes and the metadata keys
+# delta_datetime.original_datetime() knows them by.
+DATETIME_PROPERTIES = {
+    'xmp:CreateDate': 'Xmp.xmp.CreateDate',
+    'xmp:ModifyDate': 'Exif.Image.DateTime',
+    'exif:DateTimeOriginal': 'Exif.Photo.DateTimeOriginal',
+}
+
+XPACKET_BEGIN = '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+XPACKET_END = '\n<?xpacket end="w"?>\n'
+
+RDF_RDF = '{{{}}}RDF'.format(XMP_NAMESPACES['rdf'])
+RDF_DESCRIPTION = '{{{}}}Description'.format(XMP_NAMESPACES['rdf'])
+RDF_ABOUT = '{{{}}}about'.format(XMP_NAMESPACES['rdf'])
+RDF_LI = '{{{}}}li'.format(XMP_NAMESPACES['rdf'])
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+# Writer pinned by batch(). None otherwise.
+_writer = None
+
+
+class SidecarError(Exception):
+    """
+    An existing sidecar could not be read.
+    """
+
+
+def sidecar_path(filename):
+    """
+    Return the sidecar filename for image filename.
+
+    >>> sidecar_path('/photos/abc123.ARW')
+    '/photos/abc123.xmp'
+    """
+    return "{}.{}".format(os.path.splitext(filename)[0], SIDECAR_EXTENSION)
+
+
+def one_per_sidecar(items, filename=lambda item: item):
+    """
+    Return items without those whose image shares its sidecar with an
+    earlier one, such as the JPEG of a RAW+JPEG pair. filename(item) is the
+    image of item. Writing the one sidecar of a pair once for each image
+    would shift its dates twice or overwrite the first write.
+
+    >>> one_per_sidecar(['a.arw', 'a.jpg', 'b.jpg'])
+    ['a.arw', 'b.jpg']
+    """
+    seen = set()
+    unique = []
+    for item in items:
+        path = sidecar_path(filename(item))
+        if path in seen:
+            logger.info("Skipping {}. Its sidecar {} is written once.".format(
+                filename(item), path))
+            continue
+        seen.add(path)
+        unique.append(item)
+    return unique
+
+
+def qname(name):
+    """
+    Return the ElementTree name of XMP property name such as xmp:CreateDate.
+    Raises KeyError for an unknown prefix.
+    """
+    prefix, local = name.split(':', 1)
+    return '{{{}}}{}'.format(XMP_NAMESPACES[prefix], local)
+
+
+def xmp_datetime(exif_datetime):
+    """
+    Convert an EXIF datetime to XMP.
+
+    >>> xmp_datetime('2014:08:16 06:20:30')
+    '2014-08-16T06:20:30'
+    """
+    date, _, time = exif_datetime.partition(' ')
+    return "{}T{}".format(date.replace(':', '-'), time)
+
+
+def exif_datetime(xmp_datetime):
+    """
+    Convert an XMP datetime to EXIF. Any time zone is dropped.
+
+    >>> exif_datetime('2014-08-16T06:20:30+02:00')
+    '2014:08:16 06:20:30'
+    """
+    return xmp_datetime[:19].replace('-', ':').replace('T', ' ')
+
+
+def datetime_properties(new_datetime):
+    """
+    Return the XMP properties set_datetime() writes for new_datetime.
+    """
+    value = new_datetime.strftime('%Y-%m-%dT%H:%M:%S')
+    return dict((name, value) for name in DATETIME_PROPERTIES)
+
+
+def metadata_properties(metadata):
+    """
+    Return XMP properties for a FileMetadata metadata dict. Xmp keys are
+    taken as they are and win over the EXIF tags in EXIF_TO_XMP. Structured
+    properties and unknown namespaces are skipped.
+    """
+    properties = {}
+    for key, value in metadata.items():
+        name = EXIF_TO_XMP.get(key)
+        if name is None:
+            continue
+        if name in DATETIME_PROPERTIES:
+            value = xmp_datetime(value)
+        if name in SEQ_PROPERTIES:
+            value = [value]
+        properties[name] = value
+    for key, value in metadata.items():
+        if not key.startswith('Xmp.'):
+            continue
+        prefix, _, local = key[len('Xmp.'):].partition('.')
+        if (prefix not in XMP_NAMESPACES or not local or
+                '/' in local or '[' in local):
+            logger.debug("Not writing {} to sidecar.".format(key))
+            continue
+        properties["{}:{}".format(prefix, local)] = value
+    return properties
+
+
+def empty_packet():
+    """
+    Return the root of an XMP packet with one empty rdf:Description.
+    """
+    root = ET.Element(qname('x:xmpmeta'))
+    rdf = ET.SubElement(root, RDF_RDF)
+    ET.SubElement(rdf, RDF_DESCRIPTION, {RDF_ABOUT: ''})
+    return root
+
+
+def parse_packet(data):
+    """
+    Return the root of the XMP packet in data. Namespace prefixes found in
+    it are registered so they are kept when it is written back.
+    """
+    try:
+        for _, (prefix, uri) in ET.iterparse(
+                io.BytesIO(data), events=('start-ns',)):
+            try:
+                ET.register_namespace(prefix, uri)
+            except ValueError:
+                pass
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        raise SidecarError("Not an XMP packet: {}".format(e))
+    if root.tag != RDF_RDF and root.find(RDF_RDF) is None:
+        raise SidecarError("No rdf:RDF element.")
+    return root
+
+
+def set_properties(root, properties):
+    """
+    Set properties on the first rdf:Description of the packet root,
+    removing any earlier value from every rdf:Description. Strings become
+    attributes, lists rdf:Seq or rdf:Bag and dicts language alternatives.
+    """
+    rdf = root if root.tag == RDF_RDF else root.find(RDF_RDF)
+    descriptions = rdf.findall(RDF_DESCRIPTION)
+    if not descriptions:
+        descriptions = [ET.SubElement(rdf, RDF_DESCRIPTION, {RDF_ABOUT: ''})]
+    for name, value in properties.items():
+        tag = qname(name)
+        for description in descriptions:
+            description.attrib.pop(tag, None)
+            for child in description.findall(tag):
+                description.remove(child)
+        target = descriptions[0]
+        if isinstance(value, dict):
+            array = ET.SubElement(ET.SubElement(target, tag), qname('rdf:Alt'))
+            for lang, text in value.items():
+                ET.SubElement(array, RDF_LI, {XML_LANG: lang}).text = text
+        elif isinstance(value, (list, tuple)):
+            kind = 'rdf:Seq' if name in SEQ_PROPERTIES else 'rdf:Bag'
+            array = ET.SubElement(ET.SubElement(target, tag), qname(kind))
+            for text in value:
+                ET.SubElement(array, RDF_LI).text = "{}".format(text)
+        else:
+            target.set(tag, "{}".format(value))
+
+
+def serialize(root):
+    """
+    Return packet root as UTF-8 bytes wrapped in xpacket instructions.
+    """
+    return (XPACKET_BEGIN + ET.tostring(root, encoding='unicode') +
+            XPACKET_END).encode('utf-8')
+
+
+def get_properties(root, names):
+    """
+    Return the simple values of names found in the packet root.
+    """
+    rdf = root if root.tag == RDF_RDF else root.find(RDF_RDF)
+    values = {}
+    for description in rdf.findall(RDF_DESCRIPTION):
+        for name in names:
+            tag = qname(name)
+            if tag in description.attrib:
+                values[name] = description.attrib[tag]
+            else:
+                child = description.find(tag)
+                if child is not None and child.text and len(child) == 0:
+                    values[name] = child.text.strip()
+    return values
+
+
+class SidecarWriter(object):
+    """
+    Reads and writes sidecars relative to an open descriptor of their
+    directory. A sidecar is written to a temporary name and renamed into
+    place so readers never see half of one.
+    """
+
+    def __init__(self):
+        self.dir_fds = fsops.DirFds()
+
+    def dir_fd(self, path):
+        """
+        Return a descriptor for directory path or None if it cannot be
+        opened.
+        """
+        try:
+            return self.dir_fds.get(path)
+        except OSError as e:
+            logger.debug("Unable to open directory {}: {}".format(path, e))
+            return None
+
+    def read(self, filename):
+        """
+        Return the packet root of the sidecar of image filename or None if
+        there is none.
+        """
+        directory, name = os.path.split(sidecar_path(filename))
+        dir_fd = self.dir_fd(directory)
+        path = name if dir_fd is not None else os.path.join(directory, name)
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC, dir_fd=dir_fd)
+        except FileNotFoundError:
+            return None
+        with os.fdopen(fd, 'rb') as f:
+            return parse_packet(f.read())
+
+    def write(self, filename, properties):
+        """
+        Write properties to the sidecar of image filename, keeping what an
+        existing sidecar already holds.
+        """
+        root = self.read(filename)
+        if root is None:
+            root = empty_packet()
+        set_properties(root, properties)
+        data = serialize(root)
+
+        directory, name = os.path.split(sidecar_path(filename))
+        dir_fd = self.dir_fd(directory)
+        tmp_name = ".{}.{}.tmp".format(name, os.getpid())
+        if dir_fd is None:
+            name = os.path.join(directory, name)
+            tmp_name = os.path.join(directory, tmp_name)
+        fd = os.open(tmp_name,
+                os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o666,
+                dir_fd=dir_fd)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+        except BaseException:
+            os.unlink(tmp_name, dir_fd=dir_fd)
+            raise
+        logger.debug("Wrote sidecar {}.".format(name))
+
+    def close(self):
+        """
+        Close the open directory descriptor if any.
+        """
+        self.dir_fds.close()
+
+
+@contextlib.contextmanager
+def batch():
+    """
+    Share one SidecarWriter between write() calls until the block ends.
+    """
+    global _writer
+    previous = _writer
+    _writer = SidecarWriter()
+    try:
+        yield _writer
+    finally:
+        _writer.close()
+        _writer = previous
+
+
+def _current():
+    """
+    Return the writer pinned by batch() or a new one.
+    """
+    return _writer if _writer is not None else SidecarWriter()
+
+
+def write(filename, properties):
+    """
+    Write properties to the sidecar of image filename.
+    """
+    writer = _current()
+    try:
+        writer.write(filename, properties)
+    finally:
+        if writer is not _writer:
+            writer.close()
+
+
+def read_datetimes(filename):
+    """
+    Return the dates in the sidecar of image filename as EXIF datetimes
+    keyed like FileMetadata metadata. Empty if there is no sidecar.
+    """
+    writer = _current()
+    try:
+        root = writer.read(filename)
+    finally:
+        if writer is not _writer:
+            writer.close()
+    if root is None:
+        return {}
+    values = get_properties(root, DATETIME_PROPERTIES)
+    return dict((DATETIME_PROPERTIES[name], exif_datetime(value))
+        for name, value in values.items())
@@ -1,3 +1,9 @@
+TEST_EXECUTOR_RUN_TASKS = True
+TEST_EXIFPATCH = True
+TEST_FASTREAD_JPEG = True
+TEST_FASTREAD_TIFF = True
+TEST_FASTREAD_PNG = True
+TEST_JPEGSPLICE = True
 TEST_FILEMAP_BUILD_DST_FN = True
 TEST_FILEMAP_CHMOD = True
 TEST_FILEMAP_INIT = True
@@ -9,15 +15,23 @@ TEST_FILEMETADATA_READ_METADATA = True
 TEST_FILEMETADATA_SET_DATETIME = True
 TEST_FILEMETADATA_COPY_METADATA = True
 TEST_FILEMETADATA_GETITEM = True
+TEST_JOURNAL = True
+TEST_METADATACACHE = True
 TEST_HARVESTER_INIT_FILEMAP_METADATA = True
 TEST_HARVESTER_INIT_FILEMAP_ALT = True
 TEST_HARVESTER_FILEMAPS_FOR_METADATA_COPY = True
 TEST_HARVESTER_FIND_DST_FILENAME_COLLISION = True
+TEST_HARVESTER_RESOLVE_DST_FILENAME_COLLISIONS = True
+TEST_HARVESTER_ORDER_MAPFILE_MOVES = True
 TEST_HARVESTER_READ_ALT_FILE_MAP = True
 TEST_HARVESTER_FILES_FROM_DIRECTORY = True
+TEST_HARVESTER_FILES_FROM_MAPFILE = True
 TEST_HARVESTER_GETITEM = True
-TEST_HARVESTER_GET_LINE_TERM = True
 TEST_HARVESTER_SCAN_FOR_DUPE_FILES = True
+TEST_HARVESTER_STREAM_FILEMAPS = True
+TEST_HARVESTER_WALK_DIRECTORIES = True
+TEST_PLAN = True
+TEST_SIDECAR = True
 TEST_RENAME_MAIN = True
 TEST_RENAME_PROCESS_ALL_FILES = True
 TEST_RENAME_PROCESS_FILEMAP = True
@@ -3,6 +3,8 @@ Stubs shared between different test modules.
 """
 import os
 import re
+import struct
+import zlib
 import pytest
 from photo_rename import Harvester
 
@@ -42,6 +44,109 @@ class StubFilemap(object):
         self.dst_fn_fq = dst_fn_fq
         self.dst_fn = os.path.basename(dst_fn_fq)
 
+    def sub_second(self):
+        return None
+
+
+class StubDirEntry(object):
+    """
+    Stands in for os.DirEntry.
+    """
+
+    def __init__(self, name, is_dir=False, directory='.'):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._is_dir = is_dir
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_file(self):
+        return not self._is_dir
+
+
+def make_tiff(ifd0_tags, exif_tags=None, endian='<'):
+    """
+    Build a minimal TIFF structure. Tags are dicts of tag number to ASCII
+    value. An Exif sub-IFD is added if exif_tags is given.
+    """
+    def ifd(tags, offset, extra):
+        """
+        Return IFD bytes at offset and value data that follows it. extra is a
+        list of (tag, type, count, value) entries with inline values.
+        """
+        entries = sorted(
+            [(tag, 2, value.encode('ascii') + b'\x00')
+                for tag, value in tags.items()] + extra)
+        data_offset = offset + 2 + len(entries) * 12 + 4
+        head = struct.pack(endian + 'H', len(entries))
+        data = b''
+        for entry in entries:
+            if entry[1] == 2:
+                tag, field_type, value = entry
+                if len(value) <= 4:
+                    inline = value.ljust(4, b'\x00')
+                else:
+                    inline = struct.pack(endian + 'I', data_offset + len(data))
+                    data += value
+                head += struct.pack(endian + 'HHI', tag, 2, len(value))
+                head += inline
+            else:
+                tag, field_type, count, value = entry
+                head += struct.pack(endian + 'HHII', tag, field_type, count,
+                    value)
+        return head + b'\x00\x00\x00\x00' + data
+
+    order = b'II' if endian == '<' else b'MM'
+    header = order + struct.pack(endian + 'HI', 42, 8)
+    if exif_tags is None:
+        return header + ifd(ifd0_tags, 8, [])
+    # Lay out IFD0 once to learn its size, then point at the Exif IFD.
+    size = len(ifd(ifd0_tags, 8, [(0x8769, 4, 1, 0)]))
+    ifd0 = ifd(ifd0_tags, 8, [(0x8769, 4, 1, 8 + size)])
+    return header + ifd0 + ifd(exif_tags, 8 + size, [])
+
+
+def make_jpeg(tiff, scan_size=1024):
+    """
+    Build a JPEG-shaped file: SOI, APP0, EXIF APP1 with tiff, SOS and
+    scan_size bytes of fake entropy coded data, EOI.
+    """
+    app0 = b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    app1 = b'Exif\x00\x00' + tiff
+    return (b'\xff\xd8' +
+        b'\xff\xe0' + struct.pack('>H', len(app0) + 2) + app0 +
+        b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 +
+        b'\xff\xda' + struct.pack('>H', 8) + b'\x01\x01\x00\x00\x3f\x00' +
+        b'\x5a' * scan_size + b'\xff\xd9')
+
+
+def make_png(create_date=None, idat_size=1024, compressed=False,
+        attribute=True):
+    """
+    Build a PNG-shaped file: signature, IHDR, IDAT of idat_size bytes, XMP
+    iTXt chunk with xmp:CreateDate if given, IEND. CRCs are not checked.
+    """
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data +
+            b'\x00\x00\x00\x00')
+
+    png = b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', b'\x00' * 13)
+    png += chunk(b'IDAT', b'\x00' * idat_size)
+    if create_date is not None:
+        if attribute:
+            body = '<rdf:Description xmp:CreateDate="{}"/>'.format(create_date)
+        else:
+            body = '<xmp:CreateDate>{}</xmp:CreateDate>'.format(create_date)
+        packet = '<x:xmpmeta><rdf:RDF>{}</rdf:RDF></x:xmpmeta>'.format(
+            body).encode('utf-8')
+        if compressed:
+            packet = zlib.compress(packet)
+        png += chunk(b'iTXt', b'XML:com.adobe.xmp\x00' +
+            (b'\x01' if compressed else b'\x00') + b'\x00\x00\x00' + packet)
+    png += chunk(b'IDAT', b'\x00' * idat_size)
+    return png + chunk(b'IEND', b'')
+
 
 @pytest.fixture
 def harvey():
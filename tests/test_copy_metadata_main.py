@@ -45,6 +45,9 @@ class TestCopyMetadataMain(object):
             src_directory="/abc",
             dst_directory="/def",
             simon_sez=True,
+            jobs=None,
+            splice=False,
+            sidecar=False,
             verbose=verbose,
         )
 
@@ -62,7 +65,8 @@ class TestCopyMetadataMain(object):
 
         # Confirm expected behavior
         m_logging.basicConfig.called_once_with(level=log_level)
-        m_process_all_files.assert_called_with('/abc', '/def', simon_sez=True)
+        m_process_all_files.assert_called_with('/abc', '/def', simon_sez=True,
+                jobs=None, splice=False, sidecar=False)
 
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
@@ -87,6 +91,9 @@ class TestCopyMetadataMain(object):
             src_directory=None,
             dst_directory="/def",
             simon_sez=True,
+            jobs=None,
+            splice=False,
+            sidecar=False,
             verbose=False,
         )
 
@@ -129,6 +136,9 @@ class TestCopyMetadataMain(object):
             src_directory="/abc",
             dst_directory="/def",
             simon_sez=True,
+            jobs=None,
+            splice=False,
+            sidecar=False,
             verbose=False,
         )
 
@@ -0,0 +1,85 @@
+import logging
+import os
+import sys
+import pytest
+from mock import Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import contextlib
+from photo_rename.executor import (
+        TaskResult, log_summary, run_batches, run_tasks)
+from .stubs import *
+from . import TEST_EXECUTOR_RUN_TASKS
+
+
+def square_task(task):
+    """
+    Module level so it can be sent to a worker process.
+    """
+    logging.getLogger("photo_rename.test").info("task {}".format(task))
+    if task < 0:
+        return TaskResult(str(task), False, "negative")
+    return TaskResult(str(task), True, task * task)
+
+
+@contextlib.contextmanager
+def logged_batch():
+    """
+    Module level so it can be sent to a worker process.
+    """
+    logging.getLogger("photo_rename.test").info("batch")
+    yield
+
+
+class TestExecutorRunTasks(object):
+    """
+    Tests for executor.py run_tasks() and log_summary() functions.
+    """
+    skiptests = not TEST_EXECUTOR_RUN_TASKS
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("jobs, chunksize", [
+        (None, None), (1, None), (3, None), (2, 1)])
+    def test_run_tasks_ordered(self, jobs, chunksize, caplog):
+        """
+        Test run_tasks() serial and with a process pool. Confirm results and
+        replayed log records are in task order.
+        """
+        caplog.set_level(logging.INFO)
+        tasks = list(range(20))
+        results = run_tasks(square_task, tasks, jobs=jobs, chunksize=chunksize)
+        assert [result.error for result in results] == [
+            task * task for task in tasks]
+        messages = [record.getMessage() for record in caplog.records
+            if record.name == "photo_rename.test"]
+        assert messages == ["task {}".format(task) for task in tasks]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("jobs", [None, 3])
+    def test_run_batches(self, jobs, caplog):
+        """
+        Test run_batches() serial and with a process pool. Confirm results
+        in task order and one context per batch.
+        """
+        caplog.set_level(logging.INFO)
+        tasks = list(range(10))
+        results = run_batches(square_task, tasks, logged_batch, jobs=jobs,
+            batch_size=4)
+        assert [result.error for result in results] == [
+            task * task for task in tasks]
+        messages = [record.getMessage() for record in caplog.records
+            if record.name == "photo_rename.test"]
+        assert messages.count("batch") == 3
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.executor.logger')
+    def test_log_summary(self, m_logger):
+        """
+        Test log_summary() with one failed result. Confirm failure logged.
+        """
+        results = [square_task(1), square_task(-1)]
+        assert log_summary(results) == results
+        m_logger.info.assert_called_once_with(
+            "2 files processed, 1 succeeded, 1 failed.")
+        m_logger.error.assert_called_once_with("Failed: -1: negative")
@@ -0,0 +1,107 @@
+import os
+import sys
+from datetime import datetime
+import pytest
+from mock import Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename import exifpatch, fastread
+from photo_rename.exifpatch import PatchError
+from .stubs import *
+from . import TEST_EXIFPATCH
+
+
+DATETIME = '2014:08:16 06:20:30'
+DATETIME_ORIGINAL = '2014:08:16 06:20:29'
+NEW_DATETIME = datetime(2020, 1, 2, 3, 4, 5)
+KEYS = ['Exif.Image.DateTime', 'Exif.Photo.DateTimeOriginal']
+
+
+class TestExifpatch(object):
+    """
+    Tests for exifpatch.py patch_datetime().
+    """
+    skiptests = not TEST_EXIFPATCH
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("endian", ['<', '>'])
+    @pytest.mark.parametrize("image_type, build, ext", [
+        (photo_rename.IMAGE_TYPE_JPEG, make_jpeg, 'jpg'),
+        (photo_rename.IMAGE_TYPE_TIFF, lambda tiff: tiff, 'tif'),
+        (photo_rename.IMAGE_TYPE_ARW, lambda tiff: tiff, 'arw'),
+        ])
+    def test_patch_datetime(self, tmpdir, endian, image_type, build, ext):
+        """
+        Patch both date tags. Confirm the new values read back, the
+        DateTimeDigitized tag is untouched and only the patched bytes
+        differ.
+        """
+        tiff = make_tiff({0x0132: DATETIME},
+            {0x9003: DATETIME_ORIGINAL, 0x9004: DATETIME_ORIGINAL}, endian)
+        image = tmpdir.join('abc.{}'.format(ext))
+        image.write_binary(build(tiff))
+        before = image.read_binary()
+
+        offsets = exifpatch.patch_datetime(
+            str(image), image_type, NEW_DATETIME, KEYS)
+
+        after = image.read_binary()
+        assert len(after) == len(before)
+        changed = [i for i in range(len(before)) if before[i] != after[i]]
+        assert all(any(o <= i < o + 20 for o in offsets.values())
+            for i in changed)
+        if image_type == photo_rename.IMAGE_TYPE_JPEG:
+            metadata = fastread.read_jpeg_metadata(str(image))
+        else:
+            metadata = fastread.read_tiff_metadata(str(image))
+        assert metadata == {
+            'Exif.Image.DateTime': '2020:01:02 03:04:05',
+            'Exif.Photo.DateTimeOriginal': '2020:01:02 03:04:05',
+            'Exif.Photo.DateTimeDigitized': DATETIME_ORIGINAL,
+        }
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("ifd0, exif", [
+        ({0x0132: DATETIME}, {}),
+        ({0x0132: '2014:08:16'}, {0x9003: DATETIME_ORIGINAL}),
+        ({0x010f: 'Camera Maker'}, {0x9003: DATETIME_ORIGINAL}),
+        ])
+    def test_patch_datetime_unusual(self, tmpdir, ifd0, exif):
+        """
+        Patch a file with a missing or short tag. Confirm PatchError and
+        nothing written.
+        """
+        image = tmpdir.join('abc.jpg')
+        image.write_binary(make_jpeg(make_tiff(ifd0, exif)))
+        before = image.read_binary()
+        with pytest.raises(PatchError):
+            exifpatch.patch_datetime(
+                str(image), photo_rename.IMAGE_TYPE_JPEG, NEW_DATETIME, KEYS)
+        assert image.read_binary() == before
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_patch_datetime_png(self, tmpdir):
+        """
+        Patch a PNG. Confirm PatchError.
+        """
+        image = tmpdir.join('abc.png')
+        image.write_binary(make_png('2014-08-16T06:20:30'))
+        with pytest.raises(PatchError):
+            exifpatch.patch_datetime(
+                str(image), photo_rename.IMAGE_TYPE_PNG, NEW_DATETIME, KEYS)
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.exifpatch.os.pread')
+    def test_patch_datetime_verify(self, m_pread, tmpdir):
+        """
+        Read back something other than what was written. Confirm
+        PatchError.
+        """
+        m_pread.return_value = b'\x00' * 20
+        image = tmpdir.join('abc.jpg')
+        image.write_binary(make_jpeg(make_tiff({0x0132: DATETIME})))
+        with pytest.raises(PatchError):
+            exifpatch.patch_datetime(str(image), photo_rename.IMAGE_TYPE_JPEG,
+                NEW_DATETIME, ['Exif.Image.DateTime'])
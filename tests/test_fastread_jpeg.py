@@ -0,0 +1,86 @@
+import os
+import sys
+import pytest
+from mock import Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename import Filemap, fastread
+from photo_rename.fastread import FastReadError
+from .stubs import *
+from . import TEST_FASTREAD_JPEG
+
+
+DATETIME = '2014:08:16 06:20:30'
+DATETIME_ORIGINAL = '2014:08:16 06:20:29'
+
+
+class TestFastreadJpeg(object):
+    """
+    Tests for fastread.py read_jpeg_metadata() and read_metadata().
+    """
+    skiptests = not TEST_FASTREAD_JPEG
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("endian", ['<', '>'])
+    def test_read_jpeg_metadata(self, tmpdir, endian):
+        """
+        Read JPEG with IFD0 and Exif sub-IFD in both byte orders. Confirm
+        date tags returned.
+        """
+        tiff = make_tiff({0x0132: DATETIME, 0x010f: 'Camera Maker'},
+            {0x9003: DATETIME_ORIGINAL, 0x9291: '12'}, endian)
+        jpeg = tmpdir.join('abc.jpg')
+        jpeg.write_binary(make_jpeg(tiff))
+        assert fastread.read_jpeg_metadata(str(jpeg)) == {
+            'Exif.Image.DateTime': DATETIME,
+            'Exif.Photo.DateTimeOriginal': DATETIME_ORIGINAL,
+            'Exif.Photo.SubSecTimeOriginal': '12',
+        }
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("data", [
+        b'',
+        b'\x89PNG\r\n\x1a\n',
+        b'\xff\xd8\xff\xda\x00\x08',
+        b'\xff\xd8\xff\xe1\x00\x10Exif\x00\x00XX*\x00',
+        make_jpeg(make_tiff({0x0132: DATETIME})[:12]),
+    ])
+    def test_read_jpeg_metadata_unhandled(self, tmpdir, data):
+        """
+        Read files that are not JPEG, have no APP1 or a truncated TIFF
+        structure. Confirm FastReadError raised.
+        """
+        jpeg = tmpdir.join('abc.jpg')
+        jpeg.write_binary(data)
+        with pytest.raises(FastReadError):
+            fastread.read_jpeg_metadata(str(jpeg))
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_read_metadata_fallback(self, tmpdir):
+        """
+        Test read_metadata() with a JPEG with no DateTime, a missing file
+        and an unsupported image type. Confirm None so caller falls back.
+        """
+        jpeg = tmpdir.join('abc.jpg')
+        jpeg.write_binary(make_jpeg(make_tiff({0x010f: 'Camera Maker'})))
+        assert fastread.read_metadata(
+            str(jpeg), photo_rename.IMAGE_TYPE_JPEG) is None
+        assert fastread.read_metadata(
+            str(tmpdir.join('none.jpg')), photo_rename.IMAGE_TYPE_JPEG) is None
+        assert fastread.read_metadata(
+            str(jpeg), photo_rename.IMAGE_TYPE_PNG) is None
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemap.pyexiv2.ImageMetadata')
+    def test_filemap_uses_fast_path(self, m_img_md, tmpdir):
+        """
+        Create Filemap for a JPEG with DateTime. Confirm pyexiv2 not used and
+        dst_fn built from the date.
+        """
+        jpeg = tmpdir.join('abc.jpg')
+        jpeg.write_binary(make_jpeg(make_tiff({0x0132: DATETIME})))
+        filemap = Filemap(str(jpeg), IMAGE_TYPE_JPEG)
+        m_img_md.assert_not_called()
+        assert filemap.dst_fn == '20140816_062030.jpg'
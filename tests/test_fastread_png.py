@@ -0,0 +1,75 @@
+import os
+import sys
+import pytest
+from mock import Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename import Filemap, fastread
+from photo_rename.fastread import FastReadError
+from .stubs import *
+from . import TEST_FASTREAD_PNG
+
+
+CREATE_DATE = '2014-08-16T06:20:30'
+
+
+class TestFastreadPng(object):
+    """
+    Tests for fastread.py read_png_metadata().
+    """
+    skiptests = not TEST_FASTREAD_PNG
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("compressed, attribute", [
+        (False, True), (False, False), (True, True)])
+    def test_read_png_metadata(self, tmpdir, compressed, attribute):
+        """
+        Read PNG with XMP iTXt chunk after IDAT. CreateDate as attribute or
+        element, packet compressed or not. Confirm CreateDate returned.
+        """
+        image = tmpdir.join('abc.png')
+        image.write_binary(make_png(CREATE_DATE, compressed=compressed,
+            attribute=attribute))
+        assert fastread.read_png_metadata(str(image)) == {
+            'Xmp.xmp.CreateDate': CREATE_DATE}
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_read_png_metadata_no_create_date(self, tmpdir):
+        """
+        Read PNG with XMP packet without CreateDate. Confirm empty dict.
+        """
+        image = tmpdir.join('abc.png')
+        image.write_binary(
+            make_png('').replace(b'xmp:CreateDate', b'xmp:Rating'))
+        assert fastread.read_png_metadata(str(image)) == {}
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("data", [
+        b'',
+        b'\xff\xd8\xff\xe1',
+        make_png(),
+    ])
+    def test_read_png_metadata_unhandled(self, tmpdir, data):
+        """
+        Read files that are not PNG or have no XMP chunk. Confirm
+        FastReadError raised.
+        """
+        image = tmpdir.join('abc.png')
+        image.write_binary(data)
+        with pytest.raises(FastReadError):
+            fastread.read_png_metadata(str(image))
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemap.pyexiv2.ImageMetadata')
+    def test_filemap_uses_fast_path(self, m_img_md, tmpdir):
+        """
+        Create Filemap for a PNG with CreateDate. Confirm pyexiv2 not used
+        and dst_fn built from the date.
+        """
+        image = tmpdir.join('abc.png')
+        image.write_binary(make_png(CREATE_DATE, idat_size=100000))
+        filemap = Filemap(str(image), IMAGE_TYPE_PNG)
+        m_img_md.assert_not_called()
+        assert filemap.dst_fn == '20140816_062030.png'
@@ -0,0 +1,71 @@
+import os
+import sys
+import pytest
+from mock import Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename import Filemap, fastread
+from photo_rename.fastread import FastReadError
+from .stubs import *
+from . import TEST_FASTREAD_TIFF
+
+
+DATETIME = '2014:08:16 06:20:30'
+DATETIME_ORIGINAL = '2014:08:16 06:20:29'
+
+
+class TestFastreadTiff(object):
+    """
+    Tests for fastread.py read_tiff_metadata().
+    """
+    skiptests = not TEST_FASTREAD_TIFF
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("endian", ['<', '>'])
+    def test_read_tiff_metadata(self, tmpdir, endian):
+        """
+        Read TIFF with IFD0 and Exif sub-IFD followed by image data in both
+        byte orders. Confirm date tags returned.
+        """
+        tiff = make_tiff({0x0132: DATETIME},
+            {0x9003: DATETIME_ORIGINAL, 0x9290: '5'}, endian)
+        image = tmpdir.join('abc.arw')
+        image.write_binary(tiff + b'\x00' * 100000)
+        assert fastread.read_tiff_metadata(str(image)) == {
+            'Exif.Image.DateTime': DATETIME,
+            'Exif.Photo.DateTimeOriginal': DATETIME_ORIGINAL,
+            'Exif.Photo.SubSecTime': '5',
+        }
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("data", [
+        b'',
+        b'II*\x00',
+        b'II+\x00\x08\x00\x00\x00',
+        b'II*\x00\xff\xff\x00\x00',
+        make_tiff({0x0132: DATETIME})[:20],
+    ])
+    def test_read_tiff_metadata_unhandled(self, tmpdir, data):
+        """
+        Read empty, truncated and malformed files. Confirm FastReadError
+        raised.
+        """
+        image = tmpdir.join('abc.tif')
+        image.write_binary(data)
+        with pytest.raises(FastReadError):
+            fastread.read_tiff_metadata(str(image))
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemap.pyexiv2.ImageMetadata')
+    def test_filemap_uses_fast_path(self, m_img_md, tmpdir):
+        """
+        Create Filemap for a TIFF with DateTime. Confirm pyexiv2 not used and
+        dst_fn built from the date.
+        """
+        image = tmpdir.join('abc.TIFF')
+        image.write_binary(make_tiff({0x0132: DATETIME}, endian='>'))
+        filemap = Filemap(str(image), IMAGE_TYPE_TIFF)
+        m_img_md.assert_not_called()
+        assert filemap.dst_fn == '20140816_062030.tif'
@@ -6,6 +6,7 @@ from mock import Mock, patch
 app_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, app_path + '/../')
 
+import photo_rename
 from photo_rename import Filemap
 from photo_rename import *
 from .stubs import *
@@ -38,3 +39,46 @@ class TestFilemapBuildNewFn(object):
         filemap = Filemap(src_fn, image_type, exif_data)
         dst_fn = filemap.dst_fn
         assert dst_fn == expected_dst_fn
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("naming, sub_sec, expected_dst_fn", [
+        (NAMING_SEQUENCE, '25', '20140816_062030.jpg'),
+        (NAMING_MILLIS, '25', '20140816_062030_250.jpg'),
+        (NAMING_MILLIS, '123456', '20140816_062030_123.jpg'),
+        (NAMING_MILLIS, ' 7 ', '20140816_062030_700.jpg'),
+        (NAMING_MILLIS, 'xx', '20140816_062030.jpg'),
+        (NAMING_MILLIS, None, '20140816_062030.jpg'),
+    ])
+    def test_build_dst_fn_millis(self, naming, sub_sec, expected_dst_fn):
+        """
+        Test build_dst_fn() with SubSecTimeOriginal. Confirm milliseconds
+        appended only with NAMING_MILLIS and a numeric value.
+        """
+        exif_data = {'Exif.Image.DateTime': '2014:08:16 06:20:30'}
+        if sub_sec is not None:
+            exif_data['Exif.Photo.SubSecTimeOriginal'] = sub_sec
+        filemap = Filemap(SRC_FN_JPG_LOWER, IMAGE_TYPE_JPEG, exif_data,
+                naming=naming)
+        assert filemap.dst_fn == expected_dst_fn
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_build_dst_fn_hash(self, tmpdir):
+        """
+        Test build_dst_fn() with NAMING_HASH. Confirm a six digit digest is
+        appended, is the same for the same content and that only the full
+        digest sees past the prefix.
+        """
+        exif_data = {'Exif.Image.DateTime': '2014:08:16 06:20:30'}
+        head = b'x' * photo_rename.filemap.CONTENT_DIGEST_PREFIX
+        filemaps = []
+        for name, tail in [('a.jpg', b'1'), ('b.jpg', b'2'), ('c.jpg', b'1')]:
+            tmpdir.join(name).write_binary(head + tail)
+            filemaps.append(Filemap(str(tmpdir.join(name)), IMAGE_TYPE_JPEG,
+                exif_data, naming=NAMING_HASH))
+        assert re.match(r'^20140816_062030-[0-9a-f]{6}\.jpg$',
+                filemaps[0].dst_fn)
+        assert len(set(fm.dst_fn for fm in filemaps)) == 1
+        full = [fm.build_dst_fn(full_digest=True) for fm in filemaps]
+        assert full[0] != full[1]
+        assert full[0] == full[2]
+        assert full[0] != filemaps[0].dst_fn
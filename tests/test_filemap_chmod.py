@@ -64,3 +64,29 @@ class TestFilemapChmod(object):
         if st_mode_supplied == 33279:
             mock_chmod.assert_called_with(src_fn, st_mode_expected)
 
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("mode, expected", [
+        (0o755, 0o644), (0o644, None), (0o700, 0o600)])
+    def test_chmod_dir_fd(self, tmpdir, mode, expected):
+        """
+        Remove execute bits relative to a directory descriptor. Confirm one
+        chmod when the mode changes and none otherwise.
+        """
+        image = tmpdir.join('abc.jpg')
+        image.write('abc')
+        image.chmod(mode)
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn='abc.jpg')
+        dir_fd = os.open(str(tmpdir), os.O_RDONLY)
+        try:
+            with patch('photo_rename.filemap.os.chmod',
+                    wraps=os.chmod) as m_chmod:
+                filemap._chmod(dir_fd)
+        finally:
+            os.close(dir_fd)
+        if expected is None:
+            m_chmod.assert_not_called()
+        else:
+            assert m_chmod.call_count == 1
+            assert image.stat().mode & 0o777 == expected
@@ -6,6 +6,7 @@ app_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, app_path + '/../')
 
 from photo_rename import *
+from photo_rename import fsops
 from .stubs import *
 from . import TEST_FILEMAP_MOVE
 
@@ -65,3 +66,125 @@ class TestFilemapMove(object):
         filemap.move()
         assert filemap.collision_detected == True
 
+
+
+@pytest.fixture
+def image(tmpdir):
+    """
+    Executable image file in its own directory.
+    """
+    image = tmpdir.join('abc.jpg')
+    image.write('abc')
+    image.chmod(0o755)
+    return image
+
+
+class TestFilemapMovePinned(object):
+    """
+    Tests for move() with the work directory pinned.
+    """
+    skiptests = not TEST_FILEMAP_MOVE or fsops._renameat2 is None
+
+    @pytest.mark.skipif(skiptests, reason="renameat2 not available")
+    @patch('photo_rename.filemap.os.path.exists')
+    @patch('photo_rename.filemap.os.rename')
+    def test_move_pinned(self, m_rename, m_exists, image, tmpdir):
+        """
+        Move inside pinned_directories(). Confirm file moved and execute
+        bits removed without exists() or rename() by path.
+        """
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn="new.jpg")
+        with fsops.pinned_directories():
+            filemap.move()
+        assert tmpdir.listdir() == [tmpdir.join('new.jpg')]
+        assert tmpdir.join('new.jpg').stat().mode & 0o777 == 0o644
+        m_exists.assert_not_called()
+        m_rename.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="renameat2 not available")
+    def test_move_pinned_collision(self, image, tmpdir):
+        """
+        Move onto an existing file. Confirm collision and both files kept.
+        """
+        tmpdir.join('new.jpg').write('new')
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn="new.jpg")
+        with fsops.pinned_directories():
+            filemap.move()
+        assert filemap.collision_detected == True
+        assert image.read() == 'abc'
+        assert tmpdir.join('new.jpg').read() == 'new'
+
+    @pytest.mark.skipif(skiptests, reason="renameat2 not available")
+    @patch('photo_rename.fsops._renameat2', None)
+    @patch('photo_rename.filemap.os.rename')
+    def test_move_pinned_fallback(self, m_rename, image, tmpdir):
+        """
+        Move with renameat2 unavailable. Confirm fallback to rename().
+        """
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn="new.jpg")
+        with fsops.pinned_directories():
+            with patch('photo_rename.Filemap._chmod'):
+                filemap.move()
+        m_rename.assert_called_once_with(
+                str(image), str(tmpdir.join('new.jpg')))
+
+
+class TestFilemapMoveStatResult(object):
+    """
+    Tests for move() with the stat captured at discovery.
+    """
+    skiptests = not TEST_FILEMAP_MOVE
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_move_stat_result(self, image, tmpdir):
+        """
+        Move with the stat passed in. Confirm only exists() and the check
+        before the move stat the file and execute bits are removed.
+        """
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn="new.jpg", stat_result=os.stat(str(image)))
+        with patch('photo_rename.filemap.os.stat', wraps=os.stat) as m_stat:
+            filemap.move()
+        assert m_stat.call_count == 2
+        assert tmpdir.listdir() == [tmpdir.join('new.jpg')]
+        assert tmpdir.join('new.jpg').stat().mode & 0o777 == 0o644
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_move_dir_entry(self, image, tmpdir):
+        """
+        Move with the DirEntry from os.scandir(). Confirm file moved.
+        """
+        entry, = list(os.scandir(str(tmpdir)))
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn="new.jpg", stat_result=entry)
+        with fsops.pinned_directories():
+            filemap.move()
+        assert tmpdir.listdir() == [tmpdir.join('new.jpg')]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemap.os.rename')
+    def test_move_changed(self, m_rename, image, tmpdir):
+        """
+        Modify the file after it was found. Confirm it is not moved.
+        """
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn="new.jpg", stat_result=os.stat(str(image)))
+        image.write('abcdef')
+        with fsops.pinned_directories():
+            filemap.move()
+        m_rename.assert_not_called()
+        assert tmpdir.listdir() == [image]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_move_missing(self, image, tmpdir):
+        """
+        Remove the file after it was found. Confirm nothing raised.
+        """
+        filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={},
+                dst_fn="new.jpg", stat_result=os.stat(str(image)))
+        image.remove()
+        filemap.move()
+        assert tmpdir.listdir() == []
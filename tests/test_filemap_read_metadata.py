@@ -2,7 +2,7 @@ import os
 import re
 import sys
 import pytest
-from mock import Mock, patch
+from mock import MagicMock, Mock, patch
 app_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, app_path + '/../')
 
@@ -53,6 +53,44 @@ class TestFilemapReadMetadata(object):
         filemap = Filemap(src_fn, IMAGE_TYPE_PNG, dst_fn="abc.jpg")
         assert filemap.read_metadata() == metadata
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemap.pyexiv2.ImageMetadata')
+    def test_read_metadata_tags(self, m_img_md):
+        """
+        Mock with several keys. Read with tags. Confirm only the tags asked
+        for and present are decoded and returned.
+        """
+        m_img_md.return_value = MagicMock(
+                exif_keys=['Exif.Image.DateTime', 'Exif.Image.Make',
+                    'Exif.Photo.MakerNote'])
+        m_img_md.return_value.__getitem__.return_value = Mock(raw_value=1)
+        filemap = Filemap(SRC_FN_JPG_LOWER, IMAGE_TYPE_JPEG,
+                read_metadata=False, dst_fn="abc.jpg")
+        metadata = filemap.read_metadata(
+                ['Exif.Image.DateTime', 'Exif.Photo.DateTimeOriginal'])
+        assert metadata == {'Exif.Image.DateTime': 1}
+        m_img_md.return_value.__getitem__.assert_called_once_with(
+                'Exif.Image.DateTime')
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("image_type, tags", [
+        (IMAGE_TYPE_JPEG,
+            ('Exif.Image.DateTime', 'Exif.Photo.SubSecTimeOriginal')),
+        (IMAGE_TYPE_PNG, ('Xmp.xmp.CreateDate',)),
+    ])
+    @patch('photo_rename.filemap.Filemap.read_metadata')
+    def test_init_reads_dst_fn_tags(self, m_read_metadata, image_type, tags):
+        """
+        Create Filemap without and with tags. Confirm the dst_fn tags are
+        read by default and the given tags otherwise.
+        """
+        m_read_metadata.return_value = {}
+        Filemap(SRC_FN_JPG_LOWER, image_type)
+        m_read_metadata.assert_called_once_with(tags)
+        m_read_metadata.reset_mock()
+        Filemap(SRC_FN_JPG_LOWER, image_type, tags=['Exif.Image.Make'])
+        m_read_metadata.assert_called_once_with(['Exif.Image.Make'])
+
 
 class TestFilemapReadExifData(object):
     """Tests for method read_exif_data() are in this class."""
@@ -65,3 +65,45 @@ class TestFilemapList(object):
         assert [file for file in filemaps.get()] == [test_file1, test_file2,
                 test_file3, test_file4, test_file5, test_file6]
 
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_filemaplist_extend_same_as_add(self):
+        """
+        Tests FilemapList extend() method. Bulk insert the same files in the
+        same order as add(). Verify identical ordering.
+        """
+        files = [
+            "19991231_235958-2.png",
+            "abc.jpg",
+            "19991231_235958.png",
+            "19991231_235957.png",
+            "19991231_235958-1.png",
+            "19991231_235958.jpg",
+            "ABC.jpg",
+            "19991231_235958-10.png",
+        ]
+        added = FilemapList()
+        for file in files:
+            added.add(file)
+        extended = FilemapList()
+        extended.extend(files)
+        assert [file for file in extended.get()] == [
+            file for file in added.get()]
+        assert [file for file in extended.get()] == [
+            "19991231_235957.png", "19991231_235958.png",
+            "19991231_235958.jpg", "19991231_235958-1.png",
+            "19991231_235958-10.png", "19991231_235958-2.png",
+            "ABC.jpg", "abc.jpg"]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_filemaplist_extend_existing(self):
+        """
+        Tests FilemapList extend() on a list that already has entries. Verify
+        new entries are merged in order.
+        """
+        filemaps = FilemapList()
+        filemaps.add("19991231_235959.png")
+        filemaps.extend(["19991231_235958.png", "19991231_235959-1.png"])
+        assert [file for file in filemaps.get()] == [
+            "19991231_235958.png", "19991231_235959.png",
+            "19991231_235959-1.png"]
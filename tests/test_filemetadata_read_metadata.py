@@ -8,6 +8,10 @@ app_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, app_path + '/../')
 
 from photo_rename import *
+from photo_rename import metadatacache
+from photo_rename.exifpatch import PatchError
+from photo_rename.filemetadata import SET_DATETIME_TAGS
+from photo_rename.jpegsplice import SpliceError
 from .stubs import *
 from . import (
         TEST_FILEMETADATA_READ_METADATA, TEST_FILEMETADATA_SET_DATETIME,
@@ -68,6 +72,24 @@ class TestFileMetadataReadMetadata(object):
         expected_metadata = {exif_keys[0]: 1, xmp_keys[0]: 1}
         assert filemd.read_metadata() == expected_metadata
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemetadata.pyexiv2.ImageMetadata')
+    def test_filemetadata_read_metadata_tags(self, m_img_md):
+        """
+        Test read_metadata() with tags. Confirm only those tags are decoded
+        and returned.
+        """
+        m_keys = MagicMock(
+                exif_keys=['Exif.Image.DateTime', 'Exif.Photo.MakerNote'],
+                xmp_keys=['Xmp.xmp.CreateDate'])
+        m_keys.__getitem__.return_value = Mock(raw_value=1)
+        m_img_md.return_value = m_keys
+
+        filemd = FileMetadata("file.jpg", tags=SET_DATETIME_TAGS)
+
+        assert filemd.read_metadata() == {'Xmp.xmp.CreateDate': 1}
+        m_keys.__getitem__.assert_called_once_with('Xmp.xmp.CreateDate')
+
 
 class TestFileMetadataSetDatetime(object):
     """
@@ -139,6 +161,95 @@ class TestFileMetadataSetDatetime(object):
         m_logger.error.assert_called_once_with(exception)
 
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("metadata, keys", [
+        ({'Exif.Image.DateTime': 1}, ['Exif.Image.DateTime']),
+        ({'Exif.Photo.DateTimeOriginal': 1},
+            ['Exif.Image.DateTime', 'Exif.Photo.DateTimeOriginal']),
+        ])
+    @patch('photo_rename.filemetadata.pyexiv2.ImageMetadata')
+    @patch('photo_rename.filemetadata.exifpatch.patch_datetime')
+    def test_filemetadata_set_datetime_in_place(self,
+            m_patch_datetime, m_img_md, metadata, keys):
+        """
+        Test set_datetime() with in_place. Confirm tags patched and pyexiv2
+        not used.
+        """
+        new_datetime = datetime.now()
+        filemd = FileMetadata("file.tif")
+        filemd.metadata = metadata
+        assert filemd.set_datetime(new_datetime, in_place=True) == True
+        m_patch_datetime.assert_called_once_with(
+                "file.tif", IMAGE_TYPE_TIFF, new_datetime, keys)
+        m_img_md.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_filemetadata_set_datetime_in_place_cache(self, tmpdir):
+        """
+        Patch a cached JPEG in place and put its mtime back, as happens on a
+        filesystem with coarse mtime. Confirm the next read through the
+        cache returns the new datetime.
+        """
+        image = tmpdir.join('abc.jpg')
+        image.write_binary(make_jpeg(make_tiff(
+            {0x0132: '2014:08:16 06:20:30'})))
+        st = os.stat(str(image))
+        tags = ['Exif.Image.DateTime']
+        metadatacache.open_cache(str(tmpdir.join('metadata.sqlite')))
+        try:
+            filemap = Filemap(str(image), IMAGE_TYPE_JPEG, metadata={})
+            assert filemap.read_metadata(tags) == {
+                'Exif.Image.DateTime': '2014:08:16 06:20:30'}
+            filemd = FileMetadata(str(image))
+            filemd.metadata = {'Exif.Image.DateTime': '2014:08:16 06:20:30'}
+            assert filemd.set_datetime(
+                    datetime(2020, 1, 2, 3, 4, 5), in_place=True) == True
+            os.utime(str(image), ns=(st.st_atime_ns, st.st_mtime_ns))
+            assert filemap.read_metadata(tags) == {
+                'Exif.Image.DateTime': '2020:01:02 03:04:05'}
+        finally:
+            metadatacache.close_cache()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("metadata, error", [
+        ({'Xmp.xmp.CreateDate': 1}, None),
+        ({'Exif.Image.DateTime': 1}, PatchError("Not found.")),
+        ])
+    @patch('photo_rename.filemetadata.pyexiv2.ImageMetadata')
+    @patch('photo_rename.filemetadata.pyexiv2.ExifTag')
+    @patch('photo_rename.filemetadata.pyexiv2.XmpTag')
+    @patch('photo_rename.filemetadata.exifpatch.patch_datetime')
+    def test_filemetadata_set_datetime_in_place_fallback(self,
+            m_patch_datetime, m_xmp_tag, m_exif_tag, m_img_md, metadata,
+            error):
+        """
+        Test set_datetime() with in_place when XMP must change or the patch
+        is not possible. Confirm pyexiv2 writes the file.
+        """
+        m_patch_datetime.side_effect = error
+        new_datetime = datetime.now()
+        filemd = FileMetadata("file.jpg")
+        filemd.metadata = metadata
+        assert filemd.set_datetime(new_datetime, in_place=True) == True
+        if error is None:
+            m_patch_datetime.assert_not_called()
+        filemd.img_md.write.assert_called_once()
+
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemetadata.pyexiv2.ImageMetadata')
+    def test_filemetadata_set_datetime_sidecar(self, m_img_md, tmpdir):
+        """
+        Test set_datetime_sidecar(). Confirm sidecar written and the image
+        neither read nor written.
+        """
+        image = tmpdir.join('file.arw')
+        filemd = FileMetadata(str(image))
+        assert filemd.set_datetime_sidecar(datetime(2020, 1, 2)) == True
+        assert tmpdir.listdir() == [tmpdir.join('file.xmp')]
+        m_img_md.assert_not_called()
+
+
 class TestFileMetadataCopyMetadata(object):
     """
     Tests for FileMetadata method copy_metadata() are in this class.
@@ -169,6 +280,45 @@ class TestFileMetadataCopyMetadata(object):
         filemd.img_md.copy.assert_called_once_with(filemd.img_md,
                 exif=True, iptc=True, xmp=True, comment=comment)
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("tgt_fn, error, spliced", [
+        ("other.jpg", None, True),
+        ("other.jpg", SpliceError("Surprise!"), False),
+        ("other.tiff", None, False),
+        ])
+    @patch('photo_rename.filemetadata.pyexiv2.ImageMetadata')
+    @patch('photo_rename.filemetadata.jpegsplice.copy_metadata')
+    def test_filemetadata_copy_metadata_splice(self,
+            m_splice, m_img_md, tgt_fn, error, spliced):
+        """
+        Test copy_metadata() with splice. Confirm JPEG targets spliced and
+        everything else, or a failed splice, written with pyexiv2.
+        """
+        m_splice.side_effect = error
+        filemd = FileMetadata("file.tiff")
+        assert filemd.copy_metadata(tgt_fn, splice=True) == True
+        if tgt_fn.endswith(".jpg"):
+            m_splice.assert_called_once_with(filemd.img_md, tgt_fn)
+        else:
+            m_splice.assert_not_called()
+        assert filemd.img_md.write.called != spliced
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemetadata.logger')
+    @patch('photo_rename.filemetadata.sidecar.write')
+    def test_filemetadata_copy_metadata_sidecar(self, m_write, m_logger):
+        """
+        Test copy_metadata_sidecar() with the write failing or not. Confirm
+        properties built from the metadata and failure reported.
+        """
+        filemd = FileMetadata("file.tiff")
+        filemd.metadata = {'Exif.Image.Make': 'Sony'}
+        assert filemd.copy_metadata_sidecar("other.jpg") == True
+        m_write.assert_called_once_with("other.jpg", {'tiff:Make': 'Sony'})
+        m_write.side_effect = OSError(13, 'Permission denied')
+        assert filemd.copy_metadata_sidecar("other.jpg") == False
+        m_logger.error.assert_called_once()
+
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.filemetadata.logger')
     @patch('photo_rename.filemetadata.pyexiv2.ImageMetadata')
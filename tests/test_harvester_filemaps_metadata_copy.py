@@ -53,3 +53,32 @@ class TestFilemapsForMetadataCopy():
         actual_filemaps = harvey.filemaps_for_metadata_copy()
         actual_filemaps.add.assert_not_called()
 
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.FilemapList')
+    @patch('photo_rename.harvester.Filemap')
+    @patch('photo_rename.harvester.os.listdir')
+    def test_filemaps_for_metadata_copy_literal_stems(
+            self, m_listdir, m_filemap, m_filemaplist):
+        """
+        Test filemaps_for_metadata_copy() with regex characters and dots in
+        the names. Confirm stems match literally and every pair is found.
+        """
+        src_files = ['a (1).tiff', 'b+c.tiff', 'd.e.tiff', 'd.tiff',
+                'fxg.tiff']
+        dst_files = ['a (1).jpg', 'bbc.jpg', 'b+c.jpg', 'd.e.jpg', 'f.g.jpg',
+                'd.']
+        m_listdir.return_value = dst_files
+        harvey = Harvester('/src/dir', metadata_dst_directory="/dst/dir")
+        harvey.files = src_files
+        harvey.filemaps_for_metadata_copy()
+        pairs = [(args[0], kwargs['dst_fn'])
+                for args, kwargs in m_filemap.call_args_list]
+        assert pairs == [
+            ('/src/dir/a (1).tiff', '/dst/dir/a (1).jpg'),
+            ('/src/dir/b+c.tiff', '/dst/dir/b+c.jpg'),
+            ('/src/dir/d.e.tiff', '/dst/dir/d.e.jpg'),
+            ('/src/dir/d.tiff', '/dst/dir/d.e.jpg'),
+        ]
+        for args, kwargs in m_filemap.call_args_list:
+            assert kwargs['read_metadata'] is False
@@ -0,0 +1,53 @@
+import os
+import sys
+import pytest
+from mock import patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename.harvester import stem_prefixes
+from photo_rename.rename import *
+from .stubs import *
+from . import TEST_HARVESTER_FILES_FROM_MAPFILE
+
+
+class TestFilesFromMapfile(object):
+    """
+    Tests for method files_from_mapfile() are in this class.
+    """
+    skiptests = not TEST_HARVESTER_FILES_FROM_MAPFILE
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.Harvester.read_alt_file_map')
+    @patch('photo_rename.harvester.os.listdir')
+    def test_files_from_mapfile(self, m_listdir, m_read_alt_file_map):
+        """
+        Test files_from_mapfile() with keys holding regex characters. Confirm
+        the directory is listed once, keys match literally and files come
+        back in FileList order.
+        """
+        m_read_alt_file_map.return_value = {
+            'file (2)': 'b', 'a+b': 'c', 'x.y': 'd', 'file 1': 'e'}
+        m_listdir.return_value = ['file 1.jpg', 'file 1.JPG', 'aab.jpg',
+                'a+b.jpg', 'file (2).jpg', 'file 2.jpg', 'x.y.jpg',
+                'xzy.jpg', 'file 10.jpg']
+        harvey = Harvester('.', mapfile='map.txt')
+        files = harvey.files_from_mapfile('map.txt')
+        m_listdir.assert_called_once_with('.')
+        assert files == ['a+b.jpg', 'file (2).jpg', 'file 1.JPG',
+                'file 1.jpg', 'x.y.jpg']
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("filename, stems", [
+        ('abc.jpg', ['abc']),
+        ('a.b.jpg', ['a', 'a.b']),
+        ('abc', []),
+        ('abc.', []),
+        ('.abc', ['']),
+    ])
+    def test_stem_prefixes(self, filename, stems):
+        """
+        Test stem_prefixes(). Confirm each stem a file would match.
+        """
+        assert list(stem_prefixes(filename)) == stems
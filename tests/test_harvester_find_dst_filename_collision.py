@@ -6,9 +6,12 @@ app_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, app_path + '/../')
 
 import photo_rename
+from photo_rename import FilemapList
 from photo_rename.rename import *
 from .stubs import *
-from . import TEST_HARVESTER_FIND_DST_FILENAME_COLLISION
+from . import (
+    TEST_HARVESTER_FIND_DST_FILENAME_COLLISION,
+    TEST_HARVESTER_RESOLVE_DST_FILENAME_COLLISIONS)
 
 
 class TestFindDstFilenameCollision(object):
@@ -64,12 +67,12 @@ class TestFindDstFilenameCollision(object):
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.harvester.FilemapList')
     @patch('photo_rename.harvester.Filemap')
-    def test_filename_collision_max_rename_attempts_exception(
+    def test_filename_collision_no_attempt_limit(
             self, m_filemap, m_filemaplist):
         """
-        Test find_dst_filename_collision() method. Arrange for repeated
-        filename collisions until MAX_RENAME_ATTEMPTS is exceeded. Confirm it
-        Exception is raised with correct message.
+        Test find_dst_filename_collision() method. Arrange for more than ten
+        repeated filename collisions. Confirm the next free sequence number
+        is used.
         """
         files = [
             '19991231_000001.jpg',
@@ -85,7 +88,7 @@ class TestFindDstFilenameCollision(object):
             '19991231_000001-10.jpg',
             '19991231_000001.jpg',
         ]
-        dst_fn_expected = '19991231_000001-2.jpg'
+        dst_fn_expected = '19991231_000001-11.jpg'
         filemap0 = Mock()
         filemap0.dst_fn = files[0]
         filemap1 = Mock()
@@ -127,8 +130,110 @@ class TestFindDstFilenameCollision(object):
         attrs = {'get.return_value': filemaps}
         m_filemaplist.configure_mock(**attrs)
         harvey = Harvester('.')
-        with pytest.raises(Exception) as excinfo:
-            dst_fn_actual = harvey.find_dst_filename_collision(
-                    m_filemaplist, filemap11)
-        assert excinfo.value.args[0].startswith("Too many rename attempts")
+        dst_fn_actual = harvey.find_dst_filename_collision(
+                m_filemaplist, filemap11)
+        assert dst_fn_actual == dst_fn_expected
+
+
+
+def stub_filemaps(dst_fns):
+    """
+    Build a FilemapList of StubFilemap with the given dst_fn values.
+    """
+    filemaps = FilemapList()
+    stubs = []
+    for index, dst_fn in enumerate(dst_fns):
+        stub = StubFilemap()
+        stub.src_fn = "src{}.jpg".format(index)
+        stub.dst_fn = dst_fn
+        stubs.append(stub)
+    filemaps.extend(stubs)
+    return filemaps
+
+
+class TestResolveDstFilenameCollisions(object):
+    """
+    Tests for Harvester.resolve_dst_filename_collisions() method.
+    """
+    skiptests = not TEST_HARVESTER_RESOLVE_DST_FILENAME_COLLISIONS
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_resolve_collisions_sequence(self, harvey):
+        """
+        Test three files with the same dst_fn and one other. Confirm
+        sequence numbers assigned in list order.
+        """
+        filemaps = stub_filemaps([
+            '19991231_000001.jpg',
+            '19991231_000001.jpg',
+            '19991231_000002.jpg',
+            '19991231_000001.jpg',
+            '19991231_000001.arw',
+        ])
+        harvey.resolve_dst_filename_collisions(filemaps)
+        assert [fm.dst_fn for fm in filemaps.get()] == [
+            '19991231_000001.jpg',
+            '19991231_000001-1.jpg',
+            '19991231_000001-2.jpg',
+            '19991231_000001.arw',
+            '19991231_000002.jpg',
+        ]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_resolve_collisions_existing_seq(self, harvey):
+        """
+        Test dst_fn already carrying a sequence number that is taken. Confirm
+        next free sequence number is used.
+        """
+        filemaps = stub_filemaps([
+            '19991231_000001.jpg',
+            '19991231_000001.jpg',
+            '19991231_000001-1.jpg',
+        ])
+        harvey.resolve_dst_filename_collisions(filemaps)
+        assert [fm.dst_fn for fm in filemaps.get()] == [
+            '19991231_000001.jpg',
+            '19991231_000001-1.jpg',
+            '19991231_000001-2.jpg',
+        ]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_resolve_collisions_burst(self, harvey):
+        """
+        Test a burst of 500 files in one second. Confirm every file gets a
+        unique name.
+        """
+        count = 500
+        filemaps = stub_filemaps(['19991231_000001.jpg'] * count)
+        harvey.resolve_dst_filename_collisions(filemaps)
+        dst_fns = [fm.dst_fn for fm in filemaps.get()]
+        assert len(set(dst_fns)) == count
+        assert dst_fns[-1] == '19991231_000001-{}.jpg'.format(count - 1)
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_resolve_collisions_undated(self, harvey):
+        """
+        Test collision on a name that is not YYYYmmdd_HHMMSS. Confirm it is
+        left alone.
+        """
+        filemaps = stub_filemaps(['abc.jpg', 'abc.jpg'])
+        harvey.resolve_dst_filename_collisions(filemaps)
+        assert [fm.dst_fn for fm in filemaps.get()] == ['abc.jpg', 'abc.jpg']
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_resolve_collisions_millis(self, harvey):
+        """
+        Test names carrying milliseconds. Confirm a clash gets a sequence
+        number after the milliseconds.
+        """
+        filemaps = stub_filemaps([
+            '19991231_000001_250.jpg',
+            '19991231_000001_250.jpg',
+            '19991231_000001_500.jpg',
+        ])
+        harvey.resolve_dst_filename_collisions(filemaps)
+        assert [fm.dst_fn for fm in filemaps.get()] == [
+            '19991231_000001_250.jpg',
+            '19991231_000001_250-1.jpg',
+            '19991231_000001_500.jpg',
+        ]
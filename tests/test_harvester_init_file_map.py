@@ -99,6 +99,89 @@ class TestRenameInitFilemapMetadata():
         filemaps = [fm for fm in harvey["filemaps"].get()]
         assert filemaps == []
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("workers", [None, 4])
+    @patch('photo_rename.harvester.logger')
+    @patch('photo_rename.harvester.Filemap')
+    def test_init_file_map_workers(self, m_filemap, m_logger, workers):
+        """
+        Test init_file_map() with and without a thread pool. All files map to
+        the same dst_fn and one file fails. Confirm collision suffixes follow
+        file order and the failure is logged.
+        """
+        def filemap(filename_fq, image_type, stat_result=None, naming=None):
+            if filename_fq.endswith('bad.jpg'):
+                raise Exception("Just testing.")
+            fm = StubFilemap()
+            fm.src_fn = os.path.basename(filename_fq)
+            fm.dst_fn = '19991231_000001.jpg'
+            return fm
+
+        m_filemap.side_effect = filemap
+        harvey = Harvester(".", workers=workers)
+        harvey.files = ['a.jpg', 'b.jpg', 'bad.jpg', 'c.jpg', 'd.jpg']
+        filemaps = [(fm.src_fn, fm.dst_fn) for fm in harvey["filemaps"].get()]
+        assert filemaps == [
+            ('a.jpg', '19991231_000001.jpg'),
+            ('b.jpg', '19991231_000001-1.jpg'),
+            ('c.jpg', '19991231_000001-2.jpg'),
+            ('d.jpg', '19991231_000001-3.jpg'),
+        ]
+        m_logger.warn.assert_called_once_with("Filemap Error: Just testing.")
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.Filemap')
+    def test_init_file_map_capture_order(self, m_filemap):
+        """
+        Test init_file_map() with a burst whose SubSecTimeOriginal order
+        differs from file order. Confirm collision suffixes follow capture
+        order and frames without it come first.
+        """
+        sub_seconds = {'a.jpg': '900', 'b.jpg': '100', 'c.jpg': None,
+            'd.jpg': '5'}
+
+        def filemap(filename_fq, image_type, stat_result=None, naming=None):
+            fm = StubFilemap()
+            fm.src_fn = os.path.basename(filename_fq)
+            fm.dst_fn = '19991231_000001.jpg'
+            fm.sub_second = lambda: sub_seconds[fm.src_fn]
+            return fm
+
+        m_filemap.side_effect = filemap
+        harvey = Harvester(".")
+        harvey.files = sorted(sub_seconds)
+        filemaps = [(fm.src_fn, fm.dst_fn) for fm in harvey["filemaps"].get()]
+        assert filemaps == [
+            ('c.jpg', '19991231_000001.jpg'),
+            ('b.jpg', '19991231_000001-1.jpg'),
+            ('d.jpg', '19991231_000001-2.jpg'),
+            ('a.jpg', '19991231_000001-3.jpg'),
+        ]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemap.Filemap.read_metadata')
+    def test_init_file_map_hash(self, m_read_metadata, tmpdir):
+        """
+        Test init_file_map() with NAMING_HASH. Two files share size and
+        first bytes. Confirm only those two are named by their full digest
+        and no sequence number is used.
+        """
+        m_read_metadata.return_value = {
+            'Exif.Image.DateTime': '1999:12:31 00:00:01'}
+        head = b'x' * photo_rename.filemap.CONTENT_DIGEST_PREFIX
+        tmpdir.join('a.jpg').write_binary(head + b'1')
+        tmpdir.join('b.jpg').write_binary(head + b'2')
+        tmpdir.join('c.jpg').write_binary(b'other')
+        harvey = Harvester(str(tmpdir), naming=photo_rename.NAMING_HASH)
+        filemaps = dict((fm.src_fn, fm) for fm in harvey["filemaps"].get())
+        dst_fns = set(fm.dst_fn for fm in filemaps.values())
+        assert len(dst_fns) == 3
+        for fm in filemaps.values():
+            assert re.match(r'^19991231_000001-[0-9a-f]{6}\.jpg$', fm.dst_fn)
+        assert filemaps['a.jpg'].dst_fn == filemaps['a.jpg'].build_dst_fn(
+                full_digest=True)
+        assert filemaps['c.jpg'].dst_fn == filemaps['c.jpg'].build_dst_fn()
+
 
 class Stub2Filemap(object):
 
@@ -149,48 +232,33 @@ class TestFilesFromDirectory(object):
     skiptests = not TEST_HARVESTER_FILES_FROM_DIRECTORY
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
-    @patch('photo_rename.harvester.FileList')
-    @patch('photo_rename.harvester.os.listdir')
-    @patch('photo_rename.harvester.os.path.splitext')
-    def test_files_from_directory_supported_ext(
-            self, m_splitext, m_listdir, m_filelist):
-        """
-        Test files_from_directory() with list of files, where only one
-        supported file extension is returned -- 'JPG'. Confirm only one
-        matching file in list is returned.
-        """
-        files = ['12.jpg', '34.png', '56.arw', '78.tif', '90.xyz']
-        expected_files = [files[1]]
-        m_splitext.return_value = ('ABC', '.JPG')
-        m_listdir.return_value = files
-        attrs = {'get.return_value': expected_files}
-        m_get = Mock()
-        m_get.configure_mock(**attrs)
-        m_filelist.return_value = m_get
+    @patch('photo_rename.harvester.os.path.isdir')
+    @patch('photo_rename.harvester.os.scandir')
+    def test_files_from_directory_supported_ext(self, m_scandir, m_isdir):
+        """
+        Test files_from_directory() with a mix of supported, unsupported and
+        directory entries. Confirm only supported files are returned, in
+        order, and that no entry is stat'ed again.
+        """
+        entries = [StubDirEntry(name) for name in
+                ['34.png', '12.JPG', '90.xyz', '56.arw', '78.tif']]
+        entries.append(StubDirEntry('dir.jpg', is_dir=True))
+        m_scandir.return_value.__enter__.return_value = entries
         harvey = Harvester('.')
         actual_files = harvey.files_from_directory(".")
-        assert actual_files == expected_files
+        assert actual_files == ['12.JPG', '34.png', '56.arw', '78.tif']
+        assert sorted(harvey.entries.keys()) == actual_files
+        m_isdir.assert_not_called()
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
-    @patch('photo_rename.harvester.FileList')
-    @patch('photo_rename.harvester.os.listdir')
-    @patch('photo_rename.harvester.os.path.splitext')
-    def test_files_from_directory_not_supported_ext(
-            self, m_splitext, m_listdir, m_filelist):
-        """
-        Test files_from_directory() with list of files, where the file
-        extension returned is not supported -- 'XYZ'. Confirm files list
-        returned is empty.
-        """
-        files = ['12.jpg', '34.png', '56.arw', '78.tif', '90.xyz']
-        expected_files = []
-        m_splitext.return_value = ('ABC', '.XYZ')
-        m_listdir.return_value = files
-        attrs = {'get.return_value': expected_files}
-        m_get = Mock()
-        m_get.configure_mock(**attrs)
-        m_filelist.return_value = m_get
+    @patch('photo_rename.harvester.os.scandir')
+    def test_files_from_directory_not_supported_ext(self, m_scandir):
+        """
+        Test files_from_directory() with list of files, where no file
+        extension is supported. Confirm files list returned is empty.
+        """
+        entries = [StubDirEntry(name) for name in ['12.xyz', '34.XYZ']]
+        m_scandir.return_value.__enter__.return_value = entries
         harvey = Harvester('.')
         actual_files = harvey.files_from_directory(".")
-        assert actual_files == expected_files
-
+        assert actual_files == []
@@ -6,6 +6,7 @@ app_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, app_path + '/../')
 
 from photo_rename import *
+from photo_rename import metadatacache
 from photo_rename.rename import *
 from .stubs import *
 from . import TEST_RENAME_PROCESS_FILEMAP
@@ -83,3 +84,25 @@ class TestRenameProcessFilemap(object):
         file_map_list.add(m_fm)
         harvey.process_file_map(file_map_list, simon_sez=True)
         m_fm.move.assert_called_with()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_process_file_map_changed_after_init(self, tmpdir):
+        """
+        Modify a file between init_file_map() and process_file_map() with
+        the metadata cache disabled. Confirm the stat was taken when the
+        Filemap was built, the file is stat'ed once more before the move and
+        it is not moved.
+        """
+        image = tmpdir.join('abc.jpg')
+        image.write_binary(make_jpeg(make_tiff(
+            {0x0132: '2014:08:16 06:20:30'})))
+        assert metadatacache.get_cache() is None
+        harvester = Harvester(str(tmpdir))
+        file_map = harvester.init_file_map()
+        filemap, = file_map.get()
+        assert isinstance(filemap.stat_result, os.stat_result)
+        image.write_binary(image.read_binary() + b'changed')
+        with patch('photo_rename.filemap.os.stat', wraps=os.stat) as m_stat:
+            harvester.process_file_map(file_map, True)
+        assert m_stat.call_count == 1
+        assert tmpdir.listdir() == [image]
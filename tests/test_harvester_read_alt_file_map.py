@@ -6,11 +6,10 @@ from mock import Mock, mock_open, patch
 app_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, app_path + '/../')
 
-from photo_rename import Harvester
+from photo_rename import Filemap, FilemapList, Harvester, IMAGE_TYPE_JPEG
 from .stubs import *
 from . import (
         TEST_HARVESTER_READ_ALT_FILE_MAP,
-        TEST_HARVESTER_GET_LINE_TERM,
         TEST_HARVESTER_SCAN_FOR_DUPE_FILES,
     )
 
@@ -68,14 +67,6 @@ def alt_file_map_term_crlf():
     return """abc 123\tMY NEW FILE 1\r\nxyz 999\tMY NEW FILE 2\r\n"""
 
 
-@pytest.fixture
-def alt_file_map_term_mixed():
-    """
-    Sample alternate file map with DOS line endings.
-    """
-    return """abc 123\tMY NEW FILE 1\nxyz 999\tMY NEW FILE 2\r\n"""
-
-
 @pytest.fixture
 def alt_file_map_dict():
     """
@@ -90,163 +81,197 @@ class TestFilemapReadAltFilemap(object):
     """
     skiptests = not TEST_HARVESTER_READ_ALT_FILE_MAP
 
-    # XXX: get_line_term() requires mock when we do not supply lineterm in
-    # test.
-
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.Harvester.__init__')
-    @patch('photo_rename.Harvester.get_line_term')
-    @patch('photo_rename.Harvester.scan_for_dupe_files')
-    def test_read_alt_file_map(self, m_scan_for_dupe_files, m_get_line_term,
-            m_harvey_init, alt_file_map_tab, alt_file_map_dict):
+    def test_read_alt_file_map(self, m_harvey_init, alt_file_map_tab, alt_file_map_dict):
         """
         Read alt file map and create dict with default delimiter `\t' and
         Unix line termination.
         """
         a = mock_open(read_data=alt_file_map_tab.strip())
-        m_get_line_term.return_value = '\n'
-        m_scan_for_dupe_files.return_value = False
         m_harvey_init.return_value = None
         harvey = Harvester()
         harvey.lineterm = '\n'
         harvey.delimiter = '\t'
         harvey.mapfile = "foo"
+        harvey.mapfile_mmap = False
         with patch('builtins.open', a) as m:
             afmd = harvey.read_alt_file_map()
             assert afmd == alt_file_map_dict
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.Harvester.__init__')
-    @patch('photo_rename.Harvester.scan_for_dupe_files')
-    def test_read_alt_file_map_crlf(self, m_scan_for_dupe_files,
-            m_harvey_init, alt_file_map_term_crlf, alt_file_map_dict):
+    def test_read_alt_file_map_crlf(self, m_harvey_init, alt_file_map_term_crlf, alt_file_map_dict):
         """
         Read alt file map and create dict with default delimiter `\t' and
         DOS line termination. Skip lineterm branch.
         """
         a = mock_open(read_data=alt_file_map_term_crlf.strip())
-        m_scan_for_dupe_files.return_value = False
         m_harvey_init.return_value = None
         harvey = Harvester()
         harvey.lineterm = '\r\n'
         harvey.delimiter = '\t'
         harvey.mapfile = "foo"
+        harvey.mapfile_mmap = False
         with patch('builtins.open', a) as m:
             afmd = harvey.read_alt_file_map()
             assert afmd == alt_file_map_dict
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.Harvester.__init__')
-    @patch('photo_rename.Harvester.scan_for_dupe_files')
-    def test_read_alt_file_map_duplicate_source(self, m_scan_for_dupe_files,
-            m_harvey_init, alt_file_map_duplicate_source, alt_file_map_dict):
+    def test_read_alt_file_map_duplicate_source(self, m_harvey_init, alt_file_map_duplicate_source, alt_file_map_dict):
         """
         Read alt file map with duplicate source filenames.
         """
         # TODO: don't hardwire assert
         a = mock_open(read_data=alt_file_map_duplicate_source.strip())
-        m_scan_for_dupe_files.return_value = False
         m_harvey_init.return_value = None
         harvey = Harvester()
         harvey.lineterm = '\n'
         harvey.delimiter = '\t'
         harvey.mapfile = "foo"
+        harvey.mapfile_mmap = False
         with patch('builtins.open', a) as m:
             afmd = harvey.read_alt_file_map()
             assert afmd == {'abc 123': 'MY NEW FILE 2'}
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.Harvester.__init__')
-    @patch('photo_rename.Harvester.scan_for_dupe_files')
-    def test_read_alt_file_map_duplicate_dest(self, m_scan_for_dupe_files,
-            m_harvey_init, alt_file_map_duplicate_dest, alt_file_map_dict):
+    def test_read_alt_file_map_duplicate_dest(self, m_harvey_init, alt_file_map_duplicate_dest, alt_file_map_dict):
         """
-        Read alt file map with mocked duplicate dest filenames.
+        Read alt file map with duplicate dest filenames. Confirm both
+        sources reported with their line numbers.
         """
         a = mock_open(read_data=alt_file_map_duplicate_dest.strip())
-        m_scan_for_dupe_files.return_value = True
         m_harvey_init.return_value = None
         harvey = Harvester()
         harvey.lineterm = '\n'
         harvey.delimiter = '\t'
         harvey.mapfile = "foo"
+        harvey.mapfile_mmap = False
         with patch('builtins.open', a) as m:
-            with pytest.raises(Exception):
-                afmd = harvey.read_alt_file_map()
+            with patch('photo_rename.harvester.logger') as m_logger:
+                with pytest.raises(Exception) as e:
+                    afmd = harvey.read_alt_file_map()
+        report = "MY NEW FILE 1: abc 123 (line 1), xyz 999 (line 2)"
+        assert str(e.value) == (
+            "Duplicate destination filename detected: {}".format(report))
+        m_logger.error.assert_called_once_with(
+            "Duplicate destination: {}".format(report))
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.Harvester.__init__')
-    @patch('photo_rename.Harvester.scan_for_dupe_files')
-    def test_read_alt_file_map_custom_delim(self, m_scan_for_dupe_files,
-            m_harvey_init, alt_file_map_xxx, alt_file_map_dict):
+    def test_read_alt_file_map_custom_delim(self, m_harvey_init, alt_file_map_xxx, alt_file_map_dict):
         """
         Read alt file map and create dict with custom delimiter `xxx'.
         """
         a = mock_open(read_data=alt_file_map_xxx.strip())
-        m_scan_for_dupe_files.return_value = False
         m_harvey_init.return_value = None
         harvey = Harvester()
         harvey.lineterm = '\n'
         harvey.delimiter = 'xxx'
         harvey.mapfile = "foo"
+        harvey.mapfile_mmap = False
         with patch('builtins.open', a) as m:
             afmd = harvey.read_alt_file_map()
             assert afmd == alt_file_map_dict
 
 
-class TestFilemapGetLineTerm(object):
+class TestFilemapScanForDupeFiles(object):
     """
-    Tests for function get_line_term().
+    Tests for function scan_for_dupe_files().
     """
-    skiptests = not TEST_HARVESTER_GET_LINE_TERM
+    skiptests = not TEST_HARVESTER_SCAN_FOR_DUPE_FILES
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
-    def test_get_line_term_lf(self, alt_file_map_tab, harvey):
+    def test_scan_for_dupe_files_unique(self, harvey):
         """
-        Read filemap with LF terminated lines.
+        Test with unique filenames. Confirm False result.
         """
-        a = mock_open(read_data=alt_file_map_tab)
-        with patch('builtins.open', a) as m:
-            with open('foo', 'r') as f:
-                lines = [line for line in f.readlines()
-                        if not line.startswith('#')]
-        lineterm = harvey.get_line_term(lines)
-        assert lineterm == '\n'
+        files = ['abc', 'def']
+        assert harvey.scan_for_dupe_files(files) == False
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
-    def test_get_line_term_mixed(self, alt_file_map_term_mixed, harvey):
+    def test_scan_for_dupe_files_duplicate(self, harvey):
         """
-        Raises Exception with mixed line terminations.
+        Test with duplicate filenames. Confirm True result.
         """
-        a = mock_open(read_data=alt_file_map_term_mixed)
-        with patch('builtins.open', a) as m:
-            with open('foo', 'r') as f:
-                lines = [line for line in f.readlines()
-                        if not line.startswith('#')]
-        with pytest.raises(Exception):
-            lineterm = harvey.get_line_term(lines)
+        files = ['abc', 'abc']
+        assert harvey.scan_for_dupe_files(files) == True
 
 
-class TestFilemapScanForDupeFiles(object):
+
+
+class TestFilemapReadAltFilemapStreaming(object):
     """
-    Tests for function scan_for_dupe_files().
+    Tests reading alternate file maps from disk in one pass.
     """
-    skiptests = not TEST_HARVESTER_SCAN_FOR_DUPE_FILES
+    skiptests = not TEST_HARVESTER_READ_ALT_FILE_MAP
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
-    def test_scan_for_dupe_files_unique(self, harvey):
+    @pytest.mark.parametrize("mapfile_mmap", [False, True])
+    @pytest.mark.parametrize("data", [
+        b"abc 123\tMY NEW FILE 1\nxyz 999\tMY NEW FILE 2\n",
+        b"abc 123\tMY NEW FILE 1\r\nxyz 999\tMY NEW FILE 2",
+        b"# comment\r\nabc 123,MY NEW FILE 1\r\n\r\nxyz 999,MY NEW FILE 2\r\n",
+    ])
+    def test_read_alt_file_map_detect(self, tmpdir, alt_file_map_dict,
+            mapfile_mmap, data):
         """
-        Test with unique filenames. Confirm False result.
+        Read map files with LF, CRLF, tab and comma. Detect termination and
+        delimiter. Confirm same dict with and without mmap.
         """
-        files = ['abc', 'def']
-        assert harvey.scan_for_dupe_files(files) == False
+        mapfile = tmpdir.join('map.txt')
+        mapfile.write_binary(data)
+        harvey = Harvester(str(tmpdir), mapfile=str(mapfile), delimiter=None,
+                mapfile_mmap=mapfile_mmap)
+        assert harvey.read_alt_file_map() == alt_file_map_dict
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
-    def test_scan_for_dupe_files_duplicate(self, harvey):
+    @pytest.mark.parametrize("mapfile_mmap", [False, True])
+    def test_read_alt_file_map_empty(self, tmpdir, mapfile_mmap):
         """
-        Test with duplicate filenames. Confirm True result.
+        Read an empty map file. Confirm empty dict.
         """
-        files = ['abc', 'abc']
-        assert harvey.scan_for_dupe_files(files) == True
+        mapfile = tmpdir.join('map.txt')
+        mapfile.write_binary(b"")
+        harvey = Harvester(str(tmpdir), mapfile=str(mapfile),
+                mapfile_mmap=mapfile_mmap)
+        assert harvey.read_alt_file_map() == {}
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("data, message", [
+        (b"a\tA\nb\tB\r\n",
+            "Inconsistent line termination on line 2."),
+        (b"a\tA\nb\tA\nc\tC\nd\tA\ne\tC\n",
+            "Duplicate destination filename detected:"
+            " A: a (line 1), b (line 2), d (line 4);"
+            " C: c (line 3), e (line 5)"),
+        (b"a\tA\nb\n\tC\nd\tD\te\n",
+            "Malformed map file rows on lines: 2, 3, 4"),
+    ])
+    def test_read_alt_file_map_errors(self, tmpdir, data, message):
+        """
+        Read map files with errors. Confirm the message names the lines.
+        """
+        mapfile = tmpdir.join('map.txt')
+        mapfile.write_binary(data)
+        harvey = Harvester(str(tmpdir), mapfile=str(mapfile))
+        with pytest.raises(Exception) as excinfo:
+            harvey.read_alt_file_map()
+        assert str(excinfo.value) == message
 
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_find_duplicate_destinations(self, harvey):
+        """
+        Test with filemaps sharing destinations. Confirm every colliding
+        source is reported.
+        """
+        filemaps = FilemapList()
+        for src_fn, dst_fn in [('a.jpg', 'x.jpg'), ('b.jpg', 'y.jpg'),
+                ('c.jpg', 'x.jpg'), ('d.jpg', 'x.jpg')]:
+            filemaps.add(Filemap(src_fn, IMAGE_TYPE_JPEG, metadata={},
+                dst_fn=dst_fn))
+        dupes = harvey.find_duplicate_destinations(filemaps)
+        assert list(dupes.duplicates.keys()) == ['x.jpg']
+        assert dupes.report() == ['x.jpg: a.jpg, c.jpg, d.jpg']
@@ -0,0 +1,200 @@
+import os
+import sys
+import pytest
+from mock import patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename.harvester import CollisionCounter
+from photo_rename.rename import *
+from .stubs import *
+from . import TEST_HARVESTER_STREAM_FILEMAPS
+
+
+def stub_filemap(filename_fq, image_type, stat_result=None, naming=None):
+    """
+    Filemap side effect. Every file has the same timestamp except x.jpg,
+    which keeps its name, and bad.jpg, which fails.
+    """
+    if filename_fq.endswith('bad.jpg'):
+        raise Exception("Just testing.")
+    fm = StubFilemap()
+    fm.src_fn = os.path.basename(filename_fq)
+    if fm.src_fn == 'x.jpg':
+        fm.dst_fn = 'x.jpg'
+    else:
+        fm.dst_fn = '19991231_000001.jpg'
+    return fm
+
+
+class TestHarvesterStreamFilemaps(object):
+    """
+    Tests for Harvester.stream_filemaps() and its helpers.
+    """
+    skiptests = not TEST_HARVESTER_STREAM_FILEMAPS
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("workers", [None, 4])
+    @patch('photo_rename.harvester.logger')
+    @patch('photo_rename.harvester.Filemap')
+    def test_stream_filemaps_same_as_init_file_map(
+            self, m_filemap, m_logger, workers):
+        """
+        Stream and harvest the same files. Confirm the same names in the
+        same order as init_file_map() gives.
+        """
+        m_filemap.side_effect = stub_filemap
+        files = ['a.jpg', 'b.jpg', 'bad.jpg', 'c.jpg', 'x.jpg', 'y.jpg']
+        harvey = Harvester(".", workers=workers)
+        harvey.files = files
+        streamed = [(fm.src_fn, fm.dst_fn)
+            for fm in harvey.stream_filemaps(buffer_size=2)]
+        harvey = Harvester(".", workers=workers)
+        harvey.files = files
+        harvested = [(fm.src_fn, fm.dst_fn) for fm in harvey["filemaps"].get()]
+        assert streamed == [
+            ('a.jpg', '19991231_000001.jpg'),
+            ('b.jpg', '19991231_000001-1.jpg'),
+            ('c.jpg', '19991231_000001-2.jpg'),
+            ('x.jpg', 'x.jpg'),
+            ('y.jpg', '19991231_000001-3.jpg'),
+        ]
+        assert sorted(streamed) == sorted(harvested)
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.logger')
+    @patch('photo_rename.harvester.Filemap')
+    def test_stream_filemaps_burst_order(self, m_filemap, m_logger):
+        """
+        Stream and harvest a burst whose filenames do not follow capture
+        order. Confirm the stream numbers in filename order and
+        init_file_map() in sub-second order.
+        """
+        sub_seconds = {'a.jpg': '50', 'b.jpg': '10'}
+
+        def filemap(filename_fq, image_type, stat_result=None, naming=None):
+            fm = stub_filemap(filename_fq, image_type)
+            fm.sub_second = lambda: sub_seconds[fm.src_fn]
+            return fm
+
+        m_filemap.side_effect = filemap
+        harvey = Harvester(".")
+        harvey.files = ['a.jpg', 'b.jpg']
+        streamed = [(fm.src_fn, fm.dst_fn)
+            for fm in harvey.stream_filemaps()]
+        harvey = Harvester(".")
+        harvey.files = ['a.jpg', 'b.jpg']
+        harvested = sorted((fm.src_fn, fm.dst_fn)
+            for fm in harvey["filemaps"].get())
+        assert streamed == [('a.jpg', '19991231_000001.jpg'),
+            ('b.jpg', '19991231_000001-1.jpg')]
+        assert harvested == [('a.jpg', '19991231_000001-1.jpg'),
+            ('b.jpg', '19991231_000001.jpg')]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.filemap.Filemap.read_metadata')
+    def test_stream_filemaps_hash(self, m_read_metadata, tmpdir):
+        """
+        Stream with NAMING_HASH. a.jpg and b.jpg share size and first bytes
+        and c.jpg is a copy of b.jpg. Confirm a.jpg keeps its short digest,
+        b.jpg is named by its full digest and c.jpg is left alone.
+        """
+        m_read_metadata.return_value = {
+            'Exif.Image.DateTime': '1999:12:31 00:00:01'}
+        head = b'x' * photo_rename.filemap.CONTENT_DIGEST_PREFIX
+        tmpdir.join('a.jpg').write_binary(head + b'1')
+        tmpdir.join('b.jpg').write_binary(head + b'2')
+        tmpdir.join('c.jpg').write_binary(head + b'2')
+        harvey = Harvester(str(tmpdir), naming=photo_rename.NAMING_HASH)
+        harvey.files = ['a.jpg', 'b.jpg', 'c.jpg']
+        with patch('photo_rename.harvester.logger') as m_logger:
+            filemaps = list(harvey.stream_filemaps())
+        a, b, c = filemaps
+        assert a.dst_fn == a.build_dst_fn()
+        assert b.dst_fn == b.build_dst_fn(full_digest=True)
+        assert b.dst_fn != a.dst_fn
+        assert c.dst_fn == 'c.jpg'
+        m_logger.warn.assert_called_once_with(
+            "c.jpg => {} Destination collision. Doing nothing.".format(
+            b.dst_fn))
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_imap_tasks_bounded(self):
+        """
+        Map over a generator with a small buffer. Confirm results in order
+        and tasks are only taken from the generator as results are used.
+        """
+        taken = []
+
+        def tasks():
+            for task in range(20):
+                taken.append(task)
+                yield task
+
+        harvey = Harvester(".", workers=4)
+        results = harvey.imap_tasks(lambda task: task * 2, tasks(), 3)
+        assert next(results) == 0
+        assert len(taken) == 3
+        assert list(results) == [task * 2 for task in range(1, 20)]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.logger')
+    def test_collision_counter(self, m_logger):
+        """
+        Resolve names one at a time. Confirm sequence numbers per base name
+        and extension and undated names left alone.
+        """
+        counter = CollisionCounter('/dir')
+        names = []
+        for dst_fn in ['20140816_062030.jpg', '20140816_062030.jpg',
+                '20140816_062030.tif', 'abc.jpg', 'abc.jpg',
+                '20140816_062030.jpg']:
+            fm = StubFilemap()
+            fm.dst_fn = dst_fn
+            counter.resolve(fm)
+            names.append(fm.dst_fn)
+        assert names == ['20140816_062030.jpg', '20140816_062030-1.jpg',
+            '20140816_062030.tif', 'abc.jpg', 'abc.jpg',
+            '20140816_062030-2.jpg']
+        assert len(counter.next_seq) == 1
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.logger')
+    def test_collision_counter_taken(self, m_logger):
+        """
+        Resolve a name that already carries a sequence number, then two of
+        its base name. Confirm the taken -1 name is skipped.
+        """
+        counter = CollisionCounter('/dir')
+        names = []
+        for dst_fn in ['20140816_062030-1.jpg', '20140816_062030.jpg',
+                '20140816_062030.jpg', '20140816_062030-1.jpg']:
+            fm = StubFilemap()
+            fm.dst_fn = dst_fn
+            counter.resolve(fm)
+            names.append(fm.dst_fn)
+        assert names == ['20140816_062030-1.jpg', '20140816_062030.jpg',
+            '20140816_062030-2.jpg', '20140816_062030-3.jpg']
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.Filemap')
+    def test_process_stream(self, m_filemap):
+        """
+        Stream filemaps into process_file_map(). Confirm each file is moved
+        before the next one is read.
+        """
+        events = []
+
+        def filemap(filename_fq, image_type, stat_result=None, naming=None):
+            events.append(('read', os.path.basename(filename_fq)))
+            return stub_filemap(filename_fq, image_type)
+
+        m_filemap.side_effect = filemap
+        harvey = Harvester(".")
+        harvey.files = ['a.jpg', 'b.jpg']
+        harvey.process_file_map(
+                FilemapStream(harvey.stream_filemaps(buffer_size=1)), True,
+                lambda src_fn, dst_fn: events.append(('move', src_fn)))
+        assert events == [('read', 'a.jpg'), ('move', 'a.jpg'),
+            ('read', 'b.jpg'), ('move', 'b.jpg')]
@@ -0,0 +1,94 @@
+import os
+import sys
+import pytest
+from mock import patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename.rename import *
+from .stubs import *
+from . import TEST_HARVESTER_WALK_DIRECTORIES
+
+
+@pytest.fixture
+def tree(tmpdir):
+    """
+    Directory tree with images at several levels, an empty directory, a
+    file that is not an image and a symlink back to the top.
+    """
+    tmpdir.join('a.jpg').write('a')
+    tmpdir.join('notes.txt').write('n')
+    tmpdir.mkdir('empty')
+    sub = tmpdir.mkdir('sub')
+    sub.join('b.jpg').write('b')
+    sub.join('c.JPG').write('c')
+    sub.mkdir('deeper').join('d.png').write('d')
+    os.symlink(str(tmpdir), str(sub.join('loop')))
+    return tmpdir
+
+
+class TestHarvesterWalkDirectories(object):
+    """
+    Tests for recursive discovery in Harvester.
+    """
+    skiptests = not TEST_HARVESTER_WALK_DIRECTORIES
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("workers", [None, 4])
+    @patch('photo_rename.harvester.logger')
+    def test_walk_directories(self, m_logger, tree, workers):
+        """
+        Walk the tree with and without threads. Confirm every directory is
+        found once, in order, and the symlink loop is skipped.
+        """
+        harvey = Harvester(str(tree), workers=workers, recursive=True)
+        found = [(os.path.relpath(directory, str(tree)),
+            sorted(entry.name for entry in entries))
+            for directory, entries in harvey.walk_directories()]
+        assert found == [
+            ('.', ['a.jpg']),
+            ('empty', []),
+            ('sub', ['b.jpg', 'c.JPG']),
+            (os.path.join('sub', 'deeper'), ['d.png']),
+        ]
+        m_logger.warn.assert_called_once_with(
+            "Skipping directory {}. Already visited.".format(
+                os.path.join(str(tree), 'sub', 'loop')))
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.harvester.os.path.isdir')
+    @patch('photo_rename.harvester.Filemap')
+    def test_directory_filemaps(self, m_filemap, m_isdir, tree):
+        """
+        Harvest the tree with every file mapping to the same dst_fn. Confirm
+        one FilemapList per directory with files and collisions resolved
+        within each directory only.
+        """
+        def filemap(filename_fq, image_type, stat_result=None, naming=None):
+            fm = StubFilemap()
+            fm.src_fn = os.path.basename(filename_fq)
+            fm.dst_fn = '19991231_000001.jpg'
+            return fm
+
+        m_filemap.side_effect = filemap
+        harvey = Harvester(str(tree), recursive=True)
+        result = [(os.path.relpath(directory, str(tree)),
+            [(fm.src_fn, fm.dst_fn) for fm in filemaps.get()])
+            for directory, filemaps in harvey["directory_filemaps"]]
+        assert result == [
+            ('.', [('a.jpg', '19991231_000001.jpg')]),
+            ('sub', [('b.jpg', '19991231_000001.jpg'),
+                ('c.JPG', '19991231_000001-1.jpg')]),
+            (os.path.join('sub', 'deeper'), [
+                ('d.png', '19991231_000001.jpg')]),
+        ]
+        m_isdir.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_directory_files_not_recursive(self, tree):
+        """
+        Get directory_files without recursive. Confirm only workdir.
+        """
+        harvey = Harvester(str(tree))
+        assert harvey["directory_files"] == [(str(tree), ['a.jpg'])]
@@ -0,0 +1,225 @@
+import os
+import sys
+import pytest
+from mock import patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+import photo_rename
+from photo_rename import Filemap, FilemapList, FilemapStream, Harvester
+from photo_rename import journal
+from photo_rename.journal import (
+        Journal, JournalError, RECORD_DONE, RECORD_INTENT, RECORD_UNDONE,
+        read_journal)
+from photo_rename.rename import resume_journal, undo_journal
+from .stubs import *
+from . import TEST_JOURNAL
+
+
+def make_filemaps(tmpdir, names):
+    """
+    Create a file for each src of names and return a FilemapList moving
+    each to its dst.
+    """
+    filemaps = FilemapList()
+    built = []
+    for src, dst in names:
+        tmpdir.join(src).write_binary(src.encode('ascii'))
+        built.append(Filemap(str(tmpdir.join(src)),
+            photo_rename.IMAGE_TYPE_JPEG, dst_fn=dst, read_metadata=False))
+    filemaps.extend(built)
+    return filemaps
+
+
+def record_intents(journal_fn, tmpdir, names):
+    """
+    Record an intent in journal_fn for each src and dst of names in order,
+    as a run killed before recording any move done leaves it.
+    """
+    with Journal(journal_fn) as rename_journal:
+        for src, dst in names:
+            rename_journal.record(RECORD_INTENT, Filemap(
+                str(tmpdir.join(src)), photo_rename.IMAGE_TYPE_JPEG,
+                dst_fn=dst, read_metadata=False))
+
+
+def records(journal_fn):
+    """
+    Return the src, dst and record of every entry of journal_fn by basename.
+    """
+    return [(os.path.basename(entry.src), os.path.basename(entry.dst),
+        entry.record) for entry in read_journal(journal_fn)]
+
+
+class TestJournal(object):
+    """
+    Tests for journal.py.
+    """
+    skiptests = not TEST_JOURNAL
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_journaled_run(self, tmpdir):
+        """
+        Rename with a journal. Confirm intent and done rows written for each
+        move and nothing for a file keeping its name.
+        """
+        journal_fn = str(tmpdir.join('rename.journal'))
+        filemaps = make_filemaps(tmpdir, [
+            ('a.jpg', 'x.jpg'), ('b.jpg', 'y.jpg'), ('same.jpg', 'same.jpg')])
+        with Journal(journal_fn) as rename_journal:
+            Harvester(str(tmpdir)).process_file_map(filemaps, True,
+                    journal=rename_journal)
+        assert tmpdir.join('x.jpg').read_binary() == b'a.jpg'
+        assert tmpdir.join('y.jpg').read_binary() == b'b.jpg'
+        with open(journal_fn) as f:
+            rows = [line.split('\t')[0] for line in f.read().splitlines()]
+        assert rows == ['record', RECORD_INTENT, RECORD_INTENT,
+            RECORD_DONE, RECORD_DONE]
+        assert records(journal_fn) == [
+            ('a.jpg', 'x.jpg', RECORD_DONE), ('b.jpg', 'y.jpg', RECORD_DONE)]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.journal.fsops.fsync_directory')
+    @patch('photo_rename.journal.os.fsync')
+    def test_group_commit(self, m_fsync, m_fsync_directory, tmpdir):
+        """
+        Rename five files in batches of two. Confirm one journal fsync per
+        batch plus the last one and one directory fsync per batch of moves.
+        """
+        filemaps = make_filemaps(tmpdir, [
+            ('{}.jpg'.format(i), 'new{}.jpg'.format(i)) for i in range(5)])
+        with Journal(str(tmpdir.join('j')), batch_size=2) as rename_journal:
+            Harvester(str(tmpdir)).process_file_map(filemaps, True,
+                    journal=rename_journal)
+        assert m_fsync.call_count == 4
+        assert m_fsync_directory.call_count == 3
+        m_fsync_directory.assert_called_with(str(tmpdir))
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_resume(self, tmpdir):
+        """
+        Resume a journal left with three intents by a killed run. Confirm the
+        move not made is made, the move made is recorded done and the move
+        where both names exist is left alone.
+        """
+        journal_fn = str(tmpdir.join('rename.journal'))
+        filemaps = make_filemaps(tmpdir, [
+            ('a.jpg', 'x.jpg'), ('b.jpg', 'y.jpg'), ('c.jpg', 'z.jpg')])
+        with Journal(journal_fn) as rename_journal:
+            for fm in filemaps.get():
+                rename_journal.record(RECORD_INTENT, fm)
+        tmpdir.join('b.jpg').rename(tmpdir.join('y.jpg'))
+        tmpdir.join('z.jpg').write_binary(b'other')
+
+        resume_journal(journal_fn, True)
+        assert tmpdir.join('x.jpg').read_binary() == b'a.jpg'
+        assert tmpdir.join('c.jpg').read_binary() == b'c.jpg'
+        assert tmpdir.join('z.jpg').read_binary() == b'other'
+        assert records(journal_fn) == [
+            ('c.jpg', 'z.jpg', RECORD_INTENT),
+            ('b.jpg', 'y.jpg', RECORD_DONE),
+            ('a.jpg', 'x.jpg', RECORD_DONE)]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_resume_chain(self, tmpdir):
+        """
+        Resume a chain b.jpg => c.jpg, a.jpg => b.jpg killed before its
+        first move. Confirm both moves made.
+        """
+        journal_fn = str(tmpdir.join('rename.journal'))
+        for name in ['a.jpg', 'b.jpg']:
+            tmpdir.join(name).write_binary(name.encode('ascii'))
+        record_intents(journal_fn, tmpdir,
+            [('b.jpg', 'c.jpg'), ('a.jpg', 'b.jpg')])
+
+        resume_journal(journal_fn, True)
+        assert tmpdir.join('c.jpg').read_binary() == b'b.jpg'
+        assert tmpdir.join('b.jpg').read_binary() == b'a.jpg'
+        assert not tmpdir.join('a.jpg').check()
+        assert [entry.record for entry in read_journal(journal_fn)] == [
+            RECORD_DONE, RECORD_DONE]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("made", [1, 2])
+    def test_resume_cycle(self, tmpdir, made):
+        """
+        Resume a swap of a.jpg and b.jpg through a temporary name killed
+        after its first made moves. Confirm the swap finished, the made
+        moves recorded done and no temporary file left.
+        """
+        journal_fn = str(tmpdir.join('rename.journal'))
+        for name in ['a.jpg', 'b.jpg']:
+            tmpdir.join(name).write_binary(name.encode('ascii'))
+        tmp = '.pz_rename-0-a.jpg'
+        names = [('a.jpg', tmp), ('b.jpg', 'a.jpg'), (tmp, 'b.jpg')]
+        record_intents(journal_fn, tmpdir, names)
+        for src, dst in names[:made]:
+            tmpdir.join(src).rename(tmpdir.join(dst))
+
+        resume_journal(journal_fn, True)
+        assert tmpdir.join('a.jpg').read_binary() == b'b.jpg'
+        assert tmpdir.join('b.jpg').read_binary() == b'a.jpg'
+        assert not tmpdir.join(tmp).check()
+        assert sorted(records(journal_fn)) == sorted(
+            (src, dst, RECORD_DONE) for src, dst in names)
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_undo(self, tmpdir):
+        """
+        Undo a chain of journaled moves. Confirm files moved back latest
+        first and a second undo changes nothing.
+        """
+        journal_fn = str(tmpdir.join('rename.journal'))
+        harvester = Harvester(str(tmpdir))
+        with Journal(journal_fn) as rename_journal:
+            harvester.process_file_map(make_filemaps(tmpdir,
+                [('a.jpg', 'b.jpg')]), True, journal=rename_journal)
+        with Journal(journal_fn) as rename_journal:
+            harvester.process_file_map(FilemapStream([Filemap(
+                str(tmpdir.join('b.jpg')), photo_rename.IMAGE_TYPE_JPEG,
+                dst_fn='c.jpg', read_metadata=False)]), True,
+                journal=rename_journal)
+
+        undo_journal(journal_fn, False)
+        assert tmpdir.join('c.jpg').check()
+        undo_journal(journal_fn, True)
+        assert tmpdir.join('a.jpg').read_binary() == b'a.jpg'
+        assert not tmpdir.join('b.jpg').check()
+        assert not tmpdir.join('c.jpg').check()
+        assert records(journal_fn) == [
+            ('b.jpg', 'c.jpg', RECORD_UNDONE),
+            ('a.jpg', 'b.jpg', RECORD_UNDONE)]
+        undo_journal(journal_fn, True)
+        assert tmpdir.join('a.jpg').check()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_torn_tail(self, tmpdir):
+        """
+        Read and append to a journal whose last row was cut off. Confirm the
+        partial row ignored, then removed before appending.
+        """
+        journal_fn = str(tmpdir.join('rename.journal'))
+        fm, = make_filemaps(tmpdir, [('a.jpg', 'x.jpg')]).get()
+        with Journal(journal_fn) as rename_journal:
+            rename_journal.record(RECORD_INTENT, fm)
+        with open(journal_fn, 'a') as f:
+            f.write('done\t/some/wh')
+        assert records(journal_fn) == [('a.jpg', 'x.jpg', RECORD_INTENT)]
+        with Journal(journal_fn) as rename_journal:
+            rename_journal.record(RECORD_DONE, fm)
+        assert records(journal_fn) == [('a.jpg', 'x.jpg', RECORD_DONE)]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_malformed(self, tmpdir):
+        """
+        Read a journal with a bad row and a file that is not a journal.
+        Confirm JournalError both times.
+        """
+        journal_fn = tmpdir.join('rename.journal')
+        journal_fn.write('record\tsrc\tdst\nmoved\ta\tb\n')
+        with pytest.raises(JournalError) as e:
+            read_journal(str(journal_fn))
+        assert str(e.value).endswith("lines: 2")
+        journal_fn.write('a\tb\n')
+        with pytest.raises(JournalError):
+            read_journal(str(journal_fn))
@@ -0,0 +1,149 @@
+import os
+import sys
+import pytest
+from mock import MagicMock, Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+from photo_rename import jpegsplice
+from photo_rename.jpegsplice import SpliceError
+from .stubs import *
+from . import TEST_JPEGSPLICE
+
+
+DATETIME = '2014:08:16 06:20:30'
+
+
+@pytest.fixture
+def jpeg(tmpdir):
+    """
+    JPEG-shaped file with an EXIF APP1 segment and 64 KiB of scan data.
+    """
+    jpeg = tmpdir.join('abc.jpg')
+    jpeg.write_binary(make_jpeg(make_tiff({0x0132: DATETIME}),
+        scan_size=64 * 1024))
+    jpeg.chmod(0o640)
+    return jpeg
+
+
+def scan_data(data):
+    """
+    Return data from the start of scan marker on.
+    """
+    return data[data.index(b'\xff\xda'):]
+
+
+class TestJpegsplice(object):
+    """
+    Tests for jpegsplice.py.
+    """
+    skiptests = not TEST_JPEGSPLICE
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_find_scan(self, jpeg):
+        """
+        Find the start of scan. Confirm offset of the SOS marker.
+        """
+        data = jpeg.read_binary()
+        with open(str(jpeg), 'rb') as f:
+            assert jpegsplice.find_scan(f) == data.index(b'\xff\xda')
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("data", [
+        b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff\xd9', b'\xff\xd8\x00\x00'])
+    def test_find_scan_error(self, tmpdir, data):
+        """
+        Find the start of scan of files without one. Confirm SpliceError.
+        """
+        image = tmpdir.join('abc.jpg')
+        image.write_binary(data)
+        with open(str(image), 'rb') as f:
+            with pytest.raises(SpliceError):
+                jpegsplice.find_scan(f)
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("disabled", [
+        [], ['copy_file_range'], ['copy_file_range', 'sendfile']])
+    def test_splice(self, jpeg, tmpdir, disabled):
+        """
+        Splice a new header in with kernel copies working or not. Confirm
+        header replaced, scan data unchanged, mode kept and no temporary
+        file left behind.
+        """
+        before = jpeg.read_binary()
+        patches = [patch('photo_rename.jpegsplice.os.{}'.format(name),
+            Mock(side_effect=OSError(95, 'Not supported')))
+            for name in disabled]
+        for p in patches:
+            p.start()
+        try:
+            jpegsplice.splice(str(jpeg), lambda header: b'\xff\xd8')
+        finally:
+            for p in patches:
+                p.stop()
+        after = jpeg.read_binary()
+        assert after == b'\xff\xd8' + scan_data(before)
+        assert jpeg.stat().mode & 0o777 == 0o640
+        assert tmpdir.listdir() == [jpeg]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_splice_fsync(self, jpeg):
+        """
+        Splice a new header in. Confirm the temporary file is fsynced before
+        it replaces the target.
+        """
+        calls = []
+        fsync = os.fsync
+        replace = os.replace
+
+        def m_fsync(fd):
+            calls.append('fsync')
+            fsync(fd)
+
+        def m_replace(src, dst):
+            calls.append('replace')
+            replace(src, dst)
+
+        with patch('photo_rename.jpegsplice.os.fsync', m_fsync):
+            with patch('photo_rename.jpegsplice.os.replace', m_replace):
+                jpegsplice.splice(str(jpeg), lambda header: b'\xff\xd8')
+        assert calls == ['fsync', 'replace']
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_splice_error(self, jpeg, tmpdir):
+        """
+        Fail while building the header. Confirm file unchanged.
+        """
+        before = jpeg.read_binary()
+        build = Mock(side_effect=SpliceError("Surprise!"))
+        with pytest.raises(SpliceError):
+            jpegsplice.splice(str(jpeg), build)
+        assert jpeg.read_binary() == before
+        assert tmpdir.listdir() == [jpeg]
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.jpegsplice.pyexiv2.ImageMetadata')
+    def test_build_header(self, m_img_md):
+        """
+        Build a header. Confirm pyexiv2 given the header and EOI only and
+        the EOI it writes stripped.
+        """
+        m_tgt_md = MagicMock(buffer=b'\xff\xd8\xff\xfe\x00\x03x\xff\xd9')
+        m_img_md.from_buffer.return_value = m_tgt_md
+        img_md = Mock()
+        assert jpegsplice.build_header(b'\xff\xd8', img_md) == (
+            b'\xff\xd8\xff\xfe\x00\x03x')
+        m_img_md.from_buffer.assert_called_once_with(b'\xff\xd8\xff\xd9')
+        img_md.copy.assert_called_once_with(
+            m_tgt_md, exif=True, iptc=True, xmp=True, comment=True)
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.jpegsplice.pyexiv2.ImageMetadata')
+    def test_build_header_unexpected(self, m_img_md):
+        """
+        Build a header from a buffer pyexiv2 did not end with EOI. Confirm
+        SpliceError.
+        """
+        m_img_md.from_buffer.return_value = MagicMock(buffer=b'\xff\xd8')
+        with pytest.raises(SpliceError):
+            jpegsplice.build_header(b'\xff\xd8', Mock())
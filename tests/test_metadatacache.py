@@ -0,0 +1,205 @@
+import errno
+import os
+import sys
+import pytest
+from mock import Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+from photo_rename import metadatacache
+from photo_rename.metadatacache import CachedReadError, MetadataCache
+from .stubs import *
+from . import TEST_METADATACACHE
+
+
+@pytest.fixture
+def image(tmpdir):
+    """
+    Any file will do. The cache only stats it.
+    """
+    image = tmpdir.join('abc.jpg')
+    image.write_binary(b'\xff\xd8')
+    return image
+
+
+@pytest.fixture
+def cache(tmpdir):
+    cache = MetadataCache(str(tmpdir.join('cache', 'metadata.sqlite')))
+    yield cache
+    cache.db.close()
+
+
+class TestMetadataCache(object):
+    """
+    Tests for metadatacache.py MetadataCache class.
+    """
+    skiptests = not TEST_METADATACACHE
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_fetch_miss_then_hit(self, cache, image):
+        """
+        Fetch twice. Confirm read() called once and counters updated.
+        """
+        read = Mock(return_value={'Exif.Image.DateTime': '2014:08:16'})
+        assert cache.fetch(str(image), 'kind', read) == read.return_value
+        assert cache.fetch(str(image), 'kind', read) == read.return_value
+        read.assert_called_once()
+        hits, misses, touched = cache.take_counters()
+        assert (hits, misses, len(touched)) == (1, 1, 1)
+        assert cache.take_counters() == (0, 0, {})
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_fetch_with_stat(self, cache, image, tmpdir):
+        """
+        Fetch with a stat_result and then a DirEntry. Confirm the file is
+        not stat'ed again and both share the entry.
+        """
+        read = Mock(return_value={})
+        st = os.stat(str(image))
+        entry, = [e for e in os.scandir(str(tmpdir)) if e.name == 'abc.jpg']
+        with patch('photo_rename.metadatacache.os.stat') as m_stat:
+            cache.fetch(str(image), 'kind', read, st)
+            m_stat.assert_not_called()
+        cache.fetch(str(image), 'kind', read, entry)
+        read.assert_called_once()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_fetch_kind_and_change(self, cache, image):
+        """
+        Fetch with a different kind and after the file changes. Confirm both
+        are misses.
+        """
+        read = Mock(return_value={})
+        cache.fetch(str(image), 'kind', read)
+        cache.fetch(str(image), 'other', read)
+        image.write_binary(b'\xff\xd8\xff')
+        cache.fetch(str(image), 'kind', read)
+        assert read.call_count == 3
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_fetch_negative(self, cache, image):
+        """
+        Fetch where read() fails. Confirm failure remembered and raised
+        without calling read() again.
+        """
+        read = Mock(side_effect=Exception("abc.jpg has no EXIF data."))
+        with pytest.raises(Exception):
+            cache.fetch(str(image), 'kind', read)
+        with pytest.raises(CachedReadError) as excinfo:
+            cache.fetch(str(image), 'kind', read)
+        assert str(excinfo.value) == "abc.jpg has no EXIF data."
+        read.assert_called_once()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("error", [
+        PermissionError(errno.EACCES, "Just testing."),
+        FileNotFoundError(errno.ENOENT, "Just testing."),
+        OSError(errno.EIO, "Input/output error"),
+        OSError(errno.ENOSPC, "No space left on device"),
+        MemoryError()])
+    def test_fetch_transient_error_not_cached(self, cache, image, error):
+        """
+        Fetch where read() fails for a reason other than the file content.
+        Confirm not remembered.
+        """
+        read = Mock(side_effect=error)
+        for _ in range(2):
+            with pytest.raises(type(error)):
+                cache.fetch(str(image), 'kind', read)
+        assert read.call_count == 2
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_fetch_parse_error_cached(self, cache, image):
+        """
+        Fetch where read() raises the IOError libexiv2 gives for a file it
+        cannot parse. Confirm remembered.
+        """
+        read = Mock(side_effect=IOError("Failed to read input data"))
+        with pytest.raises(IOError):
+            cache.fetch(str(image), 'kind', read)
+        with pytest.raises(CachedReadError) as excinfo:
+            cache.fetch(str(image), 'kind', read)
+        assert str(excinfo.value) == "Failed to read input data"
+        read.assert_called_once()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_fetch_hit_not_written(self, cache, image):
+        """
+        Fetch twice. Confirm the hit writes nothing until flushed.
+        """
+        read = Mock(return_value={})
+        query = "SELECT last_used FROM metadata"
+        with patch('photo_rename.metadatacache.time.time') as m_time:
+            m_time.side_effect = [1.0, 2.0]
+            cache.fetch(str(image), 'kind', read)
+            cache.fetch(str(image), 'kind', read)
+        assert cache.db.execute(query).fetchone() == (1.0,)
+        cache.flush_touched()
+        assert cache.db.execute(query).fetchone() == (2.0,)
+        assert cache.touched == {}
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_connection_after_fork(self, cache, image):
+        """
+        Use the cache as a forked child would. Confirm a new connection is
+        opened and the inherited one is kept open rather than finalized.
+        """
+        inherited = cache.db
+        cache.pid = -1
+        read = Mock(return_value={})
+        cache.fetch(str(image), 'kind', read)
+        assert cache.db is not inherited
+        assert cache.inherited == [inherited]
+        inherited.execute("SELECT 1")
+        inherited.close()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_invalidate(self, cache, image):
+        """
+        Fetch two kinds, invalidate the file and fetch again. Confirm both
+        kinds read again.
+        """
+        read = Mock(return_value={})
+        for _ in range(2):
+            cache.fetch(str(image), 'kind', read)
+            cache.fetch(str(image), 'other', read)
+            cache.invalidate(str(image))
+        assert read.call_count == 4
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_evict_lru(self, cache, tmpdir):
+        """
+        Store three entries with a cap of two. Touch the oldest. Confirm the
+        least recently used entry is evicted.
+        """
+        cache.max_entries = 2
+        files = []
+        for name in ['a', 'b', 'c']:
+            image = tmpdir.join(name)
+            image.write(name)
+            files.append(str(image))
+            cache.fetch(str(image), 'kind', Mock(return_value=name))
+        cache.fetch(files[0], 'kind', Mock())
+        cache.evict()
+        read = Mock(return_value='b')
+        cache.fetch(files[1], 'kind', read)
+        read.assert_called_once()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_module_cache(self, tmpdir, image):
+        """
+        Open, use and close the module level cache. Confirm counters logged.
+        """
+        read = Mock(return_value={})
+        assert metadatacache.cached(str(image), 'kind', read) == {}
+        metadatacache.open_cache(str(tmpdir.join('metadata.sqlite')))
+        try:
+            metadatacache.cached(str(image), 'kind', read)
+            metadatacache.cached(str(image), 'kind', read)
+        finally:
+            with patch('photo_rename.metadatacache.logger') as m_logger:
+                metadatacache.close_cache()
+        assert read.call_count == 2
+        assert metadatacache.get_cache() is None
+        m_logger.info.assert_called_once_with(
+            "Metadata cache: 1 hits, 1 misses.")
@@ -16,12 +16,27 @@ class StubArgs(object):
     """
 
     def __init__(self, directory='.', simon_sez=False, verbose=False,
-            mapfile=None):
+            mapfile=None, jobs=None, no_cache=True, cache_path=None,
+            recursive=False, stream=False, plan_out=None, apply=None,
+            journal=None, resume=False, undo=None, naming='sequence',
+            mmap=False):
 
         self.directory = directory
+        self.plan_out = plan_out
+        self.apply = apply
+        self.journal = journal
+        self.resume = resume
+        self.undo = undo
+        self.naming = naming
+        self.recursive = recursive
+        self.stream = stream
+        self.jobs = jobs
+        self.no_cache = no_cache
+        self.cache_path = cache_path
         self.simon_sez = simon_sez
         self.verbose = verbose
         self.mapfile = mapfile
+        self.mmap = mmap
 
 
 class StubArgumentParser(object):
@@ -57,7 +72,9 @@ class TestRenameMain(object):
         m_argparser.return_value = StubArgumentParser(myargs)
         retval = main()
         m_process_all_files.assert_called_with(workdir='.', simon_sez=False,
-                mapfile=None)
+                mapfile=None, jobs=None, recursive=False, stream=False,
+                plan_out=None, journal=None,
+                naming='sequence', mapfile_mmap=False)
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.rename.argparse.ArgumentParser')
@@ -80,7 +97,9 @@ class TestRenameMain(object):
         m_dirname.return_value = workdir
         retval = main()
         m_process_all_files.assert_called_with(workdir=workdir,
-                simon_sez=False, mapfile=mapfile)
+                simon_sez=False, mapfile=mapfile, jobs=None,
+                recursive=False, stream=False, plan_out=None,
+                journal=None, naming='sequence', mapfile_mmap=False)
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @pytest.mark.parametrize(
@@ -115,7 +134,9 @@ class TestRenameMain(object):
             m_exit.assert_called_once
         else:
             m_process_all_files.assert_called_with(workdir=workdir,
-                simon_sez=simon_sez, mapfile=mapfile)
+                simon_sez=simon_sez, mapfile=mapfile, jobs=None,
+                recursive=False, stream=False, plan_out=None,
+                journal=None, naming='sequence', mapfile_mmap=False)
 
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
@@ -151,3 +172,143 @@ class TestRenameMain(object):
         else:
             m_exit.assert_called_once
 
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.rename.argparse.ArgumentParser')
+    @patch('photo_rename.rename.os.path.exists')
+    @patch('photo_rename.rename.os.access')
+    @patch('photo_rename.rename.sys.exit')
+    @patch('photo_rename.rename.process_all_files')
+    def test_mapfile_recursive(self, m_process_all_files, m_exit,
+            m_access, m_exists, m_argparse):
+        """
+        Test main() function with --mapfile and --recursive. Confirm exit.
+        """
+        myargs = StubArgs(directory=None, mapfile="foo", recursive=True)
+        m_argparse.return_value = StubArgumentParser(myargs)
+        m_access.return_value = True
+        m_exists.return_value = True
+        m_exit.side_effect = SystemExit(1)
+        with pytest.raises(SystemExit):
+            main()
+        m_exit.assert_called_once_with(1)
+        m_process_all_files.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.rename.argparse.ArgumentParser')
+    @patch('photo_rename.rename.sys.exit')
+    @patch('photo_rename.rename.process_all_files')
+    def test_plan_out_simon_sez(self, m_process_all_files, m_exit,
+            m_argparse):
+        """
+        Test main() function with --plan-out and --simon-sez. Confirm exit.
+        """
+        myargs = StubArgs(simon_sez=True, plan_out="plan.tsv")
+        m_argparse.return_value = StubArgumentParser(myargs)
+        m_exit.side_effect = SystemExit(1)
+        with pytest.raises(SystemExit):
+            main()
+        m_exit.assert_called_once_with(1)
+        m_process_all_files.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("directory, allowed", [
+        (None, True), ("foo", False)])
+    @patch('photo_rename.rename.argparse.ArgumentParser')
+    @patch('photo_rename.rename.sys.exit')
+    @patch('photo_rename.rename.apply_plan')
+    @patch('photo_rename.rename.process_all_files')
+    def test_apply(self, m_process_all_files, m_apply_plan, m_exit,
+            m_argparse, directory, allowed):
+        """
+        Test main() function with --apply. Confirm plan applied without
+        harvesting and other options refused.
+        """
+        myargs = StubArgs(directory=directory, simon_sez=True,
+            apply="plan.tsv")
+        m_argparse.return_value = StubArgumentParser(myargs)
+        m_exit.side_effect = SystemExit(1)
+        if allowed:
+            main()
+            m_apply_plan.assert_called_once_with("plan.tsv", True,
+                    journal=None)
+        else:
+            with pytest.raises(SystemExit):
+                main()
+            m_apply_plan.assert_not_called()
+        m_process_all_files.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("directory, allowed", [
+        (None, True), ("foo", False)])
+    @patch('photo_rename.rename.argparse.ArgumentParser')
+    @patch('photo_rename.rename.sys.exit')
+    @patch('photo_rename.rename.undo_journal')
+    @patch('photo_rename.rename.process_all_files')
+    def test_undo(self, m_process_all_files, m_undo_journal, m_exit,
+            m_argparse, directory, allowed):
+        """
+        Test main() function with --undo. Confirm journal undone without
+        harvesting and other options refused.
+        """
+        myargs = StubArgs(directory=directory, simon_sez=True,
+            undo="rename.journal")
+        m_argparse.return_value = StubArgumentParser(myargs)
+        m_exit.side_effect = SystemExit(1)
+        if allowed:
+            main()
+            m_undo_journal.assert_called_once_with("rename.journal", True)
+        else:
+            with pytest.raises(SystemExit):
+                main()
+            m_undo_journal.assert_not_called()
+        m_process_all_files.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("journal", [None, "rename.journal"])
+    @patch('photo_rename.rename.argparse.ArgumentParser')
+    @patch('photo_rename.rename.sys.exit')
+    @patch('photo_rename.rename.resume_journal')
+    @patch('photo_rename.rename.process_all_files')
+    def test_resume(self, m_process_all_files, m_resume_journal, m_exit,
+            m_argparse, journal):
+        """
+        Test main() function with --resume. Confirm pending moves finished
+        before the run, and --resume refused without --journal.
+        """
+        myargs = StubArgs(simon_sez=True, journal=journal, resume=True)
+        m_argparse.return_value = StubArgumentParser(myargs)
+        m_exit.side_effect = SystemExit(1)
+        if journal:
+            main()
+            m_resume_journal.assert_called_once_with(journal, True)
+            m_process_all_files.assert_called_with(workdir='.',
+                    simon_sez=True, mapfile=None, jobs=None,
+                    recursive=False, stream=False, plan_out=None,
+                    journal=journal, naming='sequence', mapfile_mmap=False)
+        else:
+            with pytest.raises(SystemExit):
+                main()
+            m_resume_journal.assert_not_called()
+            m_process_all_files.assert_not_called()
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @pytest.mark.parametrize("mmap", [False, True])
+    def test_mapfile_comma(self, tmpdir, mmap):
+        """
+        Run main() on a comma separated mapfile with and without --mmap.
+        Confirm the delimiter detected and the files renamed.
+        """
+        for name in ['a.jpg', 'b.jpg']:
+            tmpdir.join(name).write_binary(name.encode('ascii'))
+        mapfile = tmpdir.join('photos.map')
+        mapfile.write('a,x\nb,y\n')
+        argv = ['pz_rename', '--simon-sez', '--no-cache', '--mapfile',
+            str(mapfile)]
+        if mmap:
+            argv.append('--mmap')
+        with patch.object(sys, 'argv', argv):
+            main()
+        assert sorted(os.listdir(str(tmpdir))) == [
+            'photos.map', 'x.jpg', 'y.jpg']
+        assert tmpdir.join('x.jpg').read_binary() == b'a.jpg'
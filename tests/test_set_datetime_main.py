@@ -50,6 +50,9 @@ class TestSetDatetimeMain(object):
             datetime=new_datetime,
             interval=interval,
             simon_sez=True,
+            jobs=None,
+            in_place=False,
+            sidecar=False,
             verbose=verbose,
         )
 
@@ -68,7 +71,9 @@ class TestSetDatetimeMain(object):
         # Confirm expected behavior.
         m_logging.basicConfig.called_once_with(level=log_level)
         m_process_all_files.assert_called_with(
-                workdir, new_datetime, int(interval), simon_sez=True)
+                workdir, new_datetime, int(interval),
+                simon_sez=True, jobs=None, in_place=False,
+                sidecar=False)
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @pytest.mark.parametrize("workdir", ["/abc/def", None])
@@ -94,6 +99,9 @@ class TestSetDatetimeMain(object):
             datetime=new_datetime,
             interval=interval,
             simon_sez=True,
+            jobs=None,
+            in_place=False,
+            sidecar=False,
         )
 
         attrs = {
@@ -114,7 +122,9 @@ class TestSetDatetimeMain(object):
 
         # Confirm expected behavior.
         m_process_all_files.assert_called_with(
-                expected_workdir, new_datetime, int(interval), simon_sez=True)
+                expected_workdir, new_datetime, int(interval),
+                simon_sez=True, jobs=None, in_place=False,
+                sidecar=False)
 
     @pytest.mark.skipif(skiptests, reason="Work in progress")
     @patch('photo_rename.set_datetime.CustomArgumentParser')
@@ -144,6 +154,9 @@ class TestSetDatetimeMain(object):
             datetime=new_datetime,
             interval=interval,
             simon_sez=True,
+            jobs=None,
+            in_place=False,
+            sidecar=False,
         )
 
         attrs = {
@@ -188,6 +201,9 @@ class TestSetDatetimeMain(object):
             datetime=new_datetime,
             interval=interval,
             simon_sez=True,
+            jobs=None,
+            in_place=False,
+            sidecar=False,
         )
 
         attrs = {
@@ -211,5 +227,7 @@ class TestSetDatetimeMain(object):
         if interval is None:
             m_logger.warn.assert_called_once()
         m_process_all_files.assert_called_with(
-                workdir, new_datetime, int(expected_interval), simon_sez=True)
+                workdir, new_datetime, int(expected_interval),
+                simon_sez=True, jobs=None, in_place=False,
+                sidecar=False)
 
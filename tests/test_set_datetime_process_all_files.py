@@ -93,3 +93,61 @@ class TestSetDatetimeProcessAllFiles(object):
         else:
             m_fmd_obj.set_datetime.assert_not_called()
 
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.set_datetime.Harvester')
+    @patch('photo_rename.set_datetime.run_tasks')
+    @patch('photo_rename.set_datetime.os.path.exists')
+    @patch('photo_rename.set_datetime.os.access')
+    def test_set_datetime_paf_jobs(self, m_access, m_exists, m_run_tasks,
+            m_harvey, initial_datetime):
+        """
+        Test process_all_files() with jobs. Confirm each task carries the
+        datetime for its position in the sorted file list and jobs is passed
+        through.
+        """
+        m_exists.return_value = True
+        m_access.return_value = True
+        m_run_tasks.return_value = []
+        m_test = MagicMock()
+        m_test.configure_mock(**{
+            '__getitem__.return_value': ['a.jpg', 'b.jpg', 'c.jpg']})
+        m_harvey.return_value = m_test
+
+        # Invoke unit.
+        process_all_files("/", initial_datetime, 30, True, jobs=4)
+
+        # Verify expected results.
+        tasks = m_run_tasks.call_args[0][1]
+        assert [(task[0], task[1].strftime('%H:%M:%S')) for task in tasks] == [
+            ('/a.jpg', '23:59:59'), ('/b.jpg', '00:00:29'),
+            ('/c.jpg', '00:00:59')]
+        assert m_run_tasks.call_args[1] == {'jobs': 4}
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.set_datetime.Harvester')
+    @patch('photo_rename.set_datetime.run_batches')
+    @patch('photo_rename.set_datetime.os.path.exists')
+    @patch('photo_rename.set_datetime.os.access')
+    def test_set_datetime_paf_sidecar_pair(self, m_access, m_exists,
+            m_run_batches, m_harvey, initial_datetime):
+        """
+        Test process_all_files() with sidecar and a RAW+JPEG pair. Confirm
+        their shared sidecar is written once and the next file gets the
+        next datetime.
+        """
+        m_exists.return_value = True
+        m_access.return_value = True
+        m_run_batches.return_value = []
+        m_test = MagicMock()
+        m_test.configure_mock(**{
+            '__getitem__.return_value': ['a.arw', 'a.jpg', 'b.jpg']})
+        m_harvey.return_value = m_test
+
+        # Invoke unit.
+        process_all_files("/", initial_datetime, 30, True, sidecar=True)
+
+        # Verify expected results.
+        tasks = m_run_batches.call_args[0][1]
+        assert [(task[0], task[1].strftime('%H:%M:%S')) for task in tasks] == [
+            ('/a.arw', '23:59:59'), ('/b.jpg', '00:00:29')]
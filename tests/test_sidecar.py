@@ -0,0 +1,158 @@
+from datetime import datetime
+import os
+import sys
+import pytest
+from mock import Mock, patch
+app_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, app_path + '/../')
+
+from photo_rename import sidecar
+from photo_rename.sidecar import SidecarError
+from .stubs import *
+from . import TEST_SIDECAR
+
+
+NEW_DATETIME = datetime(2020, 1, 2, 3, 4, 5)
+
+EXISTING = b'''<?xpacket begin="\xef\xbb\xbf" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about=""
+    xmlns:xmp="http://ns.adobe.com/xap/1.0/"
+    xmlns:darktable="http://darktable.sf.net/"
+    xmp:Rating="3"
+    darktable:xmp_version="2">
+   <xmp:CreateDate>2014-08-16T06:20:30</xmp:CreateDate>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>
+'''
+
+
+class TestSidecar(object):
+    """
+    Tests for sidecar.py.
+    """
+    skiptests = not TEST_SIDECAR
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_write_new(self, tmpdir):
+        """
+        Write datetimes for an image without a sidecar. Confirm <stem>.xmp
+        created with all three dates and the image untouched.
+        """
+        image = tmpdir.join('abc.ARW')
+        image.write_binary(b'raw')
+        sidecar.write(str(image), sidecar.datetime_properties(NEW_DATETIME))
+        assert sorted(tmpdir.listdir()) == [
+            image, tmpdir.join('abc.xmp')]
+        assert image.read_binary() == b'raw'
+        assert sidecar.read_datetimes(str(image)) == {
+            'Xmp.xmp.CreateDate': '2020:01:02 03:04:05',
+            'Exif.Image.DateTime': '2020:01:02 03:04:05',
+            'Exif.Photo.DateTimeOriginal': '2020:01:02 03:04:05',
+        }
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_write_update(self, tmpdir):
+        """
+        Write datetimes over an existing sidecar. Confirm the old date
+        element replaced and other properties and prefixes kept.
+        """
+        tmpdir.join('abc.xmp').write_binary(EXISTING)
+        image = str(tmpdir.join('abc.tif'))
+        sidecar.write(image, sidecar.datetime_properties(NEW_DATETIME))
+        data = tmpdir.join('abc.xmp').read_binary()
+        assert data.count(b'CreateDate') == 1
+        assert b'xmp:CreateDate="2020-01-02T03:04:05"' in data
+        assert b'xmp:Rating="3"' in data
+        assert b'darktable:xmp_version="2"' in data
+        assert data.startswith(b'<?xpacket begin="\xef\xbb\xbf"')
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_write_not_xmp(self, tmpdir):
+        """
+        Write over a sidecar that is not XMP. Confirm SidecarError and the
+        file kept.
+        """
+        tmpdir.join('abc.xmp').write_binary(b'not xml')
+        with pytest.raises(SidecarError):
+            sidecar.write(str(tmpdir.join('abc.tif')),
+                sidecar.datetime_properties(NEW_DATETIME))
+        assert tmpdir.join('abc.xmp').read_binary() == b'not xml'
+        assert len(tmpdir.listdir()) == 1
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_metadata_properties(self):
+        """
+        Convert metadata read from an image. Confirm EXIF tags mapped, Xmp
+        keys winning over them and structured keys skipped.
+        """
+        metadata = {
+            'Exif.Image.Make': 'Sony',
+            'Exif.Image.DateTime': '2014:08:16 06:20:30',
+            'Exif.Photo.ISOSpeedRatings': '100',
+            'Exif.Photo.MakerNote': '1 2 3',
+            'Xmp.tiff.Make': 'SONY',
+            'Xmp.dc.subject': ['a', 'b'],
+            'Xmp.dc.title': {'x-default': 'Title'},
+            'Xmp.xmpMM.History[1]/stEvt:action': 'saved',
+            'Xmp.unknown.Thing': 'x',
+        }
+        assert sidecar.metadata_properties(metadata) == {
+            'tiff:Make': 'SONY',
+            'xmp:ModifyDate': '2014-08-16T06:20:30',
+            'exif:ISOSpeedRatings': ['100'],
+            'dc:subject': ['a', 'b'],
+            'dc:title': {'x-default': 'Title'},
+        }
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_set_properties_arrays(self):
+        """
+        Set array properties. Confirm rdf:Seq, rdf:Bag and rdf:Alt used.
+        """
+        root = sidecar.empty_packet()
+        sidecar.set_properties(root, {
+            'dc:creator': ['me'], 'dc:subject': ['a', 'b'],
+            'dc:title': {'x-default': 'Title'}})
+        data = sidecar.serialize(root)
+        assert b'<dc:creator><rdf:Seq><rdf:li>me</rdf:li>' in data
+        assert b'<rdf:Bag><rdf:li>a</rdf:li><rdf:li>b</rdf:li>' in data
+        assert b'<rdf:li xml:lang="x-default">Title</rdf:li>' in data
+        assert sidecar.get_properties(
+            sidecar.parse_packet(data), ['dc:creator']) == {}
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    @patch('photo_rename.sidecar.logger')
+    def test_one_per_sidecar(self, m_logger):
+        """
+        Drop the tasks of a RAW+JPEG pair but the first. Confirm the other
+        task of the pair is logged and the rest kept in order.
+        """
+        tasks = [('/photos/abc.ARW', 1), ('/photos/abc.JPG', 2),
+            ('/photos/def.JPG', 3), ('/other/abc.JPG', 4)]
+        assert sidecar.one_per_sidecar(tasks, lambda task: task[0]) == [
+            ('/photos/abc.ARW', 1), ('/photos/def.JPG', 3),
+            ('/other/abc.JPG', 4)]
+        m_logger.info.assert_called_once_with(
+            "Skipping /photos/abc.JPG. Its sidecar /photos/abc.xmp is"
+            " written once.")
+
+    @pytest.mark.skipif(skiptests, reason="Work in progress")
+    def test_batch(self, tmpdir):
+        """
+        Write several sidecars inside batch(). Confirm the directory is
+        opened once.
+        """
+        images = [str(tmpdir.join('{}.jpg'.format(i))) for i in range(3)]
+        with patch('photo_rename.fsops.os.open', wraps=os.open) as m_open:
+            with sidecar.batch():
+                for image in images:
+                    sidecar.write(image,
+                        sidecar.datetime_properties(NEW_DATETIME))
+        directories = [c for c in m_open.call_args_list
+            if c[0][1] & os.O_DIRECTORY]
+        assert len(directories) == 1
+        assert len(tmpdir.listdir()) == 3